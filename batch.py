@@ -0,0 +1,171 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List
+from build import stream_mips_commands
+from engine import HazardEngine
+from helpers import RAW, WAR, WAW
+from timing import TimingModel
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(
+        description="MIPS Pipeline Hazard Detection - batch analysis of many programs over a process pool")
+    parser.add_argument(
+        "--programs",
+        required=True,
+        help="Directory of MIPS programs, or a manifest file listing one program path per line"
+    )
+    parser.add_argument(
+        "--pattern",
+        default=".s",
+        help="File suffix of the programs picked up from a directory, '.s' by default"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes, one per core by default"
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1, got {}".format(args.jobs))
+    return args
+
+
+# Define a data class around the analysis of a single program
+@dataclass
+class ProgramReport:
+    # path of the program
+    program: str
+    # number of instructions
+    instructions: int = 0
+    # hazards per kind, at distance 1 and 2
+    raw: int = 0
+    war: int = 0
+    waw: int = 0
+    # stall cycles and total cycles with forwarding unit off / on
+    stalls_off: int = 0
+    cycles_off: int = 0
+    stalls_on: int = 0
+    cycles_on: int = 0
+    # error message if the program could not be analysed
+    error: str = None
+
+    @property
+    def cpi_off(self) -> float:
+        return self.cycles_off / self.instructions if self.instructions else 0.0
+
+    @property
+    def cpi_on(self) -> float:
+        return self.cycles_on / self.instructions if self.instructions else 0.0
+
+
+def list_programs(programs: str, pattern: str = ".s") -> List[str]:
+    """
+    Programs of a directory (sorted) or of a manifest file (in order, '#' comments allowed)
+    :param programs: directory or manifest path
+    :param pattern: file suffix picked up from a directory
+    :return: list of paths
+    """
+    if os.path.isdir(programs):
+        return sorted(os.path.join(programs, name) for name in os.listdir(programs)
+                      if name.endswith(pattern) and os.path.isfile(os.path.join(programs, name)))
+    base = os.path.dirname(programs)
+    paths = []
+    with open(programs) as manifest:
+        for line in manifest:
+            line = line.split('#', 1)[0].strip()
+            if line != '':
+                paths.append(os.path.join(base, line))
+    return paths
+
+
+def analyse_program(path: str) -> ProgramReport:
+    """
+    Hazards, stalls and cycles of one program with forwarding unit off and on - parsed once,
+    both engines are stepped side by side
+    :param path: program path
+    :return: ProgramReport
+    """
+    report = ProgramReport(program=path)
+    engine_off = HazardEngine(fwd_option="off")
+    engine_on = HazardEngine(fwd_option="on")
+    timing_off = TimingModel()
+    timing_on = TimingModel()
+    kinds = {RAW: 0, WAR: 0, WAW: 0}
+    try:
+        with open(path) as source:
+            for item in stream_mips_commands(source):
+                result = engine_off.step(item)
+                for rule in (result.rule_1, result.rule_2):
+                    if rule is not None:
+                        kinds[rule.kind] += 1
+                timing_off.step(stalls=result.stalls, opcode=result.opcode)
+                timing_on.step(stalls=engine_on.step(item).stalls, opcode=result.opcode)
+    except Exception as error:
+        report.error = "{}: {}".format(type(error).__name__, error)
+        return report
+    report.instructions = timing_off.summary.instructions
+    report.raw, report.war, report.waw = kinds[RAW], kinds[WAR], kinds[WAW]
+    report.stalls_off, report.cycles_off = timing_off.summary.stalls, timing_off.summary.cycles
+    report.stalls_on, report.cycles_on = timing_on.summary.stalls, timing_on.summary.cycles
+    return report
+
+
+def run_batch(paths: List[str], jobs: int = None) -> List[ProgramReport]:
+    """
+    Analyse programs over a process pool - reports come back in the order of paths
+    :param paths: program paths
+    :param jobs: number of worker processes
+    :return: list of ProgramReport
+    """
+    if jobs == 1 or len(paths) <= 1:
+        return [analyse_program(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # hand out programs in chunks so the pool is not bottlenecked on inter-process traffic
+        chunksize = max(1, len(paths) // ((jobs or os.cpu_count() or 1) * 4))
+        return list(pool.map(analyse_program, paths, chunksize=chunksize))
+
+
+def print_report(reports: List[ProgramReport]):
+    """
+    Print one row per program and a total row
+    :param reports: list of ProgramReport
+    :return:
+    """
+    header = "{:<40} {:>12} {:>6} {:>6} {:>6} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}".format(
+        "Program", "Instructions", "RAW", "WAR", "WAW",
+        "Stalls OFF", "Cycles OFF", "CPI OFF", "Stalls ON", "Cycles ON", "CPI ON")
+    print("-" * len(header))
+    print(header)
+    print("-" * len(header))
+    total = ProgramReport(program="TOTAL")
+    for report in reports:
+        if report.error is not None:
+            print("{:<40} {}".format(report.program, report.error))
+            continue
+        for field in ["instructions", "raw", "war", "waw", "stalls_off", "cycles_off", "stalls_on", "cycles_on"]:
+            setattr(total, field, getattr(total, field) + getattr(report, field))
+        print_row(report)
+    print("-" * len(header))
+    print_row(total)
+    print("-" * len(header))
+
+
+def print_row(report: ProgramReport):
+    print("{:<40} {:>12} {:>6} {:>6} {:>6} {:>10} {:>10} {:>8.2f} {:>10} {:>10} {:>8.2f}".format(
+        report.program, report.instructions, report.raw, report.war, report.waw,
+        report.stalls_off, report.cycles_off, report.cpi_off, report.stalls_on, report.cycles_on, report.cpi_on))
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    print_report(run_batch(paths=list_programs(programs=args.programs, pattern=args.pattern), jobs=args.jobs))
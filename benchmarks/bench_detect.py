@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import synthetic_program  # noqa: E402
+from build import parse_mips_store  # noqa: E402
+from helpers import detect_hazards_no_fwd  # noqa: E402
+from engine import HazardEngine  # noqa: E402
+from vectorized import detect_all  # noqa: E402
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(description="Hazard detection throughput - per pair, engine and vectorized")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated program sizes")
+    parser.add_argument("--registers", type=int, default=8, help="Number of distinct registers used")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args(argv)
+
+
+def per_pair(store, instructions):
+    # existing path - detect_hazards_no_fwd called from Python for every pair at distance 1 and 2
+    for num, item in enumerate(instructions):
+        if num >= 1:
+            detect_hazards_no_fwd(current=item, previous=instructions[num - 1], prev_no=num - 1)
+        if num >= 2:
+            detect_hazards_no_fwd(current=item, previous=instructions[num - 2], prev_no=num - 2)
+
+
+def engine(store, instructions):
+    for _ in HazardEngine(fwd_option="off").run_store(store):
+        pass
+
+
+def vectorized(store, instructions):
+    detect_all(store)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    print("{:>10} {:>12} {:>16}".format("size", "path", "instructions/s"))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        store = parse_mips_store(synthetic_program(size=size, registers=args.registers, seed=args.seed))
+        instructions = list(store)
+        for name, func in [("per_pair", per_pair), ("engine", engine), ("vectorized", vectorized)]:
+            start = time.perf_counter()
+            func(store, instructions)
+            elapsed = time.perf_counter() - start
+            print("{:>10} {:>12} {:>16.0f}".format(size, name, size / elapsed))
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import synthetic_program  # noqa: E402
+from build import parse_mips_line  # noqa: E402
+from engine import HazardEngine  # noqa: E402
+from incremental import IncrementalAnalysis  # noqa: E402
+from timing import TimingModel  # noqa: E402
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(description="Edit latency - incremental re-analysis vs full re-analysis")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma separated program sizes")
+    parser.add_argument("--edits", type=int, default=200, help="Number of random edits timed per size")
+    parser.add_argument("--registers", type=int, default=8, help="Number of distinct registers used")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    return parser.parse_args(argv)
+
+
+def full(instructions):
+    # previous path - the whole program analysed again after every edit
+    model = TimingModel()
+    for result in HazardEngine(fwd_option="off").run(instructions):
+        model.step(stalls=result.stalls)
+    return model.summary
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    rand = random.Random(args.seed)
+    print("{:>10} {:>12} {:>16}".format("size", "path", "us per edit"))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        commands = synthetic_program(size=size, registers=args.registers, seed=args.seed).split('|')
+        instructions = [parse_mips_line(item) for item in commands]
+        edits = [(rand.randrange(size), parse_mips_line(rand.choice(commands))) for _ in range(args.edits)]
+        analysis = IncrementalAnalysis(instructions)
+        start = time.perf_counter()
+        for index, item in edits:
+            analysis.replace(index, item)
+            analysis.summary
+        elapsed = time.perf_counter() - start
+        print("{:>10} {:>12} {:>16.1f}".format(size, "incremental", elapsed / len(edits) * 1e6))
+        runs = max(1, min(len(edits), 10 ** 6 // size))
+        start = time.perf_counter()
+        for index, item in edits[:runs]:
+            instructions[index] = item
+            full(instructions)
+        elapsed = time.perf_counter() - start
+        print("{:>10} {:>12} {:>16.1f}".format(size, "full", elapsed / runs * 1e6))
@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import synthetic_program  # noqa: E402
+from build import parse_mips_commands  # noqa: E402
+from build import parse_mips_store  # noqa: E402
+from build import stream_mips_commands  # noqa: E402
+from helpers import Instruction  # noqa: E402
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(description="Parser throughput - per token string munging vs compiled parser")
+    parser.add_argument("--sizes", default="1000,100000", help="Comma separated program sizes")
+    parser.add_argument("--registers", type=int, default=8, help="Number of distinct registers used")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per parser, the fastest is reported")
+    return parser.parse_args(argv)
+
+
+def tokenizing(raw_commands: str) -> list:
+    # previous parser - split, replace, strip and upper per token and an uncompiled regex per memory access
+    all_instructions = []
+    for item in raw_commands.split('|'):
+        tokens = item.split()
+        opcode = tokens[0].strip().upper()
+        if opcode in ["ADD", "SUB"]:
+            rd = tokens[1].replace(',', '').strip().upper()
+            rs = tokens[2].replace(',', '').strip().upper()
+            rt = tokens[3].replace(',', '').strip().upper()
+            all_instructions.append(Instruction(opcode=opcode, rd=rd, rs=rs, rt=rt, raw=item))
+        else:
+            reg = tokens[1].replace(',', '').strip().upper()
+            match = re.search("(.*)\\((.*)\\)", tokens[2].replace(',', '').strip().upper())
+            if opcode == "LW":
+                all_instructions.append(
+                    Instruction(opcode=opcode, rs=match.group(2), rt=reg, offset=match.group(1), raw=item))
+            else:
+                all_instructions.append(
+                    Instruction(opcode=opcode, rs=reg, rt=match.group(2), offset=match.group(1), raw=item))
+    return all_instructions
+
+
+def streaming(raw_commands: str) -> list:
+    return list(stream_mips_commands(raw_commands.split('|')))
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    print("{:>10} {:>24} {:>16}".format("size", "parser", "instructions/s"))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        raw_commands = synthetic_program(size=size, registers=args.registers, seed=args.seed)
+        for name, func in [("tokenizing", tokenizing), ("parse_mips_commands", parse_mips_commands),
+                           ("stream_mips_commands", streaming), ("parse_mips_store", parse_mips_store)]:
+            elapsed = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                func(raw_commands)
+                run = time.perf_counter() - start
+                elapsed = run if elapsed is None else min(elapsed, run)
+            print("{:>10} {:>24} {:>16.0f}".format(size, name, size / elapsed))
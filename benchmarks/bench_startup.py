@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+# repository root - every case is run from there in a fresh interpreter
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(description="Import time and CLI startup - fresh interpreter per run, "
+                                                 "stdout piped (not a terminal)")
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per case, the median is reported")
+    return parser.parse_args(argv)
+
+
+def cases() -> list:
+    """
+    Commands timed - a bare interpreter as reference, library imports and a short CLI run
+    :return: list of (name, argv)
+    """
+    commands = "ADD R0, R1, R2|LW R3, 0(R1)|SUB R4, R3, R0|SW R4, 8(R0)"
+    return [
+        ("interpreter", [sys.executable, "-c", "pass"]),
+        ("import helpers", [sys.executable, "-c", "import helpers"]),
+        ("import engine", [sys.executable, "-c", "import engine"]),
+        ("import build", [sys.executable, "-c", "import build"]),
+        ("build.py both", [sys.executable, "build.py", "--commands", commands, "--operation", "both",
+                           "--forwarding_unit", "off"]),
+    ]
+
+
+def run_case(argv: list, repeat: int) -> float:
+    """
+    Median wall time of a command in milliseconds
+    :param argv: command
+    :param repeat: number of runs
+    :return: float
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    print("{:>16} {:>12} {:>16}".format("case", "median ms", "over interpreter"))
+    reference = None
+    for name, argv in cases():
+        elapsed = run_case(argv, repeat=args.repeat)
+        if reference is None:
+            reference = elapsed
+        print("{:>16} {:>12.1f} {:>16.1f}".format(name, elapsed, elapsed - reference))
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import synthetic_program  # noqa: E402
+from synthetic import write_program  # noqa: E402
+from build import instruction_pipeline  # noqa: E402
+from build import orchestrate_detection_no_fwd  # noqa: E402
+from build import parse_mips_commands  # noqa: E402
+from build import parse_mips_store  # noqa: E402
+from engine import HazardEngine  # noqa: E402
+from timing import TimingModel  # noqa: E402
+
+# repository root - the CLI case is run from there in a fresh interpreter
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Largest program the legacy timing case is run on - its rows are padded to their fetch cycle, so its cost grows
+# with the square of the program size
+legacy_limit = 10000
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(description="Benchmark suite - parsing, detection, timing and end-to-end CLI "
+                                                 "throughput and peak memory, written to a JSON results file")
+    parser.add_argument("--sizes", default="10,1000,100000", help="Comma separated program sizes, up to 10000000")
+    parser.add_argument("--cases", default="parse,detect,timing,legacy_timing,cli",
+                        help="Comma separated cases to run - legacy_timing is skipped above {} instructions".format(
+                            legacy_limit))
+    parser.add_argument("--registers", type=int, default=8, help="Number of distinct registers used")
+    parser.add_argument("--hazard_density", type=float, default=None,
+                        help="Share of instructions reading a result of the two instructions before them")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the fastest is reported")
+    parser.add_argument("--skip_memory", action="store_true",
+                        help="Do not measure peak memory - it takes one more, slower, run per case")
+    parser.add_argument("--output", default="bench_results.json", help="Path of the JSON results file")
+    parser.add_argument("--compare", default=None,
+                        help="Results file of an earlier run - throughput changes are printed, and the exit status "
+                             "is 1 if a case got slower than --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Slowdown allowed by --compare, 0.1 by default")
+    return parser.parse_args(argv)
+
+
+def parse_case(raw_commands: str):
+    parse_mips_commands(raw_commands)
+
+
+def detect_case(raw_commands: str):
+    # legacy detection loop - one call per instruction against the whole program
+    all_instructions = parse_mips_commands(raw_commands)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for num, item in enumerate(all_instructions):
+            orchestrate_detection_no_fwd(num=num, item=item, all_instructions=all_instructions)
+
+
+def timing_case(raw_commands: str):
+    # integer timing model - stall cycles from the engine, cycles per stage as integers, nothing rendered
+    model = TimingModel()
+    for result in HazardEngine(fwd_option="off").run_store(parse_mips_store(raw_commands)):
+        model.step(stalls=result.stalls, opcode=result.opcode)
+
+
+def legacy_timing_case(raw_commands: str):
+    # legacy timing loop - each row carries the stall cycles of the rows before
+    all_instructions = parse_mips_commands(raw_commands)
+    prev_pipe = None
+    adj = None
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for num, item in enumerate(all_instructions):
+            prev_pipe, adj = instruction_pipeline(fwd_option="off", num=num, item=item,
+                                                  all_instructions=all_instructions, prev_pipe=prev_pipe, adj=adj)
+
+
+def cli_command(path: str) -> list:
+    # paged diagram - rows are indented from their page, so the output grows linearly with the program
+    return [sys.executable, "build.py", "--input", path, "--operation", "both", "--forwarding_unit", "off",
+            "--page_cycles", "1000"]
+
+
+# in-process cases - timed on the pipe separated commands
+cases = {"parse": parse_case, "detect": detect_case, "timing": timing_case, "legacy_timing": legacy_timing_case}
+
+
+def time_case(func, raw_commands: str, repeat: int) -> float:
+    """
+    Fastest wall time of an in-process case in seconds
+    :param func: case
+    :param raw_commands: pipe separated commands
+    :param repeat: number of runs
+    :return: float
+    """
+    elapsed = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(raw_commands)
+        run = time.perf_counter() - start
+        elapsed = run if elapsed is None else min(elapsed, run)
+    return elapsed
+
+
+def peak_memory(func, raw_commands: str) -> int:
+    """
+    Peak bytes allocated by an in-process case - the program text itself is not counted
+    :param func: case
+    :param raw_commands: pipe separated commands
+    :return: int
+    """
+    tracemalloc.start()
+    try:
+        func(raw_commands)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_cli(path: str, repeat: int) -> tuple:
+    """
+    Fastest wall time of the CLI over a program file, and the peak resident memory of that process
+    :param path: program path
+    :param repeat: number of runs
+    :return: (seconds, bytes or None where the platform does not report it)
+    """
+    elapsed = None
+    peak = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = subprocess.Popen(cli_command(path), cwd=root, stdout=subprocess.DEVNULL)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # kilobytes on Linux, bytes on macOS
+            rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+            peak = rss if peak is None else max(peak, rss)
+        else:
+            process.wait()
+        run = time.perf_counter() - start
+        if process.returncode != 0:
+            raise RuntimeError("{} exited with status {}".format(' '.join(cli_command(path)), process.returncode))
+        elapsed = run if elapsed is None else min(elapsed, run)
+    return elapsed, peak
+
+
+def version() -> dict:
+    """
+    What was measured - commit of the repository, interpreter and machine
+    :return: dict
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "system": platform.system()}
+
+
+def compare(results: list, path: str, tolerance: float) -> bool:
+    """
+    Print the throughput change of every case also found in an earlier results file
+    :param results: results of this run
+    :param path: earlier results file
+    :param tolerance: slowdown allowed e.g. 0.1 for 10%
+    :return: True if no case got slower than tolerance
+    """
+    with open(path) as earlier:
+        baseline = {(result["case"], result["size"]): result for result in json.load(earlier)["results"]}
+    print("{:>13} {:>10} {:>16} {:>16} {:>10}".format("case", "size", "before", "after", "change"))
+    passed = True
+    for result in results:
+        before = baseline.get((result["case"], result["size"]))
+        if before is None:
+            continue
+        change = result["instructions_per_second"] / before["instructions_per_second"] - 1
+        slower = change < -tolerance
+        passed = passed and not slower
+        print("{:>13} {:>10} {:>16.0f} {:>16.0f} {:>9.1f}%{}".format(
+            result["case"], result["size"], before["instructions_per_second"], result["instructions_per_second"],
+            change * 100, " SLOWER" if slower else ""))
+    return passed
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    if not 1 <= args.registers <= 32:
+        sys.exit("--registers must be between 1 and 32 - registers are R0 to R31")
+    selected = args.cases.split(',')
+    unknown = [name for name in selected if name not in cases and name != "cli"]
+    if unknown:
+        sys.exit("Unknown cases {} - cases are {}".format(', '.join(unknown), ', '.join(list(cases) + ["cli"])))
+    results = []
+    print("{:>13} {:>10} {:>12} {:>16} {:>14}".format("case", "size", "seconds", "instructions/s", "peak MiB"))
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            settings = dict(size=size, registers=args.registers, seed=args.seed, hazard_density=args.hazard_density)
+            raw_commands = synthetic_program(**settings) if any(name in cases for name in selected) else None
+            path = os.path.join(workdir, "program_{}.s".format(size))
+            write_program(path, **settings)
+            for name in selected:
+                if name == "legacy_timing" and size > legacy_limit:
+                    print("{:>13} {:>10} skipped - above {} instructions".format(name, size, legacy_limit))
+                    continue
+                if name == "cli":
+                    elapsed, peak = run_cli(path, repeat=args.repeat)
+                else:
+                    elapsed = time_case(cases[name], raw_commands, repeat=args.repeat)
+                    peak = None if args.skip_memory else peak_memory(cases[name], raw_commands)
+                results.append({"case": name, "size": size, "seconds": elapsed,
+                                "instructions_per_second": size / elapsed, "peak_bytes": peak})
+                print("{:>13} {:>10} {:>12.4f} {:>16.0f} {:>14}".format(
+                    name, size, elapsed, size / elapsed, "-" if peak is None else "{:.1f}".format(peak / 2 ** 20)))
+                sys.stdout.flush()
+            os.remove(path)
+    with open(args.output, 'w') as output:
+        json.dump({"created": datetime.now(timezone.utc).isoformat(), "version": version(),
+                   "settings": {"registers": args.registers, "hazard_density": args.hazard_density,
+                                "seed": args.seed, "repeat": args.repeat},
+                   "results": results}, output, indent=2)
+    print("Results written to {}".format(args.output))
+    if args.compare is not None and not compare(results, args.compare, tolerance=args.tolerance):
+        sys.exit(1)
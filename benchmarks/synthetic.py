@@ -0,0 +1,101 @@
+import sys
+import random
+import argparse
+from typing import Iterator
+
+# Positions within the drawn registers read per opcode - 'ADD rd, rs, rt', 'LW rt, offset(rs)', 'SW rs, offset(rt)'
+source_operands = {"ADD": [1, 2], "SUB": [1, 2], "LW": [1], "SW": [0, 1]}
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(description="Seeded synthetic ADD/SUB/LW/SW program generator")
+    parser.add_argument("--size", type=int, required=True, help="Number of instructions")
+    parser.add_argument("--registers", type=int, default=8, help="Number of distinct registers used")
+    parser.add_argument("--hazard_density", type=float, default=None,
+                        help="Share of instructions reading the destination of one of the two instructions before "
+                             "them, between 0 and 1 - registers are drawn at random if not given")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", default="-", help="Path of the program written, one instruction per line; "
+                                                      "'-' writes to stdout")
+    return parser.parse_args(argv)
+
+
+def synthetic_commands(size: int, registers: int = 8, seed: int = 0, hazard_density: float = None) -> Iterator[str]:
+    """
+    Random ADD/SUB/LW/SW commands, one at a time - fewer registers means more register pressure and more
+    hazards, hazard_density sets the share of instructions reading a result of the two instructions before
+    :param size: number of instructions
+    :param registers: number of distinct registers
+    :param seed: random seed - the same seed always gives the same program
+    :param hazard_density: share of instructions with a RAW dependency at distance 1 or 2, None for random
+    registers only
+    :return: generator of commands
+    """
+    rand = random.Random(seed)
+    # destinations of the two instructions before, None for a store
+    recent = [None, None]
+    for _ in range(size):
+        opcode = rand.choice(["ADD", "SUB", "LW", "SW"])
+        regs = ["R{}".format(rand.randrange(registers)) for _ in range(3)]
+        if hazard_density is not None:
+            written = [reg for reg in recent if reg is not None]
+            sources = source_operands[opcode]
+            if written and rand.random() < hazard_density:
+                regs[rand.choice(sources)] = rand.choice(written)
+            else:
+                # no dependency on the two instructions before - sources avoid the registers they write
+                free = ["R{}".format(reg) for reg in range(registers) if "R{}".format(reg) not in written]
+                for source in sources:
+                    if regs[source] in written and free:
+                        regs[source] = rand.choice(free)
+            recent = [recent[1], regs[0] if opcode != "SW" else None]
+        if opcode in ["ADD", "SUB"]:
+            yield "{} {}, {}, {}".format(opcode, *regs)
+        else:
+            yield "{} {}, {}({})".format(opcode, regs[0], 4 * rand.randrange(16), regs[1])
+
+
+def synthetic_program(size: int, registers: int = 8, seed: int = 0, hazard_density: float = None) -> str:
+    """
+    Random ADD/SUB/LW/SW program - see synthetic_commands
+    :param size: number of instructions
+    :param registers: number of distinct registers
+    :param seed: random seed
+    :param hazard_density: share of instructions with a RAW dependency at distance 1 or 2
+    :return: pipe separated commands
+    """
+    return '|'.join(synthetic_commands(size=size, registers=registers, seed=seed, hazard_density=hazard_density))
+
+
+def write_program(path: str, size: int, registers: int = 8, seed: int = 0, hazard_density: float = None):
+    """
+    Write a random program one instruction per line - nothing is held in memory
+    :param path: program path, '-' for stdout
+    :param size: number of instructions
+    :param registers: number of distinct registers
+    :param seed: random seed
+    :param hazard_density: share of instructions with a RAW dependency at distance 1 or 2
+    :return:
+    """
+    out = sys.stdout if path == '-' else open(path, 'w')
+    try:
+        for item in synthetic_commands(size=size, registers=registers, seed=seed, hazard_density=hazard_density):
+            out.write(item + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    if args.hazard_density is not None and not 0 <= args.hazard_density <= 1:
+        sys.exit("--hazard_density must be between 0 and 1")
+    if not 1 <= args.registers <= 32:
+        sys.exit("--registers must be between 1 and 32 - registers are R0 to R31")
+    write_program(args.output, size=args.size, registers=args.registers, seed=args.seed,
+                  hazard_density=args.hazard_density)
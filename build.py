@@ -1,13 +1,55 @@
 import sys
+import atexit
 import argparse
 import re
-from typing import List
+import shutil
+import tempfile
+from typing import Iterable, Iterator, List
 from helpers import Instruction
-from helpers import offset_capture
-from helpers import timing_step
-from helpers import gen_pipeline_stages
+from helpers import opcode_ids
+from helpers import register_ids
+from helpers import valid_registers
+from helpers import NO_REG
 from helpers import detect_hazards_no_fwd
-from helpers import pipeline_modifier
+from helpers import count_stalls
+from helpers import classify_hazard
+from helpers import encode_instruction
+from helpers import section_length
+from engine import ForwardingComparison
+from engine import HazardEngine
+from engine import InstructionResult
+from memo import ShapeCache
+from pipeline import Pipeline
+from pipeline import PipelineError
+from pipeline import load_pipeline
+from store import InstructionStore
+from store import offset_value
+from timing import DiagramWindow
+from timing import RowWriter
+from timing import TimingModel
+from timing import instruction_timing
+from timing import render_steps
+from timing import render_summary
+from timing import render_speedup
+from timing import render_timing_row
+from timing import stages
+
+
+def cycle_range(value: str) -> tuple:
+    """
+    This function is used to parse a 'FIRST:LAST' cycle range - either end may be left out
+    :param value: e.g. '100:200', '100:' or ':200'
+    :return: (first, last) - last None for up to the end of the program
+    """
+    first, separator, last = value.partition(':')
+    try:
+        first = int(first) if first.strip() else 1
+        last = int(last) if last.strip() else None
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected FIRST:LAST, got {!r}".format(value))
+    if not separator or first < 1 or (last is not None and last < first):
+        raise argparse.ArgumentTypeError("expected FIRST:LAST with 1 <= FIRST <= LAST, got {!r}".format(value))
+    return first, last
 
 
 def parse_args(argv=None):
@@ -17,11 +59,15 @@ def parse_args(argv=None):
     :return: argparse object
     """
     parser = argparse.ArgumentParser(description="MIPS Pipeline Hazard Detection and Timing Sequence Generator")
-    parser.add_argument(
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
         "--commands",
-        required=True,
         help="Pipe separated list of MIPS commands"
     )
+    source.add_argument(
+        "--input",
+        help="Path to a MIPS source (.s) or trace file with one instruction per line; '-' reads from stdin"
+    )
     parser.add_argument(
         "--operation",
         required=True,
@@ -32,84 +78,425 @@ def parse_args(argv=None):
     parser.add_argument(
         "--forwarding_unit",
         required=True,
-        choices=["on", "off"],
-        help="Forwarding unit flag. Usage will alter the timing diagram based on presence/absence of forwarding unit."
+        choices=["on", "off", "both"],
+        help="Forwarding unit flag. Usage will alter the timing diagram based on presence/absence of forwarding unit. \
+        'both' compares the stall cycles of every instruction with and without it, from a single pass."
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to analyse an --input file in chunks. Output is the same as with 1."
+    )
+    parser.add_argument(
+        "--pipeline",
+        default=None,
+        help="Path to a pipeline description (JSON) - stages, where operands are read and written, functional unit \
+        latencies and forwarding paths. Stalls are derived from it instead of the built-in 5-stage table."
+    )
+    parser.add_argument(
+        "--branch_penalty",
+        type=int,
+        default=None,
+        help="Cycles the instruction after a BEQ/BNE waits for the branch to resolve - every branch is charged. \
+        2 by default, or the branch_penalty of the --pipeline description."
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=None,
+        help="Number of previous instructions dependencies are tracked over. Dependencies further back than 2 \
+        are listed with the hazards; with --pipeline it defaults to the furthest distance a stall can come from."
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--schedule",
+        action="store_true",
+        help="Reorder the instructions of each basic block to cut stall cycles, print the rescheduled program \
+        with the cycles before and after, then run --operation on it"
+    )
+    parser.add_argument(
+        "--loops",
+        action="store_true",
+        help="Summarize repeated instruction sequences of the trace as loops - each loop body is analysed until \
+        its iterations reach a steady state, and the cycles of the remaining iterations are extrapolated"
+    )
+    parser.add_argument(
+        "--diagram",
+        default="full",
+        choices=["full", "compact"],
+        help="Timing diagram style - 'full' draws a '|---F---|' section per cycle; 'compact' one character per cycle"
+    )
+    parser.add_argument(
+        "--page_cycles",
+        type=int,
+        default=None,
+        help="Split the timing diagram into pages of this many cycles. Rows are indented from the start of their \
+        page, so the output grows linearly with the program."
+    )
+    parser.add_argument(
+        "--cycles",
+        type=cycle_range,
+        default=None,
+        help="Range of cycles shown in the timing diagram, 'FIRST:LAST' e.g. '100:200' or '100:'"
+    )
+    parser.add_argument(
+        "--shape_cache",
+        type=int,
+        default=None,
+        help="Look up hazards and stalls in a cache of this many instruction shapes (least recently used ones are \
+        dropped) instead of classifying every instruction - faster on loops, slower on traces without repetition"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="table",
+        default=None,
+        choices=["table", "json", "chrome"],
+        help="Report the time spent parsing, detecting hazards, inserting stalls and rendering, the hazard counts \
+        and the stall cycles per rule - as a table (default), JSON or Chrome trace events"
+    )
+    parser.add_argument(
+        "--profile_output",
+        default=None,
+        help="Path the --profile report is written to, stderr by default"
+    )
+    parser.add_argument(
+        "--format",
+        default="text",
+        choices=["text", "json", "ndjson", "csv"],
+        help="Output format - 'text' prints the hazards and the timing diagram; 'json', 'ndjson' and 'csv' stream \
+        one record per instruction with its hazards, stalls and stage cycles"
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1, got {}".format(args.jobs))
+    if args.page_cycles is not None and args.page_cycles < 1:
+        parser.error("--page_cycles must be at least 1, got {}".format(args.page_cycles))
+    if args.window is not None and args.window < 2:
+        parser.error("--window must be at least 2, got {}".format(args.window))
+    if args.loops and (args.schedule or args.format != "text"):
+        parser.error("--loops cannot be combined with --schedule or a structured --format")
+    if args.forwarding_unit == "both" and (args.schedule or args.loops or args.format != "text"):
+        parser.error("--forwarding_unit both cannot be combined with --schedule, --loops or a structured --format")
+    if args.branch_penalty is not None and args.branch_penalty < 0:
+        parser.error("--branch_penalty must be at least 0, got {}".format(args.branch_penalty))
+    if args.shape_cache is not None and args.shape_cache < 1:
+        parser.error("--shape_cache must be at least 1, got {}".format(args.shape_cache))
+    # checked here so a missing or unreadable file is reported like the other argument errors
+    for option, path in [("--input", args.input), ("--pipeline", args.pipeline)]:
+        if path not in [None, '-']:
+            try:
+                open(path, 'rb').close()
+            except OSError as error:
+                parser.error("{} {} cannot be read - {}".format(option, path, error.strerror))
+    return args
+
+
+# Opcodes taking three registers 'ADD R0, R1, R2' / a register and a memory location 'LW R3, 8(R1)' /
+# two registers and an immediate 'ADDI R1, R2, 4' / two registers and a branch target 'BEQ R1, R2, LOOP'
+register_opcodes = {"ADD", "SUB", "AND", "OR", "SLT", "MUL", "DIV"}
+memory_opcodes = {"LW", "SW"}
+immediate_opcodes = {"ADDI"}
+branch_names = {"BEQ", "BNE"}
+# Precompiled pattern of an immediate - decimal or hexadecimal
+immediate_pattern = re.compile(r"[-+]?(0X[0-9A-F]+|[0-9]+)$")
+# Precompiled pattern of a memory location 'offset(base)'
+memory_pattern = re.compile(r"([^()]*)\(([^()]+)\)$")
+# Precompiled pattern of a token - used to find the column of a bad token
+token_pattern = re.compile(r"[^\s,]+")
+# Precompiled pattern of a whole upper case command - operands are separated by commas and/or whitespace and
+# registers must be valid. The opcode is the fourth group from the last one matched, see scan_mips_command.
+command_pattern = re.compile(
+    r"[\s,]*(?:({register_ops}){sep}{reg}{sep}{reg}{sep}{reg}"
+    r"|({immediate_ops}){sep}{reg}{sep}{reg}{sep}({imm})"
+    r"|({branch_ops}){sep}{reg}{sep}{reg}{sep}([^\s,]+)"
+    r"|({memory_ops}){sep}{reg}{sep}((?:{imm})?)\({reg}\))[\s,]*$".format(
+        register_ops='|'.join(sorted(register_opcodes)), immediate_ops='|'.join(sorted(immediate_opcodes)),
+        branch_ops='|'.join(sorted(branch_names)), memory_ops='|'.join(sorted(memory_opcodes)), sep=r"[\s,]+",
+        # the names of helpers.valid_registers - 'R0' to 'R31', '$0' to '$31' and the conventional names
+        reg=r"(R(?:3[01]|[12]?[0-9])|\$(?:3[01]|[12]?[0-9]|ZERO|AT|GP|SP|FP|RA|V[01]|A[0-3]|T[0-9]|S[0-7]|K[01]))",
+        imm=r"[-+]?(?:0X[0-9A-F]+|[0-9]+)"))
+
+
+class ParseError(ValueError):
+    """
+    Raised when a MIPS command cannot be parsed - carries the line and column of the offending token
+    """
+
+    def __init__(self, message: str, line: int = None, column: int = None):
+        self.message = message
+        self.line = line
+        self.column = column
+        if line is not None:
+            message = "line {}, column {}: {}".format(line, column, message)
+        super().__init__(message)
+
+    def __reduce__(self):
+        # raised in worker processes - rebuilt in the parent with its line and column
+        return self.__class__, (self.message, self.line, self.column)
+
+
+def scan_mips_command(command: str) -> tuple:
+    """
+    This function will be used to match a single MIPS command - one precompiled match, no tokenizing
+    :param command: upper case command e.g. 'LW R4, 8(R3)'
+    :return: (opcode, rd, rs, rt, offset, address) in the order of the Instruction fields - None when not used
+    by the opcode, None if the command does not match or a register is not valid
+    """
+    match = command_pattern.match(command)
+    if match is None:
+        return None
+    last = match.lastindex
+    opcode, first, second, third = match.group(last - 3, last - 2, last - 1, last)
+    if last == 4:
+        # Destination Register, Source Register, Target Register
+        return opcode, first, second, third, None, None
+    if last == 8:
+        # destination register, source register, immediate
+        return opcode, first, second, None, third, None
+    if last == 12:
+        # compared registers, branch target
+        return opcode, None, first, second, None, third
+    if opcode == "LW":
+        # target register, source register
+        return "LW", None, third, first, second, None
+    # source register, target register
+    return "SW", None, first, third, second, None
+
+
+def match_mips_command(tokens: list) -> tuple:
+    """
+    This function will be used to match the tokens of a single MIPS command to the operands of its opcode -
+    registers are not checked. Only used to find out why a command did not match, see command_error.
+    :param tokens: upper case command split on commas and whitespace e.g. ['LW', 'R4', '8(R3)']
+    :return: (opcode, rd, rs, rt, offset) - the offset of a branch is its target
+    """
+    if len(tokens) == 4:
+        if tokens[0] in register_opcodes:
+            # Destination Register, Source Register, Target Register
+            return tokens[0], tokens[1], tokens[2], tokens[3], None
+        if tokens[0] in immediate_opcodes:
+            if immediate_pattern.match(tokens[3]) is not None:
+                # destination register, source register, immediate
+                return tokens[0], tokens[1], tokens[2], None, tokens[3]
+        elif tokens[0] in branch_names:
+            # compared registers, branch target
+            return tokens[0], None, tokens[1], tokens[2], tokens[3]
+    elif len(tokens) == 3 and tokens[0] in memory_opcodes:
+        match = memory_pattern.match(tokens[2])
+        # the offset is optional - '(R1)' reads at offset 0
+        if match is not None and (match.group(1) == '' or immediate_pattern.match(match.group(1)) is not None):
+            if tokens[0] == "LW":
+                # target register, source register
+                return "LW", None, match.group(2), tokens[1], match.group(1)
+            # source register, target register
+            return "SW", None, tokens[1], match.group(2), match.group(1)
+    return None
+
+
+def command_error(item: str, line: int = None, column: int = 1) -> ParseError:
+    """
+    This function will be used to find out why a command did not match and where - off the hot path
+    :param item: raw command
+    :param line: line (or command) number
+    :param column: column of item on its line
+    :return: ParseError
+    """
+    tokens = list(token_pattern.finditer(item.upper()))
+    if len(tokens) == 0:
+        return ParseError("Empty command", line, column)
+    opcode = tokens[0].group()
+    if opcode not in opcode_ids:
+        return ParseError("Opcode {} not supported! Please resubmit".format(opcode), line, column + tokens[0].start())
+    fields = match_mips_command([token.group() for token in tokens]) or ()
+    # the operands are there - one of the registers is not valid
+    bad = next((reg for reg in fields[1:4] if reg is not None and reg not in valid_registers), None)
+    if bad is not None:
+        message = "Register {} not valid - registers are R0 to R31 or $0 to $31".format(bad)
+        for token in tokens[1:]:
+            match = memory_pattern.match(token.group())
+            if match is not None and match.group(2) == bad:
+                return ParseError(message, line, column + token.start() + match.start(2))
+            if token.group() == bad:
+                return ParseError(message, line, column + token.start())
+    # the registers are there - the offset or immediate is not a number
+    if opcode in memory_opcodes and len(tokens) == 3:
+        match = memory_pattern.match(tokens[2].group())
+        if match is not None and match.group(1) != '' and immediate_pattern.match(match.group(1)) is None:
+            return ParseError("Offset {} is not a number - offsets are decimal or hexadecimal".format(
+                item[tokens[2].start():tokens[2].start() + match.end(1)]), line, column + tokens[2].start())
+    if opcode in immediate_opcodes and len(tokens) == 4 and immediate_pattern.match(tokens[3].group()) is None:
+        return ParseError("Immediate {} is not a number - immediates are decimal or hexadecimal".format(
+            item[tokens[3].start():tokens[3].end()]), line, column + tokens[3].start())
+    if opcode in register_opcodes:
+        expected = "three registers 'rd, rs, rt'"
+    elif opcode in immediate_opcodes:
+        expected = "two registers and an immediate 'rd, rs, imm'"
+    elif opcode in branch_names:
+        expected = "two registers and a branch target 'rs, rt, label'"
+    else:
+        expected = "a register and a memory location 'rt, offset(rs)'"
+    return ParseError("{} expects {}, got '{}'".format(opcode, expected, item[tokens[0].end():].strip(" ,\t")),
+                      line, column + (tokens[1].start() if len(tokens) > 1 else tokens[0].end()))
+
+
+def parse_mips_line(item: str, line: int = None, column: int = 1) -> Instruction:
+    """
+    This function will be used to parse a single MIPS command
+    :param item: raw command e.g. 'LW R4, 8(R3)'
+    :param line: line (or command) number, used for error reporting
+    :param column: column of item on its line, used for error reporting
+    :return: Instruction
+    """
+    fields = scan_mips_command(item.upper())
+    if fields is None:
+        raise command_error(item, line=line, column=column)
+    # positional - keyword arguments cost about as much as the match itself
+    return Instruction(*fields, item)
 
 
-# noinspection DuplicatedCode
 def parse_mips_commands(raw_commands: str) -> list:
     """
     This function will be used parse MIPS commands supplied by the user
-    :param raw_commands: newline separated commands
+    :param raw_commands: pipe separated commands
     :return: list of parsed commands
     """
-    # initialize an empty list
-    all_instructions = []
-    # initialize a tmp list by splitting the raw commands by '\n'
-    tmp = raw_commands.split('|')
-    # close out if there was nothing returned!
-    if len(tmp) == 0:
-        return []
-    for item in tmp:
-        # tokenize input
-        tokens = item.split()
-        # capture opcode
-        opcode = tokens[0].strip().upper()
-        # based on opcode
-        if opcode in ["ADD", "SUB"]:
-            # Destination Register
-            rd = tokens[1].replace(',', '').strip().upper()
-            # Source Register - used as Register1 for ADD,SUB
-            rs = tokens[2].replace(',', '').strip().upper()
-            # Target Register - used as Register1 for ADD,SUB
-            rt = tokens[3].replace(',', '').strip().upper()
-            # Append to instructions
-            all_instructions.append(
-                Instruction(opcode=opcode, rd=rd, rs=rs, rt=rt, raw=item)
-            )
-        elif opcode in ["LW"]:
-            # target register
-            rt = tokens[1].replace(',', '').strip().upper()
-            # source register
-            match = re.search(offset_capture, tokens[2].replace(',', '').strip().upper())
-            rs = match.group(2)
-            offset = match.group(1)
-            # Append to instructions
-            all_instructions.append(
-                Instruction(opcode=opcode, rs=rs, rt=rt, offset=offset, raw=item)
-            )
-        elif opcode in ["SW"]:
-            # source register
-            rs = tokens[1].replace(',', '').strip().upper()
-            # target register
-            match = re.search(offset_capture, tokens[2].replace(',', '').strip().upper())
-            rt = match.group(2)
-            offset = match.group(1)
-            # Append to instructions
-            all_instructions.append(
-                Instruction(opcode=opcode, rs=rs, rt=rt, offset=offset, raw=item)
-            )
-        else:
-            raise Exception("Opcode {} not supported! Please resubmit")
-    return all_instructions
+    # upper casing maps characters one by one and never makes a '|' - commands line up with the raw ones
+    commands = raw_commands.upper().split('|')
+    instructions = []
+    append = instructions.append
+    for num, (item, command) in enumerate(zip(raw_commands.split('|'), commands), start=1):
+        fields = scan_mips_command(command)
+        if fields is None:
+            raise command_error(item, line=num)
+        # positional - keyword arguments cost about as much as the match itself
+        append(Instruction(*fields, item))
+    return instructions
+
+
+def parse_mips_store(raw_commands: str) -> InstructionStore:
+    """
+    This function will be used parse MIPS commands supplied by the user into a columnar store.
+    The whole buffer is upper cased in one go, each command is matched once and its registers are interned
+    straight from the match - no Instruction is built.
+    :param raw_commands: pipe separated commands
+    :return: InstructionStore
+    """
+    store = InstructionStore(buffer=raw_commands)
+    cooked = raw_commands.upper()
+    if len(cooked) != len(raw_commands):
+        # upper casing moved characters around - positions would not line up with the raw commands
+        for num, item in enumerate(raw_commands.split('|')):
+            store.append(parse_mips_line(item, line=num + 1), start=0, end=0)
+        store.buffer = None
+        return store
+    # bound methods of the hot loop
+    opcode_append, rd_append, rs_append = store.opcode.append, store.rd.append, store.rs.append
+    rt_append, offset_append = store.rt.append, store.offset.append
+    start_append, end_append = store.start.append, store.end.append
+    start = 0
+    for num, item in enumerate(cooked.split('|'), start=1):
+        end = start + len(item)
+        fields = scan_mips_command(item)
+        if fields is None:
+            raise command_error(raw_commands[start:end], line=num)
+        opcode, rd, rs, rt, offset, _ = fields
+        opcode_append(opcode_ids[opcode])
+        rd_append(NO_REG if rd is None else register_ids[rd])
+        rs_append(register_ids[rs])
+        rt_append(NO_REG if rt is None else register_ids[rt])
+        # branch targets are only kept in the raw command
+        offset_append(0 if offset is None else offset_value(offset))
+        start_append(start)
+        end_append(end)
+        start = end + 1
+    return store
+
+
+def read_mips_lines(lines: Iterable[str]) -> Iterator[tuple]:
+    """
+    This function will be used to clean up lines of a MIPS source (.s) or trace file, one at a time.
+    Comments ('#' or ';'), blank lines, assembler directives ('.text') and labels ('loop:') are dropped.
+    :param lines: iterable of raw lines e.g. an open file
+    :return: generator of (line number, column, raw command)
+    """
+    for number, line in enumerate(lines, start=1):
+        # drop comments
+        if '#' in line:
+            line = line.split('#', 1)[0]
+        if ';' in line:
+            line = line.split(';', 1)[0]
+        # drop labels
+        start = line.rfind(':') + 1
+        item = line[start:].strip()
+        # skip blank lines and assembler directives
+        if item == '' or item[0] == '.':
+            continue
+        yield number, line.index(item[0], start) + 1, item
+
+
+def read_mips_source(lines: Iterable[str]) -> Iterator[str]:
+    """
+    This function will be used to clean up lines of a MIPS source (.s) or trace file, one at a time.
+    Comments ('#' or ';'), blank lines, assembler directives ('.text') and labels ('loop:') are dropped.
+    :param lines: iterable of raw lines e.g. an open file
+    :return: generator of raw commands
+    """
+    for _, _, item in read_mips_lines(lines):
+        yield item
+
+
+def read_mips_blocks(lines: Iterable[str]) -> Iterator[List[Instruction]]:
+    """
+    This function will be used to split a MIPS source (.s) into basic blocks - a label is a branch target,
+    so it starts a new block, and a branch ends one
+    :param lines: iterable of raw lines e.g. an open file
+    :return: generator of lists of parsed commands
+    """
+    labels = [0]
+
+    def scan():
+        for line in lines:
+            if ':' in line.split('#', 1)[0].split(';', 1)[0]:
+                labels[0] += 1
+            yield line
+
+    block = []
+    seen = 0
+    for number, column, item in read_mips_lines(scan()):
+        # lines are read one at a time - every label up to this command has been scanned
+        if labels[0] != seen and block:
+            yield block
+            block = []
+        seen = labels[0]
+        block.append(parse_mips_line(item, line=number, column=column))
+        if block[-1].opcode in branch_names:
+            yield block
+            block = []
+    if block:
+        yield block
 
 
-def orchestrate_detection_no_fwd(num: int, item: Instruction, all_instructions: List[Instruction]):
+def stream_mips_commands(lines: Iterable[str]) -> Iterator[Instruction]:
+    """
+    This function will be used to lazily parse MIPS commands - only one line is held in memory at a time
+    :param lines: iterable of raw lines e.g. an open file
+    :return: generator of parsed commands
+    """
+    for number, column, item in read_mips_lines(lines):
+        yield parse_mips_line(item, line=number, column=column)
+
+
+def format_detection(item: Instruction, tmp1: str = '', tmp2: str = '') -> str:
+    """
+    This function will build the detection message for a single instruction
+    :param item: Instruction
+    :param tmp1: hazard against the instruction at num - 1
+    :param tmp2: hazard against the instruction at num - 2
+    :return: str
+    """
     # initialize message with input command
     msg = item.raw
-    tmp1 = ''
-    tmp2 = ''
-    if num == 0:
-        pass
-    else:
-        prev_instruction_1 = all_instructions[num - 1]
-        # potential RAW, WAR or WAW data hazards between {ADD, SUB} and {SUB, ADD}
-        tmp1 = detect_hazards_no_fwd(current=item, previous=prev_instruction_1, prev_no=num-1)
-        if (num-2) >= 0:
-            prev_instruction_2 = all_instructions[num - 2]
-            tmp2 = detect_hazards_no_fwd(current=item, previous=prev_instruction_2, prev_no=num-2)
     # create final message
     if tmp1 == '' and tmp2 == '':
         final_msg = msg
@@ -119,8 +506,22 @@ def orchestrate_detection_no_fwd(num: int, item: Instruction, all_instructions:
         final_msg = msg + ' ------ ' + tmp2
     else:
         final_msg = msg + ' ------ ' + tmp1 + '\n' + ' '.ljust(15) + '------ ' + tmp2
+    return final_msg
+
+
+def orchestrate_detection_no_fwd(num: int, item: Instruction, all_instructions: List[Instruction]) -> InstructionResult:
+    result = InstructionResult(num=num, item=item)
+    encoded = encode_instruction(item)
+    if num >= 1:
+        # potential RAW, WAR or WAW data hazards between {ADD, SUB} and {SUB, ADD}
+        result.previous_1 = all_instructions[num - 1]
+        result.rule_1 = classify_hazard(current=encoded, previous=encode_instruction(result.previous_1))
+    if num >= 2:
+        result.previous_2 = all_instructions[num - 2]
+        result.rule_2 = classify_hazard(current=encoded, previous=encode_instruction(result.previous_2))
     # print
-    print(final_msg)
+    print(format_detection(item=item, tmp1=result.hazard_1, tmp2=result.hazard_2))
+    return result
 
 
 def instruction_pipeline(
@@ -130,78 +531,359 @@ def instruction_pipeline(
         all_instructions: List[Instruction],
         prev_pipe: str = None, adj: int = None
 ):
-    pipeline_stages = gen_pipeline_stages(item=item)
-    all_step = '|'
+    prev_instruction_1 = None
+    prev_instruction_2 = None
     tmp1 = ''
     tmp2 = ''
-    # detect hazards
-    if num == 0:
-        prev_instruction_1 = None
-        prev_instruction_2 = None
-    else:
+    if num >= 1:
         prev_instruction_1 = all_instructions[num - 1]
-        # potential RAW, WAR or WAW data hazards between {ADD, SUB} and {SUB, ADD}
         tmp1 = detect_hazards_no_fwd(current=item, previous=prev_instruction_1, prev_no=num-1)
-        if (num-2) >= 0:
-            prev_instruction_2 = all_instructions[num - 2]
-            tmp2 = detect_hazards_no_fwd(current=item, previous=prev_instruction_2, prev_no=num-2)
-        else:
-            prev_instruction_2 = None
-            tmp2 = ''
-    pipeline_modifier(
-        fwd_option=fwd_option,
-        current=item,
-        pipeline_stages=pipeline_stages,
-        previous_1=prev_instruction_1,
-        hazard_1=tmp1,
-        hazard_2=tmp2,
-        previous_2=prev_instruction_2
-     )
-    # introduce pipeline modifier
-    base = 8
-    for stage in pipeline_stages:
-        gen_step = timing_step(stage=stage["short"])
-        all_step = all_step + gen_step + '|'
-    if prev_pipe is None:
-        op = 0
-    if adj is None:
+    if num >= 2:
+        prev_instruction_2 = all_instructions[num - 2]
+        tmp2 = detect_hazards_no_fwd(current=item, previous=prev_instruction_2, prev_no=num-2)
+    stalls = count_stalls(fwd_option=fwd_option, current=item, previous_1=prev_instruction_1,
+                          hazard_1=tmp1, hazard_2=tmp2, previous_2=prev_instruction_2)
+    # adj carries the stall cycles of all previous rows - every one of them pushes this row back
+    if prev_pipe is None or adj is None:
         adj = 0
     else:
-        if prev_pipe.count('---S---') > 0:
-            op = base * prev_pipe.count('---S---')
+        adj = adj + prev_pipe.count('|') - len(stages) - 1
+    timing = instruction_timing(num=num, issue=num + adj + 1, stalls=stalls)
+    print(render_timing_row(raw=item.raw, timing=timing))
+    # send it for the next run
+    return render_steps(stalls=stalls), adj
+
+
+def emit_detection(result: InstructionResult, out=None):
+    """
+    This function will print the hazards of a single analysed instruction
+    :param result: InstructionResult
+    :param out: writable text file, stdout by default
+    :return:
+    """
+    print(format_detection(item=result.instruction(), tmp1=result.hazard_1, tmp2=result.hazard_2), file=out)
+    for message in result.distant:
+        print(' '.ljust(15) + '------ ' + message, file=out)
+
+
+def emit_schedule(outcome, out=None):
+    """
+    This function will print a rescheduled program with its cycles before and after
+    :param outcome: ScheduleOutcome
+    :param out: writable text file, stdout by default
+    :return:
+    """
+    print("-" * 236, file=out)
+    print("- Rescheduled program ({} basic blocks, {} kept as written): -".format(outcome.blocks, outcome.kept),
+          file=out)
+    print("-" * 236, file=out)
+    for item in outcome.instructions:
+        print(item.raw, file=out)
+    print("-" * 236, file=out)
+    print("Before: " + render_summary(summary=outcome.before), file=out)
+    print("After:  " + render_summary(summary=outcome.after), file=out)
+
+
+def emit_loops(items: Iterable, operation: str, model: TimingModel, out=None):
+    """
+    This function will print a trace analysed loop by loop - the instructions outside loops one by one, then
+    per loop its first and steady state iterations
+    :param items: InstructionResult and LoopSummary from analyse_loops
+    :param operation: 'detect', 'timing' or 'both'
+    :param model: TimingModel the cycles were added to
+    :param out: writable text file, stdout by default
+    :return:
+    """
+    detect = operation in ["detect", "both"]
+    timing = operation in ["timing", "both"]
+    for item in items:
+        if isinstance(item, InstructionResult):
+            if detect:
+                emit_detection(item, out=out)
+            continue
+        segment = item.segment
+        # instructions are numbered from 1, as in the hazard messages
+        print("- Loop at instruction#{}: {} instructions x {} iterations -".format(
+            segment.start + 1, segment.length, segment.iterations), file=out)
+        if timing:
+            print("  First iteration: {} stall cycles - steady state after {} iterations: {} stall cycles, {} cycles "
+                  "per iteration".format(item.first_stalls, item.analysed, item.steady_stalls,
+                                         item.cycles_per_iteration), file=out)
+        if detect:
+            for title, results in [("First iteration", item.first), ("Steady state iteration", item.steady)]:
+                print("  {} (instructions #{}-#{}):".format(title, results[0].num + 1, results[-1].num + 1), file=out)
+                for result in results:
+                    emit_detection(result, out=out)
+            print("  Instructions depending on the iteration before: {}".format(len(item.boundary)), file=out)
+    if timing:
+        print(render_summary(summary=model.summary), file=out)
+
+
+class TimingEmitter:
+    """
+    Writes timing diagram rows one analysed instruction at a time - cycles come from a TimingModel, rows go
+    through a buffered writer
+    """
+
+    def __init__(self, out=None, width: int = None, pipeline: Pipeline = None, style: str = "full",
+                 page_cycles: int = None, cycles: tuple = None):
+        """
+        :param out: writable text file, stdout by default
+        :param width: screen width, the terminal width if not given
+        :param pipeline: compiled pipeline description, the 5-stage pipeline if not given
+        :param style: 'full' for '|---F---|' sections, 'compact' for one character per cycle
+        :param page_cycles: cycles per page - rows are indented from the page instead of from cycle 1
+        :param cycles: (first, last) cycles shown, last None for up to the end of the program
+        """
+        self.out = out
+        self.writer = RowWriter(out=out)
+        self.model = TimingModel(pipeline=pipeline)
+        self.fetch = stages[0] if pipeline is None else pipeline.stages[0]
+        # screen width - the terminal is only asked on the first row, and only if no width is given
+        self.width = width
+        self.dash_length = None
+        self.window = None
+        if style != "full" or page_cycles is not None or cycles is not None:
+            first, last = cycles or (1, None)
+            self.window = DiagramWindow(writer=self.writer, style=style, page_cycles=page_cycles, first=first,
+                                        last=last)
+
+    def __call__(self, result: InstructionResult):
+        if self.dash_length is None:
+            self.dash_length = section_length(width=self.width)
+        timing = self.model.step(stalls=result.stalls, opcode=result.opcode)
+        if self.window is not None:
+            self.window.dash_length = self.dash_length
+            self.window.add(raw=result.instruction().raw, timing=timing, fetch=self.fetch)
         else:
-            op = adj
-    if num == 0:
-        print(item.raw.ljust(15) + ' ---> ' + all_step)
+            self.writer.write(render_timing_row(raw=result.instruction().raw, timing=timing,
+                                                dash_length=self.dash_length, fetch=self.fetch))
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        """
+        Write the total cycles and CPI once every row is out
+        :return:
+        """
+        if self.window is not None:
+            self.window.close()
+        self.writer.write("-" * 236)
+        self.writer.write(render_summary(summary=self.model.summary))
+        self.writer.flush()
+
+
+class ComparisonEmitter:
+    """
+    Writes the stall cycles of every analysed instruction with the forwarding unit off and on side by side -
+    in place of the timing diagram when comparing - and what forwarding saves once every row is out
+    """
+
+    def __init__(self, out=None, pipeline: Pipeline = None):
+        """
+        :param out: writable text file, stdout by default
+        :param pipeline: compiled pipeline description, the 5-stage pipeline if not given
+        """
+        self.out = out
+        self.writer = RowWriter(out=out)
+        # cycles with the forwarding unit off / on
+        self.model = TimingModel(pipeline=pipeline)
+        self.forwarded = TimingModel(pipeline=pipeline)
+
+    def __call__(self, result: InstructionResult):
+        self.model.step(stalls=result.stalls, opcode=result.opcode)
+        self.forwarded.step(stalls=result.stalls_fwd, opcode=result.opcode)
+        self.writer.write("{} ---> stalls off: {} - on: {} - saved: {}".format(
+            result.instruction().raw.ljust(15), result.stalls, result.stalls_fwd, result.stalls - result.stalls_fwd))
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        """
+        Write the total cycles and CPI of both runs, and the speedup, once every row is out
+        :return:
+        """
+        self.writer.write("-" * 236)
+        self.writer.write("Forwarding unit OFF: " + render_summary(summary=self.model.summary))
+        self.writer.write("Forwarding unit ON:  " + render_summary(summary=self.forwarded.summary))
+        self.writer.write(render_speedup(summary_off=self.model.summary, summary_on=self.forwarded.summary))
+        self.writer.flush()
+
+
+def timing_emitter(args, pipeline: Pipeline = None, out=None, profiler=None):
+    """
+    This function will build what the analysed instructions are handed to for the timing part of a run - a
+    timing diagram, or the stall comparison with --forwarding_unit both
+    :param args: argparse object
+    :param pipeline: compiled pipeline description
+    :param out: writable text file, stdout by default
+    :param profiler: Profiler the cycles stepped are booked to, if any
+    :return: TimingEmitter or ComparisonEmitter
+    """
+    if args.forwarding_unit == "both":
+        emit_timing = ComparisonEmitter(out=out, pipeline=pipeline)
+        models = [emit_timing.model, emit_timing.forwarded]
     else:
-        print(item.raw.ljust(15) + ' ---> ' + ' ' * num * base + ' ' * op + all_step)
-    # send it for the next run
-    return all_step, op
+        emit_timing = TimingEmitter(out=out, pipeline=pipeline, style=args.diagram, page_cycles=args.page_cycles,
+                                    cycles=args.cycles)
+        models = [emit_timing.model]
+    if profiler is not None:
+        for model in models:
+            profiler.instrument(model, "step", "stalls")
+    return emit_timing
 
 
-if __name__ == '__main__':
-    args = parse_args(sys.argv[1:])
-    parsed_commands = parse_mips_commands(raw_commands=args.commands)
-    tmp = None
-    adjust = None
+def timing_title(fwd_option: str) -> str:
+    """
+    This function will build the title of the timing part of a run
+    :param fwd_option: forwarding unit 'on', 'off' or 'both'
+    :return: str
+    """
+    if fwd_option == "both":
+        return "- Comparing stall cycles with forwarding unit OFF and ON: -"
+    return "- Generating Timing Diagram with forwarding unit {}: -".format(fwd_option.upper())
+
+
+def write_profile(profiler, output_format: str, path: str = None):
+    """
+    This function will write the report of a profiled run - registered to run at exit
+    :param profiler: Profiler
+    :param output_format: 'table', 'json' or 'chrome'
+    :param path: report path, stderr if not given
+    :return:
+    """
+    sys.stdout.flush()
+    if path is None:
+        profiler.write(output_format=output_format)
+    else:
+        with open(path, 'w') as out:
+            profiler.write(output_format=output_format, out=out)
+
+
+def main(argv=None):
+    """
+    Command line entry point
+    :param argv: runtime arguments
+    :return:
+    """
+    args = parse_args(argv)
+    profiler = None
+    if args.profile is not None:
+        # only a profiled run goes through the instrumented wrappers
+        from profiling import Profiler
+        profiler = Profiler(trace=args.profile == "chrome")
+        atexit.register(write_profile, profiler, args.profile, args.profile_output)
+    parse_commands = parse_mips_commands
+    parse_store = parse_mips_store
+    stream_commands = stream_mips_commands
+    if profiler is not None:
+        parse_commands = profiler.wrap("parse", parse_mips_commands)
+        parse_store = profiler.wrap("parse", parse_mips_store)
+        stream_commands = lambda lines: profiler.timed("parse", stream_mips_commands(lines))  # noqa: E731
+    # compiled into lookup tables once, before any instruction is analysed
+    pipeline = load_pipeline(args.pipeline) if args.pipeline is not None else None
+    # binary traces written by tracefile.py are memory-mapped instead of parsed
+    from tracefile import is_trace_file
+    from tracefile import load_trace
+    binary = args.input not in [None, '-'] and is_trace_file(args.input)
+    if args.jobs > 1 and args.input not in [None, '-'] and not binary and args.format == "text" and pipeline is None \
+            and args.window in [None, 2] and not args.schedule and not args.loops and profiler is None \
+            and args.diagram == "full" and args.page_cycles is None and args.cycles is None \
+            and args.shape_cache is None and args.forwarding_unit != "both":
+        # split the trace into chunks analysed side by side
+        from parallel import analyse_parallel
+        if analyse_parallel(path=args.input, operation=args.operation, fwd_option=args.forwarding_unit,
+                            jobs=args.jobs):
+            sys.exit(0)
+    if args.loops:
+        # repeated sequences are looked for over the whole trace - it is held in memory
+        from loops import analyse_loops
+        if args.input is None:
+            instructions = parse_store(raw_commands=args.commands)
+        elif binary:
+            instructions = load_trace(args.input)
+        else:
+            instructions = list(stream_commands(sys.stdin if args.input == '-' else open(args.input)))
+        model = TimingModel(pipeline=pipeline)
+        print("-" * 236)
+        print("- Loop-aware analysis with forwarding unit {}: -".format(args.forwarding_unit.upper()))
+        print("-" * 236)
+        loops = analyse_loops(instructions, fwd_option=args.forwarding_unit, pipeline=pipeline, window=args.window,
+                              model=model, branch_penalty=args.branch_penalty)
+        emit_loops(loops, operation=args.operation, model=model)
+        print("-" * 236)
+        sys.exit(0)
+    # single traversal - detection and timing come out of the same engine
+    cache = ShapeCache(maxsize=args.shape_cache) if args.shape_cache is not None else None
+    if profiler is not None:
+        profiler.cache = cache
+    if args.forwarding_unit == "both":
+        # hazards are classified once, stalls with and without forwarding come out of the same traversal
+        engine = ForwardingComparison(window=args.window, pipeline=pipeline, cache=cache,
+                                      branch_penalty=args.branch_penalty)
+    else:
+        engine = HazardEngine(fwd_option=args.forwarding_unit, window=args.window, pipeline=pipeline, cache=cache,
+                              branch_penalty=args.branch_penalty)
+    if args.schedule:
+        # blocks are reordered as a whole - the program is held in memory
+        from scheduler import schedule_program
+        if args.input is None:
+            blocks = [parse_commands(raw_commands=args.commands)]
+        elif binary:
+            store = load_trace(args.input)
+            blocks = [[store[num] for num in range(len(store))]]
+        else:
+            blocks = read_mips_blocks(sys.stdin if args.input == '-' else open(args.input))
+        if profiler is not None:
+            blocks = profiler.timed("parse", blocks)
+            schedule_program = profiler.wrap("schedule", schedule_program)
+        outcome = schedule_program(blocks, fwd_option=args.forwarding_unit, pipeline=pipeline,
+                                   branch_penalty=args.branch_penalty)
+        # structured formats own stdout
+        emit_schedule(outcome, out=sys.stdout if args.format == "text" else sys.stderr)
+        results = engine.run(outcome.instructions)
+    elif args.input is None:
+        results = engine.run_store(parse_store(raw_commands=args.commands))
+    elif binary:
+        results = engine.run_store(load_trace(args.input))
+    elif args.input == '-':
+        results = engine.run(stream_commands(sys.stdin))
+    else:
+        results = engine.run(stream_commands(open(args.input)))
+    if profiler is not None:
+        # whatever the results are handed to is rendering, but for the cycles stepped by the timing model
+        # with --forwarding_unit both, stalls per rule are those without forwarding
+        fwd_option = "off" if args.forwarding_unit == "both" else args.forwarding_unit
+        results = profiler.timed("detect", profiler.observe(results, fwd_option=fwd_option,
+                                                            pipeline=pipeline is not None), after="render")
+    if args.format != "text":
+        # structured records, streamed one instruction at a time
+        from records import emit_records
+        model = TimingModel(pipeline=pipeline)
+        if profiler is not None:
+            profiler.instrument(model, "step", "stalls")
+        emit_records(results, output_format=args.format, operation=args.operation, fwd_option=args.forwarding_unit,
+                     pipeline=pipeline, model=model)
+        sys.exit(0)
     if args.operation == "detect":
         print("-"*236)
         print("- Detecting data hazards: -")
         print("-"*236)
-        for i, ind in enumerate(parsed_commands):
-            orchestrate_detection_no_fwd(num=i, item=ind, all_instructions=parsed_commands)
+        for result in results:
+            emit_detection(result)
         print("-" * 236)
         # safely exit
         sys.exit(0)
     elif args.operation == "timing":
         print("-"*236)
-        print("- Generating Timing Diagram with forwarding unit {}: -".format(args.forwarding_unit.upper()))
+        print(timing_title(args.forwarding_unit))
         print("-"*236)
-        for i, ind in enumerate(parsed_commands):
-            tmp, adjust = instruction_pipeline(
-                fwd_option=args.forwarding_unit,
-                num=i, item=ind, all_instructions=parsed_commands,
-                prev_pipe=tmp, adj=adjust)
+        emit_timing = timing_emitter(args, pipeline=pipeline, profiler=profiler)
+        for result in results:
+            emit_timing(result)
+        emit_timing.close()
         print("-" * 236)
         # safely exit
         sys.exit(0)
@@ -209,19 +891,33 @@ if __name__ == '__main__':
         print("-"*236)
         print("- Detecting data hazards: -")
         print("-"*236)
-        for i, ind in enumerate(parsed_commands):
-            orchestrate_detection_no_fwd(num=i, item=ind, all_instructions=parsed_commands)
+        # timing rows are printed after all hazards - hold them in a spool that moves to disk when large
+        spool = tempfile.SpooledTemporaryFile(max_size=1 << 20, mode='w+')
+        emit_timing = timing_emitter(args, pipeline=pipeline, out=spool, profiler=profiler)
+        for result in results:
+            emit_detection(result)
+            emit_timing(result)
+        emit_timing.close()
         print("-"*236)
         print("*" * 236)
         print("-" * 236)
-        print("- Generating Timing Diagram with forwarding unit {}: -".format(args.forwarding_unit.upper()))
+        print(timing_title(args.forwarding_unit))
         print("-"*236)
-        for i, ind in enumerate(parsed_commands):
-            tmp, adjust = instruction_pipeline(
-                fwd_option=args.forwarding_unit,
-                num=i, item=ind, all_instructions=parsed_commands,
-                prev_pipe=tmp, adj=adjust)
+        sys.stdout.flush()
+        spool.seek(0)
+        shutil.copyfileobj(spool, sys.stdout)
         print("-" * 236)
     else:
         pass
 
+
+if __name__ == '__main__':
+    # modules importing build (parallel, tracefile) raise build.ParseError - a different class from the one of
+    # this script
+    from build import ParseError as ModuleParseError
+    try:
+        main(sys.argv[1:])
+    except (ParseError, ModuleParseError) as error:
+        sys.exit("Parse error - {}".format(error))
+    except PipelineError as error:
+        sys.exit("Pipeline error - {}".format(error))
@@ -0,0 +1,560 @@
+import copy
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List
+from helpers import Instruction
+from helpers import HazardRule
+from helpers import RAW, WAR, WAW
+from helpers import branch_opcodes
+from helpers import classify_hazard
+from helpers import encode_instruction
+from helpers import first_derived_opcode
+from helpers import operand_roles
+from helpers import render_dependency
+from helpers import render_hazard
+from memo import ShapeCache
+from pipeline import Pipeline
+from pipeline import classic
+from store import InstructionStore
+
+# Hazard messages are looked up at distance 1 and 2
+hazard_distance = 2
+
+
+# Define a data class around the outcome of a single instruction
+@dataclass
+class InstructionResult:
+    # position of the instruction in the program
+    num: int
+    # instruction itself
+    item: Instruction = None
+    # instructions at num - 1 and num - 2 (None if out of the program)
+    previous_1: Instruction = None
+    previous_2: Instruction = None
+    # hazards against the instructions at num - 1 and num - 2 (None if none)
+    rule_1: HazardRule = None
+    rule_2: HazardRule = None
+    # number of stall stages inserted after Fetch
+    stalls: int = 0
+    # stall stages with the forwarding unit on - only set by a ForwardingComparison, stalls are then those with
+    # the forwarding unit off
+    stalls_fwd: int = None
+    # what the stalls wait on when they come from a pipeline description or the stages of the classic pipeline
+    # rather than the hazard table - (RAW/WAR/WAW or 'structural' or 'branch', opcode waited on, distance) - see
+    # HazardEngine.pipeline_stalls and HazardEngine.staged_stalls
+    cause: tuple = None
+    # encoded opcode
+    opcode: int = None
+    # producer-consumer dependencies on the instructions of the engine window - (kind, distance, cur_role,
+    # prev_role) - None unless tracked (window beyond 2 or a pipeline description)
+    dependencies: tuple = None
+    # columnar store the instructions come from - item and previous_* are then left out and built on demand
+    store: InstructionStore = None
+
+    def instruction(self, distance: int = 0) -> Instruction:
+        """
+        Instruction at num - distance, None if out of the program
+        :param distance: 0, 1 or 2
+        :return: Instruction
+        """
+        if self.store is not None:
+            if self.num - distance < 0:
+                return None
+            return self.store[self.num - distance]
+        return (self.item, self.previous_1, self.previous_2)[distance]
+
+    @property
+    def hazard_1(self) -> str:
+        """
+        Message of the hazard against the instruction at num - 1 ('' if none) - rendered on demand
+        :return: str
+        """
+        if self.rule_1 is None:
+            return ''
+        return render_hazard(rule=self.rule_1, current=self.instruction(0), previous=self.instruction(1),
+                             prev_no=self.num - 1)
+
+    @property
+    def hazard_2(self) -> str:
+        """
+        Message of the hazard against the instruction at num - 2 ('' if none) - rendered on demand
+        :return: str
+        """
+        if self.rule_2 is None:
+            return ''
+        return render_hazard(rule=self.rule_2, current=self.instruction(0), previous=self.instruction(2),
+                             prev_no=self.num - 2)
+
+    @property
+    def distant(self) -> List[str]:
+        """
+        Messages of the dependencies on instructions further back than num - 2 - rendered on demand
+        :return: list of str
+        """
+        if not self.dependencies:
+            return []
+        current = self.instruction(0)
+        return [render_dependency(kind=kind, current=current, cur_role=cur_role, prev_no=self.num - distance,
+                                  distance=distance)
+                for kind, distance, cur_role, _ in self.dependencies if distance > hazard_distance]
+
+
+def rule_stalls(rule_1: HazardRule, rule_2: HazardRule, fwd: int) -> int:
+    """
+    Stall cycles of an instruction from its hazards at distance 1 and 2 - the hazard against num - 2 takes
+    precedence, see pipeline_modifier. Derived rules are left out, their stalls come from the stages.
+    :param rule_1: hazard against the instruction at num - 1, None if none
+    :param rule_2: hazard against the instruction at num - 2, None if none
+    :param fwd: 0 for the forwarding unit off, 1 for on
+    :return: int
+    """
+    if rule_2 is not None and not rule_2.derived:
+        return rule_2.stalls[fwd][1]
+    if rule_1 is not None and not rule_1.derived:
+        return rule_1.stalls[fwd][0]
+    return 0
+
+
+class HazardEngine:
+    """
+    Single pass hazard engine - detection and stall counts for each instruction come out of one traversal.
+    Only the last `window` instructions are kept (ring buffer) along with a per-register scoreboard of the
+    last writers and the last readers, so the cost per instruction and the memory used are constant.
+    """
+
+    def __init__(self, fwd_option: str = "off", window: int = None, pipeline: Pipeline = None,
+                 cache: ShapeCache = None, branch_penalty: int = None):
+        """
+        :param fwd_option: forwarding unit 'on' or 'off'
+        :param window: number of in-flight instructions dependencies are tracked over - hazard messages are
+        looked up at distance 1 and 2. Deep enough for every stall of the pipeline if not given.
+        :param pipeline: compiled pipeline description stalls are derived from - the hazard table stall counts
+        of the 5-stage pipeline are used if not given
+        :param cache: ShapeCache hazards and stalls are looked up in by instruction shape - not used with a
+        pipeline description, whose stalls depend on more than the last three instructions
+        :param branch_penalty: cycles the instruction after a branch waits - from the pipeline description (the
+        classic 5-stage one if not given) by default
+        """
+        if window is None:
+            window = max(hazard_distance, pipeline.depth) if pipeline is not None else hazard_distance
+        if window < hazard_distance:
+            raise ValueError("window must be at least {}, got {}".format(hazard_distance, window))
+        self.fwd_option = fwd_option
+        # index into HazardRule.stalls
+        self.fwd = 1 if fwd_option == "on" else 0
+        self.window = window
+        # instructions kept - without a pipeline description, deep enough for the stalls of derived opcodes
+        self.size = window if pipeline is not None else max(window, classic.depth)
+        # ring buffers of the last `size` instructions, their encoding and the cycle they left Fetch,
+        # indexed by num % size
+        self.ring: List[Instruction] = [None] * self.size
+        self.encoded_ring: List[tuple] = [None] * self.size
+        self.ready_ring: List[int] = [0] * self.size
+        # register -> nums of the instructions at distance 1 and 2 writing it, newest last
+        self.last_writers = {}
+        # register -> nums of the instructions at distance 1 and 2 reading it, newest last
+        self.last_readers = {}
+        # full-window scoreboard - register -> (num, role) of its last writer / of its readers since then
+        self.writer = {}
+        self.readers = {}
+        # number of instructions seen so far
+        self.count = 0
+        # fetch cycle of the next instruction
+        self.next_issue = 1
+        self.pipeline = pipeline
+        # producer-consumer dependencies are only tracked when stalls are derived from them or asked for
+        self.tracking = pipeline is not None or window > hazard_distance
+        self.cache = cache
+        # the recent writers / readers per register are only needed to skip classification - not when hazards
+        # come from the shape cache
+        self.prefilter = cache is None or pipeline is not None
+        if branch_penalty is None:
+            branch_penalty = (pipeline or classic).branch_penalty
+        self.branch_penalty = branch_penalty
+        # position of the last instruction with a derived opcode - the hand-written table is enough while none
+        # is in the ring
+        self.derived_at = -self.size - 1
+        # what the last staged_stalls waited on
+        self.cause = None
+
+    def previous(self, distance: int) -> Instruction:
+        """
+        Instruction `distance` positions before the next one, None if out of the window
+        :param distance:
+        :return: Instruction
+        """
+        if distance > self.count or distance > self.window:
+            return None
+        return self.ring[(self.count - distance) % self.size]
+
+    def sharing(self, encoded: tuple) -> set:
+        """
+        Distances of the instructions at distance 1 and 2 touching any register of an instruction - others
+        cannot have a hazard
+        :param encoded: encoded instruction
+        :return: set of distances
+        """
+        oldest = self.count - hazard_distance
+        distances = set()
+        written, read = operand_roles[encoded[0]]
+        for role in written + read:
+            reg = encoded[role]
+            for writer in self.last_writers.get(reg, ()):
+                if writer >= oldest:
+                    distances.add(self.count - writer)
+            for reader in self.last_readers.get(reg, ()):
+                if reader >= oldest:
+                    distances.add(self.count - reader)
+        return distances
+
+    def dependencies(self, encoded: tuple) -> list:
+        """
+        Every producer-consumer dependency of the next instruction on the instructions of the window - RAW on
+        the last writer of each register read, WAW on the last writer and WAR on the readers since then of
+        each register written. Earlier ones are ordered through these, so they need not be tracked.
+        :param encoded: encoded instruction
+        :return: list of (kind, num, cur_role, prev_role)
+        """
+        oldest = self.count - self.window
+        found = []
+        written, read = operand_roles[encoded[0]]
+        for role in read:
+            writer = self.writer.get(encoded[role])
+            if writer is not None and writer[0] >= oldest:
+                found.append((RAW, writer[0], role, writer[1]))
+        for role in written:
+            reg = encoded[role]
+            writer = self.writer.get(reg)
+            if writer is not None and writer[0] >= oldest:
+                found.append((WAW, writer[0], role, writer[1]))
+            for reader in self.readers.get(reg, ()):
+                if reader[0] >= oldest:
+                    found.append((WAR, reader[0], role, reader[1]))
+        return found
+
+    def record(self, item: Instruction, encoded: tuple, stalls: int = 0):
+        """
+        Push an instruction into the ring buffer and the scoreboard
+        :param item: Instruction
+        :param encoded: encoded instruction
+        :param stalls: stall cycles of the instruction
+        :return:
+        """
+        num = self.count
+        written, read = operand_roles[encoded[0]]
+        if self.prefilter:
+            oldest = num - hazard_distance + 1
+            for role in read:
+                reg = encoded[role]
+                readers = [reader for reader in self.last_readers.get(reg, ()) if reader >= oldest]
+                readers.append(num)
+                self.last_readers[reg] = readers
+            for role in written:
+                reg = encoded[role]
+                writers = [writer for writer in self.last_writers.get(reg, ()) if writer >= oldest]
+                writers.append(num)
+                self.last_writers[reg] = writers
+        if self.tracking:
+            oldest = num - self.window + 1
+            for role in read:
+                readers = self.readers.get(encoded[role])
+                if readers is None:
+                    readers = self.readers[encoded[role]] = deque()
+                while readers and readers[0][0] < oldest:
+                    readers.popleft()
+                readers.append((num, role))
+            for role in written:
+                self.writer[encoded[role]] = (num, role)
+                self.readers[encoded[role]] = deque()
+        self.ring[num % self.size] = item
+        self.encoded_ring[num % self.size] = encoded
+        self.ready_ring[num % self.size] = self.next_issue + stalls
+        if encoded[0] >= first_derived_opcode:
+            self.derived_at = num
+        self.next_issue += stalls + 1
+        self.count = num + 1
+
+    def resume(self, num: int, previous: List[Instruction], stalls: List[int] = None):
+        """
+        Continue a program at position num - e.g. one chunk of a trace analysed on its own
+        :param num: position of the next instruction
+        :param previous: instructions just before num, oldest first - at most `size` are needed
+        :param stalls: stall cycles of the previous instructions, none if not given - only the stalls of
+        derived opcodes and of pipeline descriptions depend on them
+        :return:
+        """
+        previous = previous[-self.size:]
+        stalls = [0] * len(previous) if stalls is None else stalls[len(stalls) - len(previous):]
+        self.count = num - len(previous)
+        self.next_issue = self.count + 1
+        for item, cycles in zip(previous, stalls):
+            self.record(item, encode_instruction(item), stalls=cycles)
+
+    def fork(self) -> 'HazardEngine':
+        """
+        Copy of the engine state - the copy and the original can then be fed different instructions
+        :return: HazardEngine
+        """
+        other = copy.copy(self)
+        other.ring = list(self.ring)
+        other.encoded_ring = list(self.encoded_ring)
+        other.ready_ring = list(self.ready_ring)
+        # the lists of last_writers / last_readers are replaced, never changed in place
+        other.last_writers = dict(self.last_writers)
+        other.last_readers = dict(self.last_readers)
+        other.writer = dict(self.writer)
+        other.readers = {reg: deque(readers) for reg, readers in self.readers.items()}
+        return other
+
+    def stall_cycles(self, encoded: tuple) -> int:
+        """
+        Stall cycles the next instruction would take - nothing is recorded
+        :param encoded: encoded instruction
+        :return: int
+        """
+        num = self.count
+        if self.pipeline is not None:
+            return self.pipeline_stalls(encoded, self.dependencies(encoded))
+        rule_1 = None
+        rule_2 = None
+        if num >= 1:
+            rule_1 = classify_hazard(current=encoded, previous=self.encoded_ring[(num - 1) % self.size])
+        if num >= 2:
+            rule_2 = classify_hazard(current=encoded, previous=self.encoded_ring[(num - 2) % self.size])
+        stalls = rule_stalls(rule_1, rule_2, self.fwd)
+        if encoded[0] >= first_derived_opcode or num - self.derived_at <= self.size:
+            stalls = max(stalls, self.staged_stalls(encoded))
+        return stalls
+
+    def step(self, item: Instruction) -> InstructionResult:
+        """
+        Analyse the next instruction of the program
+        :param item: Instruction
+        :return: InstructionResult
+        """
+        return self.analyse(encoded=encode_instruction(item), item=item)
+
+    def analyse(self, encoded: tuple, item: Instruction = None, store: InstructionStore = None) -> InstructionResult:
+        """
+        Analyse the next instruction of the program from its encoding
+        :param encoded: encoded instruction - (opcode, rd, rs, rt)
+        :param item: Instruction, if already built
+        :param store: columnar store the instruction comes from, if any
+        :return: InstructionResult
+        """
+        num = self.count
+        found = self.dependencies(encoded) if self.tracking else None
+        cause = None
+        if self.cache is not None and self.pipeline is None:
+            rule_1, rule_2, stalls = self.lookup(encoded)
+        else:
+            distances = self.sharing(encoded)
+            rule_1 = None
+            rule_2 = None
+            if 1 in distances:
+                rule_1 = classify_hazard(current=encoded, previous=self.encoded_ring[(num - 1) % self.size])
+            if 2 in distances:
+                rule_2 = classify_hazard(current=encoded, previous=self.encoded_ring[(num - 2) % self.size])
+            if self.pipeline is not None:
+                stalls = self.pipeline_stalls(encoded, found)
+                cause = self.cause
+            else:
+                stalls = rule_stalls(rule_1, rule_2, self.fwd)
+        if self.pipeline is None and (encoded[0] >= first_derived_opcode or num - self.derived_at <= self.size):
+            # derived opcodes in flight - their operands are timed from the stages of the classic pipeline
+            staged = self.staged_stalls(encoded)
+            if staged > stalls:
+                stalls = staged
+                cause = self.cause
+        if store is not None:
+            result = InstructionResult(num=num, rule_1=rule_1, rule_2=rule_2, stalls=stalls, opcode=encoded[0],
+                                       store=store, cause=cause)
+        else:
+            result = InstructionResult(num=num, item=item, previous_1=self.previous(1), previous_2=self.previous(2),
+                                       rule_1=rule_1, rule_2=rule_2, stalls=stalls, opcode=encoded[0], cause=cause)
+        if found is not None:
+            result.dependencies = tuple((kind, num - prev_num, cur_role, prev_role)
+                                        for kind, prev_num, cur_role, prev_role in found)
+        self.record(item, encoded, stalls=stalls)
+        return result
+
+    def lookup(self, encoded: tuple) -> tuple:
+        """
+        Hazards and stalls of the next instruction from the shape cache - classified and cached on a miss
+        :param encoded: encoded instruction
+        :return: (rule_1, rule_2, stalls)
+        """
+        num = self.count
+        previous_1 = self.encoded_ring[(num - 1) % self.size] if num >= 1 else None
+        previous_2 = self.encoded_ring[(num - 2) % self.size] if num >= 2 else None
+        entry = self.cache.get(previous_2, previous_1, encoded)
+        if entry is None:
+            rule_1 = classify_hazard(current=encoded, previous=previous_1) if previous_1 is not None else None
+            rule_2 = classify_hazard(current=encoded, previous=previous_2) if previous_2 is not None else None
+            entry = (rule_1, rule_2, (rule_stalls(rule_1, rule_2, 0), rule_stalls(rule_1, rule_2, 1)))
+            self.cache.put(previous_2, previous_1, encoded, entry)
+        return entry[0], entry[1], entry[2][self.fwd]
+
+    def pipeline_stalls(self, encoded: tuple, found: list) -> int:
+        """
+        Stall cycles of the next instruction from the tables of the compiled pipeline - every dependency on
+        the instructions of the window counts, the longest wait wins. What the instruction waits on longest is
+        left in self.cause, as in staged_stalls.
+        :param encoded: encoded instruction
+        :param found: dependencies of the instruction - see dependencies
+        :return: int
+        """
+        num = self.count
+        self.cause = None
+        if num == 0:
+            return 0
+        reach = self.pipeline.reach[self.fwd]
+        cur_op = encoded[0]
+        prev_op = self.encoded_ring[(num - 1) % self.size][0]
+        # right behind the previous instruction - it left Fetch the cycle before this one is fetched
+        stalls = self.pipeline.structural[prev_op][cur_op] - 1
+        if stalls > 0:
+            self.cause = ("structural", prev_op, 1)
+        if prev_op in branch_opcodes and self.branch_penalty > stalls:
+            stalls = self.branch_penalty
+            self.cause = ("branch", prev_op, 1)
+        for kind, prev_num, cur_role, prev_role in found:
+            dep_op = self.encoded_ring[prev_num % self.size][0]
+            cycles = reach.get((kind, dep_op, prev_role, cur_op, cur_role))
+            if cycles is not None and cycles - (self.next_issue - self.ready_ring[prev_num % self.size]) > stalls:
+                stalls = cycles - (self.next_issue - self.ready_ring[prev_num % self.size])
+                self.cause = (kind, dep_op, num - prev_num)
+        return max(stalls, 0)
+
+    def staged_stalls(self, encoded: tuple) -> int:
+        """
+        Stall cycles of the next instruction from the stages of the classic pipeline - for its dependencies
+        on or behind derived opcodes only, pairs of hand-written table opcodes are left to the table.
+        Only the last writer of a register and its readers since count, as in dependencies. What the
+        instruction waits on longest is left in self.cause.
+        :param encoded: encoded instruction
+        :return: int
+        """
+        num = self.count
+        reach = classic.reach[self.fwd]
+        cur_op = encoded[0]
+        cur_written, cur_read = operand_roles[cur_op]
+        # earliest cycle the instruction may leave Fetch
+        need = self.next_issue
+        # registers written by an instruction closer than the one looked at
+        shadowed = set()
+        self.cause = None
+        for distance in range(1, min(num, self.size) + 1):
+            slot = (num - distance) % self.size
+            previous = self.encoded_ring[slot]
+            prev_op = previous[0]
+            prev_written, prev_read = operand_roles[prev_op]
+            if prev_op >= first_derived_opcode or cur_op >= first_derived_opcode:
+                ready = self.ready_ring[slot]
+                if distance == 1:
+                    if ready + classic.structural[prev_op][cur_op] > need:
+                        need = ready + classic.structural[prev_op][cur_op]
+                        self.cause = ("structural", prev_op, distance)
+                    if prev_op in branch_opcodes and ready + 1 + self.branch_penalty > need:
+                        need = ready + 1 + self.branch_penalty
+                        self.cause = ("branch", prev_op, distance)
+                for kind, cur_roles, prev_roles in [(RAW, cur_read, prev_written), (WAW, cur_written, prev_written),
+                                                    (WAR, cur_written, prev_read)]:
+                    for cur_role in cur_roles:
+                        reg = encoded[cur_role]
+                        if reg in shadowed:
+                            continue
+                        for prev_role in prev_roles:
+                            if previous[prev_role] == reg:
+                                cycles = reach.get((kind, prev_op, prev_role, cur_op, cur_role))
+                                if cycles is not None and ready + cycles > need:
+                                    need = ready + cycles
+                                    self.cause = (kind, prev_op, distance)
+            shadowed.update(previous[role] for role in prev_written)
+        return need - self.next_issue
+
+    def run(self, instructions: Iterable[Instruction]) -> Iterator[InstructionResult]:
+        """
+        Analyse a stream of instructions
+        :param instructions: iterable of parsed commands
+        :return: generator of InstructionResult
+        """
+        for item in instructions:
+            yield self.step(item)
+
+    def run_store(self, store: InstructionStore) -> Iterator[InstructionResult]:
+        """
+        Analyse the instructions of a columnar store straight from its integer columns
+        :param store: InstructionStore
+        :return: generator of InstructionResult
+        """
+        opcode, rd, rs, rt = store.opcode, store.rd, store.rs, store.rt
+        for num in range(len(store)):
+            yield self.analyse(encoded=(opcode[num], rd[num], rs[num], rt[num]), store=store)
+
+
+class ForwardingComparison:
+    """
+    Stalls with the forwarding unit off and on out of a single traversal. Instructions are parsed and their
+    hazards classified once, by an engine with the forwarding unit off - the stalls with it on come from the
+    same rules and dependencies. Only the cycles the instructions leave Fetch differ between both, so the
+    forwarding side keeps its ring of those and nothing else.
+    """
+
+    def __init__(self, window: int = None, pipeline: Pipeline = None, cache: ShapeCache = None,
+                 branch_penalty: int = None):
+        """
+        :param window: see HazardEngine
+        :param pipeline: see HazardEngine
+        :param cache: see HazardEngine - it holds the stalls of both sides
+        :param branch_penalty: see HazardEngine
+        """
+        self.engine = HazardEngine(fwd_option="off", window=window, pipeline=pipeline, cache=cache,
+                                   branch_penalty=branch_penalty)
+        self.forwarded = HazardEngine(fwd_option="on", window=window, pipeline=pipeline,
+                                      branch_penalty=branch_penalty)
+        # no scoreboard on the forwarding side - the dependencies found by the other engine are used
+        self.forwarded.prefilter = False
+        self.forwarded.tracking = False
+
+    def analyse(self, encoded: tuple, item: Instruction = None, store: InstructionStore = None) -> InstructionResult:
+        """
+        Analyse the next instruction of the program from its encoding
+        :param encoded: encoded instruction - (opcode, rd, rs, rt)
+        :param item: Instruction, if already built
+        :param store: columnar store the instruction comes from, if any
+        :return: InstructionResult with stalls and stalls_fwd
+        """
+        forwarded = self.forwarded
+        num = forwarded.count
+        result = self.engine.analyse(encoded=encoded, item=item, store=store)
+        if forwarded.pipeline is not None:
+            found = [(kind, num - distance, cur_role, prev_role)
+                     for kind, distance, cur_role, prev_role in result.dependencies]
+            stalls = forwarded.pipeline_stalls(encoded, found)
+        else:
+            stalls = rule_stalls(result.rule_1, result.rule_2, 1)
+            if encoded[0] >= first_derived_opcode or num - forwarded.derived_at <= forwarded.size:
+                stalls = max(stalls, forwarded.staged_stalls(encoded))
+        forwarded.record(item, encoded, stalls=stalls)
+        result.stalls_fwd = stalls
+        return result
+
+    def run(self, instructions: Iterable[Instruction]) -> Iterator[InstructionResult]:
+        """
+        Analyse a stream of instructions
+        :param instructions: iterable of parsed commands
+        :return: generator of InstructionResult
+        """
+        for item in instructions:
+            yield self.analyse(encoded=encode_instruction(item), item=item)
+
+    def run_store(self, store: InstructionStore) -> Iterator[InstructionResult]:
+        """
+        Analyse the instructions of a columnar store straight from its integer columns
+        :param store: InstructionStore
+        :return: generator of InstructionResult
+        """
+        opcode, rd, rs, rt = store.opcode, store.rd, store.rs, store.rt
+        for num in range(len(store)):
+            yield self.analyse(encoded=(opcode[num], rd[num], rs[num], rt[num]), store=store)
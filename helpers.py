@@ -1,29 +1,28 @@
-import os
+import shutil
+import threading
 from math import floor
 from dataclasses import dataclass
 
-# Establish width to print outputs to screen - used for printing timing diagram
-width = os.get_terminal_size().columns
-# length of each pipeline section
-dash_length = floor(width / 31)
+# Width to print outputs to screen when it cannot be read e.g. stdout is not a terminal
+default_width = 236
 # Regex pattern
-offset_capture = "(.*)\((.*)\)"
+offset_capture = r"(.*)\((.*)\)"
 
 
 # Define a data class around Instruction
 @dataclass
 class Instruction:
-    # Opcode- ADD/SUB/LW/SW
+    # Opcode- see opcode_names
     opcode: str
-    # Destination Register (ADD/SUB) only
+    # Destination Register (ALU opcodes and ADDI) only
     rd: str = None
-    # Source Register (LW/SW) - Register #1 (ADD/SUB)
+    # Source Register (LW/SW) - Register #1 (ALU opcodes, ADDI, BEQ/BNE)
     rs: str = None
-    # Target Register (LW/SW) - Register #2 (ADD/SUB)
+    # Target Register (LW/SW) - Register #2 (ALU opcodes, BEQ/BNE)
     rt: str = None
-    # offset
+    # offset (LW/SW) - immediate (ADDI)
     offset: str = None
-    # memory address
+    # memory address - branch target (BEQ/BNE)
     address: str = None
     # raw original instruction
     raw: str = None
@@ -114,252 +113,407 @@ def present_values(step: str, item: Instruction) -> str:
         return ''
 
 
-def timing_step(stage: str) -> str:
+def terminal_width(fallback: int = default_width) -> int:
+    """
+    Establish width to print outputs to screen - looked up when a renderer needs it, never at import
+    :param fallback: width used when the terminal size cannot be read
+    :return: int
+    """
+    return shutil.get_terminal_size(fallback=(fallback, 24)).columns or fallback
+
+
+def section_length(width: int = None) -> int:
+    """
+    Length of each pipeline section of the timing diagram for a given width
+    :param width: screen width, the terminal width if not given
+    :return: int
+    """
+    if width is None:
+        width = terminal_width()
+    return floor(width / 31)
+
+
+def timing_step(stage: str, dash_length: int = None) -> str:
     """
     This function will be used to print the timing step for a given stage
     :param stage:
+    :param dash_length: length of each pipeline section - see section_length
     :return:
     """
+    if dash_length is None:
+        dash_length = section_length()
     step = (('-' * dash_length)[0:3] + stage + ('-' * dash_length)[4:7])
     return step
 
 
-def timing_sequence(step: str) -> None:
+def timing_sequence(step: str, dash_length: int = None) -> None:
     """
     Timing Sequence
     :param step:
+    :param dash_length: length of each pipeline section - see section_length
     :return:
     """
+    if dash_length is None:
+        dash_length = section_length()
     pattern = '|' + ((('-' * dash_length)[0:7] + step + ('-' * dash_length)[8:15]) + '|') * 11
     print(pattern)
 
 
-def detect_hazards_no_fwd(current: Instruction, previous: Instruction, prev_no: int) -> str:
+# Opcodes encoded as small ints
+OP_ADD = 0
+OP_SUB = 1
+OP_LW = 2
+OP_SW = 3
+OP_ADDI = 4
+OP_AND = 5
+OP_OR = 6
+OP_SLT = 7
+OP_BEQ = 8
+OP_BNE = 9
+OP_MUL = 10
+OP_DIV = 11
+opcode_names = ["ADD", "SUB", "LW", "SW", "ADDI", "AND", "OR", "SLT", "BEQ", "BNE", "MUL", "DIV"]
+opcode_ids = {name: op for op, name in enumerate(opcode_names)}
+# Opcodes from here on are not in the hand-written hazard table - their hazards are derived from their operand
+# roles, and their stalls from the stages their operands are read and written in (see pipeline.classic)
+first_derived_opcode = OP_ADDI
+branch_opcodes = {OP_BEQ, OP_BNE}
+# Number of general purpose registers
+register_count = 32
+# Register names accepted (upper case) - 'R0' to 'R31', '$0' to '$31' and the MIPS conventional names
+valid_registers = frozenset(
+    ["R{}".format(reg) for reg in range(register_count)] + ["${}".format(reg) for reg in range(register_count)] +
+    ["$ZERO", "$AT", "$GP", "$SP", "$FP", "$RA"] + ["$V{}".format(reg) for reg in range(2)] +
+    ["$A{}".format(reg) for reg in range(4)] + ["$T{}".format(reg) for reg in range(10)] +
+    ["$S{}".format(reg) for reg in range(8)] + ["$K{}".format(reg) for reg in range(2)])
+# Register names interned as small ints - filled in as new registers are seen
+register_names = []
+
+
+class RegisterTable(dict):
     """
-    Used to detect hazards for add and sub operations with no forwarding unit!
-    :param prev_no:
+    Register name -> small int, a new id is handed out the first time a name is looked up. Lookups only intern
+    valid register names, so the table stays bounded whatever the server is sent, and ids are handed out under
+    a lock - lookups of known names, the hot path, take none.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def __missing__(self, name: str) -> int:
+        if name not in valid_registers:
+            raise ValueError("Register {} not valid".format(name))
+        return self.intern(name)
+
+    def intern(self, name: str) -> int:
+        """
+        Id of a register name, handed out if new - the name is not checked
+        :param name: register name
+        :return: int
+        """
+        with self.lock:
+            # another thread may have interned it since the lookup
+            reg = self.get(name)
+            if reg is None:
+                # the name is in register_names before its id is handed out
+                register_names.append(name)
+                reg = self[name] = len(register_names) - 1
+            return reg
+
+
+register_ids = RegisterTable()
+# Missing register (e.g. rd of LW/SW)
+NO_REG = -1
+
+# Hazard kinds
+NO_HAZARD = 0
+RAW = 1
+WAR = 2
+WAW = 3
+hazard_names = {RAW: "RAW", WAR: "WAR", WAW: "WAW"}
+
+# Operand roles - positions within an encoded instruction (opcode, rd, rs, rt)
+RD = 1
+RS = 2
+RT = 3
+role_fields = {RD: "rd", RS: "rs", RT: "rt"}
+
+
+# Operand roles written and read per opcode
+operand_roles = {
+    OP_ADD: ((RD,), (RS, RT)),
+    OP_SUB: ((RD,), (RS, RT)),
+    OP_LW: ((RT,), (RS,)),
+    OP_SW: ((), (RS, RT)),
+    OP_ADDI: ((RD,), (RS,)),
+    OP_AND: ((RD,), (RS, RT)),
+    OP_OR: ((RD,), (RS, RT)),
+    OP_SLT: ((RD,), (RS, RT)),
+    OP_BEQ: ((), (RS, RT)),
+    OP_BNE: ((), (RS, RT)),
+    OP_MUL: ((RD,), (RS, RT)),
+    OP_DIV: ((RD,), (RS, RT)),
+}
+
+
+def register_id(name: str) -> int:
+    """
+    Intern a register name as a small int
+    :param name: register name e.g. 'R4'
+    :return: int
+    """
+    if name is None:
+        return NO_REG
+    reg = register_ids.get(name)
+    if reg is None:
+        # Instruction objects built by hand may use any name, as before registers were checked - the parser only
+        # hands out valid ones
+        reg = register_ids.intern(name)
+    return reg
+
+
+def register_name(reg: int) -> str:
+    """
+    Register name of an interned register
+    :param reg: int
+    :return: str
+    """
+    if reg == NO_REG:
+        return None
+    return register_names[reg]
+
+
+def encode_instruction(item: Instruction) -> tuple:
+    """
+    Encode an instruction as a tuple of small ints - (opcode, rd, rs, rt)
+    :param item: Instruction
+    :return: tuple
+    """
+    return opcode_ids[item.opcode], register_id(item.rd), register_id(item.rs), register_id(item.rt)
+
+
+# Message templates - only rendered when the hazard is printed
+input_war_template = ("[WAR HAZARD] Instruction [{current}] Destination Register {cur_reg} depends on "
+                      "Instruction#{prev_no} [{previous}] Input Register {prev_reg}")
+input_raw_template = ("[RAW HAZARD] Instruction [{current}] Input Register {cur_reg} depends on "
+                      "Instruction#{prev_no} [{previous}] Destination Register {prev_reg}")
+same_target_template = "[WAW HAZARD] - Same target register {cur_reg} used for instructions [{current}] and [{previous}]"
+memory_template = ("[{kind} HAZARD] Instruction [{current}] Register Memory Location {cur_reg} depends on "
+                   "Instruction#{prev_no} Instruction [{previous}] Destination Register {prev_reg}")
+dependency_template = ("[{kind} DEPENDENCY] Instruction [{current}] Register {cur_reg} depends on "
+                       "Instruction#{prev_no} ({distance} instructions back)")
+
+
+# Define a data class around a single row of the hazard table
+@dataclass(frozen=True)
+class HazardRule:
+    # RAW/WAR/WAW
+    kind: int
+    # operand role of the current instruction compared
+    cur_role: int
+    # operand role of the previous instruction compared
+    prev_role: int
+    # message template
+    template: str
+    # operand roles printed in the message
+    msg_cur_role: int
+    msg_prev_role: int
+    # stall stages - stalls[fwd][distance - 1] with fwd 0 (off) or 1 (on)
+    stalls: tuple = ((0, 0), (0, 0))
+    # derived from operand roles - stall cycles then come from the stages of the opcodes, not from `stalls`
+    derived: bool = False
+
+
+# Stall stages per (kind, previous opcode class, current opcode class) -
+# ((no forwarding at distance 1, distance 2), (forwarding at distance 1, distance 2))
+ALU = (OP_ADD, OP_SUB)
+stall_rules = {
+    # WAR
+    (WAR, (OP_SW,), (OP_LW,)): ((1, 1), (1, 0)),
+    (WAR, ALU, ALU): ((2, 2), (0, 0)),
+    (WAR, ALU, (OP_LW,)): ((2, 2), (0, 0)),
+    # RAW
+    (RAW, ALU, ALU): ((2, 1), (0, 0)),
+    (RAW, (OP_SW,), (OP_LW,)): ((1, 0), (0, 0)),
+    (RAW, (OP_LW,), (OP_SW,)): ((2, 1), (1, 0)),
+    (RAW, ALU, (OP_SW,)): ((2, 2), (0, 0)),
+    (RAW, (OP_LW,), ALU): ((2, 2), (1, 0)),
+    # WAW
+    (WAW, ALU, ALU): ((2, 2), (0, 0)),
+    (WAW, (OP_LW,), (OP_LW,)): ((1, 1), (1, 0)),
+    (WAW, ALU, (OP_LW,)): ((2, 2), (0, 0)),
+    (WAW, (OP_LW,), ALU): ((2, 2), (0, 0)),
+}
+# (kind, previous opcode, current opcode) -> stalls
+stall_table = {}
+for (_kind, _prev_ops, _cur_ops), _stalls in stall_rules.items():
+    for _prev_op in _prev_ops:
+        for _cur_op in _cur_ops:
+            stall_table[(_kind, _prev_op, _cur_op)] = _stalls
+
+# Hazard rules per (previous opcode class, current opcode class), first match wins -
+# (kind, current role, previous role, template, current role printed, previous role printed)
+hazard_rules = {
+    (ALU, ALU): [
+        (WAR, RD, RS, input_war_template, RD, RS),
+        (WAR, RD, RT, input_war_template, RD, RT),
+        (RAW, RS, RD, input_raw_template, RS, RD),
+        (RAW, RT, RD, input_raw_template, RT, RD),
+        (WAW, RD, RD, same_target_template, RD, RD),
+    ],
+    ((OP_LW,), (OP_SW,)): [
+        (RAW, RS, RT, memory_template, RS, RT),
+        (RAW, RT, RT, memory_template, RS, RT),
+    ],
+    ((OP_SW,), (OP_LW,)): [
+        (WAR, RT, RT, memory_template, RT, RT),
+        (RAW, RT, RS, memory_template, RT, RT),
+    ],
+    ((OP_LW,), (OP_LW,)): [
+        (WAW, RT, RT, memory_template, RT, RT),
+    ],
+    (ALU, (OP_LW,)): [
+        (WAW, RT, RD, memory_template, RT, RD),
+        (WAR, RT, RS, memory_template, RT, RS),
+        (WAR, RT, RT, memory_template, RT, RT),
+    ],
+    (ALU, (OP_SW,)): [
+        (RAW, RS, RD, memory_template, RS, RD),
+    ],
+    ((OP_LW,), ALU): [
+        (RAW, RS, RT, memory_template, RS, RT),
+        (RAW, RT, RT, memory_template, RT, RT),
+        (WAW, RD, RT, memory_template, RD, RT),
+    ],
+}
+# hazard_table[previous opcode][current opcode] -> tuple of HazardRule
+hazard_table = [[() for _ in opcode_ids] for _ in opcode_ids]
+for (_prev_ops, _cur_ops), _rules in hazard_rules.items():
+    for _prev_op in _prev_ops:
+        for _cur_op in _cur_ops:
+            hazard_table[_prev_op][_cur_op] = tuple(
+                HazardRule(*_rule, stalls=stall_table[(_rule[0], _prev_op, _cur_op)]) for _rule in _rules)
+# Pairs with a derived opcode - every register one of them writes and the other one reads or writes, RAW first,
+# then WAW and WAR
+for _prev_op in range(len(opcode_names)):
+    _prev_written, _prev_read = operand_roles[_prev_op]
+    for _cur_op in range(first_derived_opcode if _prev_op < first_derived_opcode else 0, len(opcode_names)):
+        _cur_written, _cur_read = operand_roles[_cur_op]
+        hazard_table[_prev_op][_cur_op] = tuple(
+            HazardRule(_kind, _cur_role, _prev_role, _template, _cur_role, _prev_role, derived=True)
+            for _kind, _template, _cur_roles, _prev_roles in [(RAW, input_raw_template, _cur_read, _prev_written),
+                                                              (WAW, same_target_template, _cur_written, _prev_written),
+                                                              (WAR, input_war_template, _cur_written, _prev_read)]
+            for _cur_role in _cur_roles for _prev_role in _prev_roles)
+
+
+def classify_hazard(current: tuple, previous: tuple) -> HazardRule:
+    """
+    Look up the hazard between two encoded instructions - no message is built
+    :param current: encoded current instruction
+    :param previous: encoded previous instruction
+    :return: HazardRule or None
+    """
+    for rule in hazard_table[previous[0]][current[0]]:
+        if current[rule.cur_role] == previous[rule.prev_role]:
+            return rule
+    return None
+
+
+def render_hazard(rule: HazardRule, current: Instruction, previous: Instruction, prev_no: int) -> str:
+    """
+    Render the message of a hazard found by classify_hazard
+    :param rule: HazardRule
     :param current:
     :param previous:
+    :param prev_no:
     :return: str
     """
-    if current.opcode in ["ADD", "SUB"] and previous.opcode in ["ADD", "SUB"]:
-        if current.rd == previous.rs:
-            tmp = ("[WAR HAZARD] Instruction [{}] Destination Register {} depends on Instruction#{} [{}] "
-                   "Input Register {}").format(
-                current.raw, current.rd, prev_no + 1, previous.raw, previous.rs)
-        elif current.rd == previous.rt:
-            tmp = ("[WAR HAZARD] Instruction [{}] Destination Register {} depends on Instruction#{} [{}] "
-                   "Input Register {}").format(
-                current.raw, current.rd, prev_no + 1, previous.raw, previous.rt)
-        # RAW hazard
-        elif current.rs == previous.rd:
-            tmp = ("[RAW HAZARD] Instruction [{}] Input Register {} depends on Instruction#{} [{}] "
-                   "Destination Register {}").format(
-                current.raw, current.rs, prev_no + 1, previous.raw, previous.rd)
-        elif current.rt == previous.rd:
-            tmp = ("[RAW HAZARD] Instruction [{}] Input Register {} depends on Instruction#{} [{}] "
-                   "Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rd)
-        # WAW hazard
-        elif current.rd == previous.rd:
-            tmp = "[WAW HAZARD] - Same target register {} used for instructions [{}] and [{}]".format(
-                current.rd, current.raw, previous.raw)
-        else:
-            tmp = ''
-        return tmp
-    if current.opcode in ["SW"] and previous.opcode in ["LW"]:
-        # RAW hazard
-        if current.rs == previous.rt:
-            tmp = ("[RAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rs, prev_no + 1, previous.raw, previous.rt)
-        elif current.rt == previous.rt:
-            tmp = ("[RAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rs, prev_no + 1, previous.raw, previous.rt)
-        else:
-            tmp = ''
-        return tmp
-    if current.opcode in ["LW"] and previous.opcode in ["SW"]:
-        # WAR hazard
-        if current.rt == previous.rt:
-            tmp = ("[WAR HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rt)
-        # RAW hazard
-        elif current.rt == previous.rs:
-            tmp = ("[RAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rt)
-        else:
-            tmp = ''
-        return tmp
-    if current.opcode in ["LW"] and previous.opcode in ["LW"]:
-        # WAR hazard
-        if current.rt == previous.rt:
-            tmp = ("[WAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rt)
-        else:
-            tmp = ''
-        return tmp
-    if current.opcode in ["LW"] and previous.opcode in ["ADD", "SUB"]:
-        # WAW hazard
-        if current.rt == previous.rd:
-            tmp = ("[WAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rd)
-        elif current.rt == previous.rs:
-            tmp = (
-                "[WAR HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                "{}]"
-                " Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rs)
-        elif current.rt == previous.rt:
-            tmp = (
-                "[WAR HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                "{}]"
-                " Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rt)
-        else:
-            tmp = ''
-        return tmp
-    if current.opcode in ["SW"] and previous.opcode in ["ADD", "SUB"]:
-        # WAR hazard
-        if current.rs == previous.rd:
-            tmp = ("[RAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rs, prev_no + 1, previous.raw, previous.rd)
-        else:
-            tmp = ''
-        return tmp
-    if current.opcode in ["ADD", "SUB"] and previous.opcode == "LW":
-        if current.rs == previous.rt:
-            tmp = ("[RAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rs, prev_no + 1, previous.raw, previous.rt)
-        elif current.rt == previous.rt:
-            tmp = ("[RAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rt, prev_no + 1, previous.raw, previous.rt)
-        elif current.rd == previous.rt:
-            tmp = ("[WAW HAZARD] Instruction [{}] Register Memory Location {} depends on Instruction#{} Instruction ["
-                   "{}]"
-                   " Destination Register {}").format(
-                current.raw, current.rd, prev_no + 1, previous.raw, previous.rt)
-        else:
-            tmp = ''
-        return tmp
-    else:
+    if rule is None:
         return ''
+    return rule.template.format(
+        kind=hazard_names[rule.kind],
+        current=current.raw,
+        cur_reg=getattr(current, role_fields[rule.msg_cur_role]),
+        prev_no=prev_no + 1,
+        previous=previous.raw,
+        prev_reg=getattr(previous, role_fields[rule.msg_prev_role]))
 
 
-def stall_helper_no_fwd(current: Instruction, previous: Instruction, hazard: str, pipeline_stages: list, run: int):
+def render_dependency(kind: int, current: Instruction, cur_role: int, prev_no: int, distance: int) -> str:
+    """
+    Render the message of a dependency further back than the hazard table looks
+    :param kind: RAW, WAR or WAW
+    :param current:
+    :param cur_role: role of the register of the current instruction
+    :param prev_no:
+    :param distance: how many instructions back the previous instruction is
+    :return: str
+    """
+    return dependency_template.format(kind=hazard_names[kind], current=current.raw,
+                                      cur_reg=getattr(current, role_fields[cur_role]), prev_no=prev_no + 1,
+                                      distance=distance)
+
+
+def hazard_kind(hazard: str) -> int:
+    """
+    Hazard kind of a rendered message
+    :param hazard:
+    :return: int
+    """
     if hazard.find("WAR HAZARD") > 0:
-        # this is applicable only for LW and SW
-        if current.opcode == "LW" and previous.opcode == "SW":
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        # this is applicable only ADD,SUB and ADD/SUB - won't be present if forwarding unit present
-        if current.opcode in ["ADD", "SUB"] and previous.opcode in ["ADD", "SUB"]:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        # this is applicable only LW and ADD/SUB
-        if current.opcode in ["LW"] and previous.opcode in ["ADD", "SUB"]:
-            # insert a single stage ** with forwarding only 1 stall ** if hazard_2 with forwarding no stall
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
+        return WAR
     elif hazard.find("RAW HAZARD") > 0:
-        # this is applicable only ADD,SUB and ADD/SUB - won't be present if forwarding unit present
-        if current.opcode in ["ADD", "SUB"] and previous.opcode in ["ADD", "SUB"] and run == 1:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        # this is applicable only ADD,SUB and ADD/SUB - won't be present if forwarding unit present
-        if current.opcode in ["ADD", "SUB"] and previous.opcode in ["ADD", "SUB"] and run == 2:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-
-        # this is applicable only for LW and SW
-        if current.opcode == "LW" and previous.opcode == "SW" and run == 1:
-            # only for just previous step
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        if current.opcode == "SW" and previous.opcode == "LW" and run == 1:
-            # only for just previous step
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage --
-            pipeline_stages.insert(1, stall_stage)
-        if current.opcode == "SW" and previous.opcode == "LW" and run == 2:
-            # only for just previous step
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        if current.opcode == "SW" and previous.opcode in ["ADD", "SUB"]:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        if current.opcode in ["ADD", "SUB"] and previous.opcode == "LW":
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
+        return RAW
     elif hazard.find("WAW HAZARD") > 0:
-        # this is applicable only ADD,SUB and ADD/SUB - won't be present if forwarding unit present
-        if current.opcode in ["ADD", "SUB"] and previous.opcode in ["ADD", "SUB"]:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        # this is applicable only for LW and SW
-        if current.opcode == "LW" and previous.opcode == "LW":
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        # this is applicable only for LW and SW
-        if current.opcode == "LW" and previous.opcode in ["ADD", "SUB"]:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        if current.opcode in ["ADD", "SUB"] and previous.opcode == "LW":
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
+        return WAW
+    else:
+        return NO_HAZARD
+
+
+def detect_hazards_no_fwd(current: Instruction, previous: Instruction, prev_no: int) -> str:
+    """
+    Used to detect hazards for add and sub operations with no forwarding unit!
+    :param prev_no:
+    :param current:
+    :param previous:
+    :return: str
+    """
+    rule = classify_hazard(current=encode_instruction(current), previous=encode_instruction(previous))
+    return render_hazard(rule=rule, current=current, previous=previous, prev_no=prev_no)
+
+
+def stall_count(fwd: int, kind: int, current_op: int, previous_op: int, run: int) -> int:
+    """
+    Number of stall stages for a hazard
+    :param fwd: 0 without forwarding unit, 1 with forwarding unit
+    :param kind: RAW/WAR/WAW
+    :param current_op: opcode of the current instruction
+    :param previous_op: opcode of the previous instruction
+    :param run: distance between both instructions - 1 or 2
+    :return: int
+    """
+    stalls = stall_table.get((kind, previous_op, current_op))
+    if stalls is None:
+        return 0
+    return stalls[fwd][run - 1]
+
+
+def stall_helper_no_fwd(current: Instruction, previous: Instruction, hazard: str, pipeline_stages: list, run: int):
+    stalls = stall_count(fwd=0, kind=hazard_kind(hazard), current_op=opcode_ids[current.opcode],
+                         previous_op=opcode_ids[previous.opcode], run=run)
+    for _ in range(stalls):
+        # insert a single stage
+        pipeline_stages.insert(1, stall_stage)
 
 
 def stall_helper_fwd(current: Instruction, previous: Instruction, hazard: str, pipeline_stages: list, run: int):
-    if hazard.find("WAR HAZARD") > 0:
-        # this is applicable only for LW and SW
-        if current.opcode == "LW" and previous.opcode == "SW" and run == 1:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-    elif hazard.find("RAW HAZARD") > 0:
-        if current.opcode in ["ADD", "SUB"] and previous.opcode == "LW" and run == 1:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-        if current.opcode == "SW" and previous.opcode == "LW" and run == 1:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
-    elif hazard.find("WAW HAZARD") > 0:
-        # this is applicable only for LW and SW
-        if current.opcode == "LW" and previous.opcode == "LW" and run == 1:
-            # insert a single stage
-            pipeline_stages.insert(1, stall_stage)
+    stalls = stall_count(fwd=1, kind=hazard_kind(hazard), current_op=opcode_ids[current.opcode],
+                         previous_op=opcode_ids[previous.opcode], run=run)
+    for _ in range(stalls):
+        # insert a single stage
+        pipeline_stages.insert(1, stall_stage)
 
 
 def pipeline_modifier(
@@ -389,3 +543,35 @@ def pipeline_modifier(
                              hazard=hazard_1, pipeline_stages=pipeline_stages, run=1)
         else:
             pass
+
+
+def count_stalls(
+        fwd_option: str,
+        current: Instruction,
+        previous_1: Instruction,
+        hazard_1: str = None,
+        hazard_2: str = None,
+        previous_2: Instruction = None,
+) -> int:
+    """
+    Number of stall stages pipeline_modifier would insert for the current instruction
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :param current:
+    :param previous_1:
+    :param hazard_1:
+    :param hazard_2:
+    :param previous_2:
+    :return: int
+    """
+    # stall helpers only ever insert stall stages - count them on a scratch list
+    pipeline_stages = []
+    pipeline_modifier(
+        fwd_option=fwd_option,
+        current=current,
+        pipeline_stages=pipeline_stages,
+        previous_1=previous_1,
+        hazard_1=hazard_1,
+        hazard_2=hazard_2,
+        previous_2=previous_2
+    )
+    return len(pipeline_stages)
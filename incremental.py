@@ -0,0 +1,211 @@
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List
+from build import parse_mips_line
+from engine import HazardEngine
+from engine import InstructionResult
+from helpers import Instruction
+from helpers import first_derived_opcode
+from helpers import opcode_ids
+from pipeline import classic
+from timing import InstructionTiming
+from timing import TimingSummary
+from timing import instruction_timing
+from timing import stages
+
+# Hazards are looked up at distance 1 and 2 - an edit at i changes the hazards of i, i + 1 and i + 2 only
+window = 2
+# Derived opcodes are timed from the stages of the classic pipeline - their stalls reach this far, and move
+# with the stalls of the instructions before
+reach = classic.depth
+
+
+# Define a data class around what an edit changed
+@dataclass
+class EditOutcome:
+    # instructions [start, end) had their hazards and stalls recomputed
+    start: int
+    end: int
+    # change of the total stall cycles - every instruction from `end` on is pushed back by this many cycles
+    # (plus one per inserted / minus one per deleted instruction)
+    stall_delta: int
+
+
+class IncrementalAnalysis:
+    """
+    Hazards and timing of a program kept up to date across edits. An edit only recomputes the hazards of the
+    edited instruction and of the two after it - the cached results of every other instruction are reused.
+    Timing is derived from the stall cycles on demand: prefix sums are only recomputed from the edit onward,
+    and only as far as they are asked for.
+    Around derived opcodes an edit reaches further - see HazardEngine.staged_stalls - so recomputing goes on
+    as long as stalls keep changing within their reach.
+    """
+
+    def __init__(self, instructions: Iterable = (), fwd_option: str = "off"):
+        """
+        :param instructions: Instruction or raw command per instruction
+        :param fwd_option: forwarding unit 'on' or 'off'
+        """
+        self.fwd_option = fwd_option
+        self.instructions: List[Instruction] = [self.parse(item) for item in instructions]
+        # (rule_1, rule_2, stalls) per instruction
+        self.hazards: List[tuple] = []
+        engine = HazardEngine(fwd_option=fwd_option)
+        for item in self.instructions:
+            result = engine.step(item)
+            self.hazards.append((result.rule_1, result.rule_2, result.stalls))
+        self.total_stalls = sum(stalls for _, _, stalls in self.hazards)
+        # stall cycles before each instruction - valid for the first len(self.stalls_before) instructions
+        self.stalls_before: List[int] = []
+
+    @staticmethod
+    def parse(item) -> Instruction:
+        return parse_mips_line(item) if isinstance(item, str) else item
+
+    def __len__(self) -> int:
+        return len(self.instructions)
+
+    def derived(self, num: int) -> bool:
+        """
+        Whether an instruction with a derived opcode is within reach of the instruction at num, or is it
+        :param num: position of the instruction
+        :return: bool
+        """
+        return any(opcode_ids[item.opcode] >= first_derived_opcode
+                   for item in self.instructions[max(num - reach, 0):num + 1])
+
+    def analyse(self, num: int) -> tuple:
+        """
+        Hazards and stalls of the instruction at num against the two before it - and against every
+        instruction within reach when derived opcodes are around
+        :param num: position of the instruction
+        :return: (rule_1, rule_2, stalls)
+        """
+        engine = HazardEngine(fwd_option=self.fwd_option, window=window)
+        start = max(num - (reach if self.derived(num) else window), 0)
+        engine.resume(num=num, previous=self.instructions[start:num],
+                      stalls=[stalls for _, _, stalls in self.hazards[start:num]])
+        result = engine.step(self.instructions[num])
+        return result.rule_1, result.rule_2, result.stalls
+
+    def refresh(self, start: int, derived: bool = False) -> EditOutcome:
+        """
+        Recompute the hazards of the instructions an edit at start can reach
+        :param start: position of the edit
+        :param derived: whether the edit added or removed a derived opcode
+        :return: EditOutcome
+        """
+        end = min(start + (reach if derived else window) + 1, len(self.instructions))
+        delta = 0
+        # position of the last instruction whose stalls (or the instruction itself) changed
+        changed = start
+        num = start
+        while num < end or (num < len(self.instructions) and num - changed <= reach and self.derived(num)):
+            hazards = self.analyse(num)
+            if hazards[2] != self.hazards[num][2]:
+                changed = num
+            delta += hazards[2] - self.hazards[num][2]
+            self.hazards[num] = hazards
+            num += 1
+        end = num
+        self.total_stalls += delta
+        # stall cycles before start are untouched
+        del self.stalls_before[start + 1:]
+        return EditOutcome(start=start, end=end, stall_delta=delta)
+
+    def insert(self, index: int, item) -> EditOutcome:
+        """
+        Insert an instruction before position index
+        :param index: position of the new instruction
+        :param item: Instruction or raw command
+        :return: EditOutcome
+        """
+        if not 0 <= index <= len(self.instructions):
+            raise IndexError("insert position {} out of range".format(index))
+        item = self.parse(item)
+        self.instructions.insert(index, item)
+        self.hazards.insert(index, (None, None, 0))
+        return self.refresh(index, derived=opcode_ids[item.opcode] >= first_derived_opcode)
+
+    def delete(self, index: int) -> EditOutcome:
+        """
+        Delete the instruction at position index
+        :param index: position of the instruction
+        :return: EditOutcome
+        """
+        if not 0 <= index < len(self.instructions):
+            raise IndexError("delete position {} out of range".format(index))
+        removed_op = opcode_ids[self.instructions.pop(index).opcode]
+        removed = self.hazards.pop(index)[2]
+        self.total_stalls -= removed
+        outcome = self.refresh(index, derived=removed_op >= first_derived_opcode)
+        outcome.stall_delta -= removed
+        return outcome
+
+    def replace(self, index: int, item) -> EditOutcome:
+        """
+        Replace the instruction at position index
+        :param index: position of the instruction
+        :param item: Instruction or raw command
+        :return: EditOutcome
+        """
+        if not 0 <= index < len(self.instructions):
+            raise IndexError("replace position {} out of range".format(index))
+        previous_op = opcode_ids[self.instructions[index].opcode]
+        self.instructions[index] = self.parse(item)
+        derived = max(previous_op, opcode_ids[self.instructions[index].opcode]) >= first_derived_opcode
+        return self.refresh(index, derived=derived)
+
+    def result(self, num: int) -> InstructionResult:
+        """
+        Hazards of the instruction at num - messages are rendered with its current position
+        :param num: position of the instruction
+        :return: InstructionResult
+        """
+        rule_1, rule_2, stalls = self.hazards[num]
+        return InstructionResult(num=num, item=self.instructions[num],
+                                 previous_1=self.instructions[num - 1] if num >= 1 else None,
+                                 previous_2=self.instructions[num - 2] if num >= 2 else None,
+                                 rule_1=rule_1, rule_2=rule_2, stalls=stalls)
+
+    def timing(self, num: int) -> InstructionTiming:
+        """
+        Timing of the instruction at num - each instruction is fetched in the cycle the one before is decoded
+        :param num: position of the instruction
+        :return: InstructionTiming
+        """
+        if num < 0 or num >= len(self.instructions):
+            raise IndexError("instruction {} out of range".format(num))
+        stalls_before = self.stalls_before
+        if not stalls_before:
+            stalls_before.append(0)
+        while len(stalls_before) <= num:
+            last = len(stalls_before) - 1
+            stalls_before.append(stalls_before[last] + self.hazards[last][2])
+        opcode = opcode_ids[self.instructions[num].opcode]
+        if opcode >= first_derived_opcode:
+            return instruction_timing(num=num, issue=num + stalls_before[num] + 1, stalls=self.hazards[num][2],
+                                      offsets=classic.offsets[opcode], steps=classic.steps[opcode])
+        return instruction_timing(num=num, issue=num + stalls_before[num] + 1, stalls=self.hazards[num][2])
+
+    def results(self) -> Iterator[InstructionResult]:
+        for num in range(len(self.instructions)):
+            yield self.result(num)
+
+    def timings(self) -> Iterator[InstructionTiming]:
+        for num in range(len(self.instructions)):
+            yield self.timing(num)
+
+    @property
+    def summary(self) -> TimingSummary:
+        """
+        Total cycles, stalls and CPI - kept up to date by every edit, no pass over the program
+        :return: TimingSummary
+        """
+        summary = TimingSummary(instructions=len(self.instructions), stalls=self.total_stalls)
+        if self.instructions:
+            # the last instruction is fetched after every earlier one and every stall
+            summary.cycles = len(self.instructions) + self.total_stalls + len(stages) - 1
+            opcode = opcode_ids[self.instructions[-1].opcode]
+            if opcode >= first_derived_opcode:
+                summary.cycles += classic.offsets[opcode][-1] - (len(stages) - 1)
+        return summary
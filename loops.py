@@ -0,0 +1,175 @@
+from dataclasses import dataclass
+from typing import Iterator, List, Sequence
+from engine import HazardEngine
+from engine import InstructionResult
+from helpers import encode_instruction
+from pipeline import Pipeline
+from store import InstructionStore
+from timing import TimingModel
+
+# Longest loop body looked for, in instructions
+max_body = 256
+# Fewest back-to-back iterations a repeated sequence needs to be summarized as a loop
+min_iterations = 3
+
+
+# Define a data class around a repeated sequence of a trace
+@dataclass
+class LoopSegment:
+    # position of the first instruction of the first iteration
+    start: int
+    # number of instructions per iteration
+    length: int
+    # number of back-to-back iterations
+    iterations: int
+
+
+# Define a data class around the analysis of a loop
+@dataclass
+class LoopSummary:
+    segment: LoopSegment
+    # results of the first iteration, and of the last one walked through - in steady state
+    first: List[InstructionResult]
+    steady: List[InstructionResult]
+    # iterations walked through the engine, the others repeat the steady one
+    analysed: int
+
+    @property
+    def first_stalls(self) -> int:
+        return sum(result.stalls for result in self.first)
+
+    @property
+    def steady_stalls(self) -> int:
+        return sum(result.stalls for result in self.steady)
+
+    @property
+    def cycles_per_iteration(self) -> int:
+        """
+        Cycles between the fetch of two iterations in steady state
+        :return: int
+        """
+        return self.segment.length + self.steady_stalls
+
+    @property
+    def boundary(self) -> List[InstructionResult]:
+        """
+        Results of the steady iteration with a hazard or dependency on the iteration before
+        :return: list of InstructionResult
+        """
+        found = []
+        for position, result in enumerate(self.steady):
+            distances = [1] * (result.rule_1 is not None) + [2] * (result.rule_2 is not None)
+            distances += [distance for _, distance, _, _ in result.dependencies or ()]
+            if any(distance > position for distance in distances):
+                found.append(result)
+        return found
+
+
+def encode_program(instructions: Sequence) -> List[tuple]:
+    """
+    Encoded instructions of a program - straight from the integer columns of a store
+    :param instructions: list of Instruction or InstructionStore
+    :return: list of (opcode, rd, rs, rt)
+    """
+    if isinstance(instructions, InstructionStore):
+        return list(zip(instructions.opcode, instructions.rd, instructions.rs, instructions.rt))
+    return [encode_instruction(item) for item in instructions]
+
+
+def find_loops(encoded: List[tuple], longest: int = max_body, fewest: int = min_iterations) -> List[LoopSegment]:
+    """
+    Back-to-back repetitions of the same instruction sequence, scanning the trace once from the start - the
+    shortest body repeating at a position wins. Instructions are compared on their encoding, so offsets may
+    change from one iteration to the next.
+    :param encoded: encoded instructions of the trace
+    :param longest: longest body looked for
+    :param fewest: fewest iterations of a loop
+    :return: list of LoopSegment, in trace order
+    """
+    # position of the next instruction with the same encoding - the only places a body can start again
+    following = [None] * len(encoded)
+    seen = {}
+    for num in range(len(encoded) - 1, -1, -1):
+        following[num] = seen.get(encoded[num])
+        seen[encoded[num]] = num
+    loops = []
+    num = 0
+    while num < len(encoded):
+        found = None
+        candidate = following[num]
+        while candidate is not None and candidate - num <= longest:
+            length = candidate - num
+            body = encoded[num:candidate]
+            if num + fewest * length <= len(encoded) and encoded[candidate:candidate + length] == body:
+                iterations = 2
+                while encoded[num + iterations * length:num + (iterations + 1) * length] == body:
+                    iterations += 1
+                if iterations >= fewest:
+                    found = LoopSegment(start=num, length=length, iterations=iterations)
+                    break
+            candidate = following[candidate]
+        if found is None:
+            num += 1
+        else:
+            loops.append(found)
+            num += found.length * found.iterations
+    return loops
+
+
+def analyse_loops(instructions: Sequence, fwd_option: str = "off", pipeline: Pipeline = None, window: int = None,
+                  model: TimingModel = None, longest: int = max_body, fewest: int = min_iterations,
+                  branch_penalty: int = None) -> Iterator:
+    """
+    Analyse a trace a loop body at a time instead of an instruction at a time. Iterations go through the
+    engine until the last ones are identical over the whole window - from there every iteration sees the same
+    instructions before it, so the rest repeat the last one and are only added to the timing model.
+    :param instructions: list of Instruction or InstructionStore
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :param pipeline: compiled pipeline description, the 5-stage table if not given
+    :param window: number of previous instructions dependencies are tracked over
+    :param model: TimingModel the cycles are added to
+    :param longest: longest body looked for
+    :param fewest: fewest iterations of a loop
+    :param branch_penalty: cycles the instruction after a branch waits, see HazardEngine
+    :return: generator of InstructionResult for instructions outside loops, and LoopSummary per loop
+    """
+    engine = HazardEngine(fwd_option=fwd_option, window=window, pipeline=pipeline, branch_penalty=branch_penalty)
+    model = model if model is not None else TimingModel(pipeline=pipeline)
+    # instructions not walked through the engine - added to the position of every later result
+    skipped = 0
+
+    def step(num: int) -> InstructionResult:
+        result = engine.step(instructions[num])
+        result.num += skipped
+        model.step(stalls=result.stalls, opcode=result.opcode)
+        return result
+
+    num = 0
+    for segment in find_loops(encode_program(instructions), longest=longest, fewest=fewest):
+        while num < segment.start:
+            yield step(num)
+            num += 1
+        # iterations that must match before the state entering the next one is the same
+        settle = -(-engine.size // segment.length) + 1
+        first = None
+        recent = []
+        analysed = 0
+        while analysed < segment.iterations:
+            start = segment.start + analysed * segment.length
+            results = [step(position) for position in range(start, start + segment.length)]
+            first = first or results
+            analysed += 1
+            shape = [(result.rule_1, result.rule_2, result.stalls, result.dependencies) for result in results]
+            recent = (recent + [(shape, results)])[-settle:]
+            if len(recent) == settle and all(other == shape for other, _ in recent):
+                break
+        steady = recent[-1][1]
+        remaining = segment.iterations - analysed
+        model.advance(instructions=remaining * segment.length,
+                      stalls=remaining * sum(result.stalls for result in steady))
+        skipped += remaining * segment.length
+        num = segment.start + segment.length * segment.iterations
+        yield LoopSummary(segment=segment, first=first, steady=steady, analysed=analysed)
+    while num < len(instructions):
+        yield step(num)
+        num += 1
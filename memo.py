@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from helpers import NO_REG
+
+
+# Define a data class around the hit/miss counters of a shape cache
+@dataclass
+class ShapeCacheStats:
+    # shapes held / most shapes held
+    size: int = 0
+    maxsize: int = 0
+    # lookups answered from memory / classified
+    hits: int = 0
+    misses: int = 0
+    # shapes dropped to make room
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Share of lookups answered from memory
+        :return: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def shape_key(previous_2: tuple, previous_1: tuple, current: tuple) -> tuple:
+    """
+    Canonical shape of three consecutive encoded instructions - opcodes, and registers renumbered in order of
+    first appearance. Hazards and stalls only depend on which registers are the same, so 'ADD R1, R2, R3' after
+    'LW R2, 0(R4)' has the same shape as 'ADD R5, R6, R7' after 'LW R6, 0(R8)'.
+    :param previous_2: encoded instruction at num - 2, None if out of the program
+    :param previous_1: encoded instruction at num - 1, None if out of the program
+    :param current: encoded instruction at num
+    :return: tuple
+    """
+    names = {NO_REG: NO_REG}
+    key = []
+    for encoded in (previous_2, previous_1, current):
+        if encoded is None:
+            key.append(None)
+            continue
+        key.append(encoded[0])
+        for reg in encoded[1:]:
+            renamed = names.get(reg)
+            if renamed is None:
+                renamed = names[reg] = len(names)
+            key.append(renamed)
+    return tuple(key)
+
+
+class ShapeCache:
+    """
+    Least recently used cache of (rule_1, rule_2, stalls) per instruction shape - a loop body analysed once is
+    looked up on every later iteration instead of classified again. Stalls are held for the forwarding unit
+    off and on, so one cache can serve both.
+    Renumbering registers costs more than classifying, so the exact triples last seen are looked up first and
+    the shape is only computed when they miss. Hits on exact triples do not refresh the shape they belong to.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        """
+        :param maxsize: number of shapes held - and of exact triples, which are dropped all at once when full
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1, got {}".format(maxsize))
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.exact = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, previous_2: tuple, previous_1: tuple, current: tuple):
+        """
+        Cached entry of three consecutive encoded instructions, None if their shape is not held - a hit makes
+        the shape the most recently used
+        :param previous_2: encoded instruction at num - 2, None if out of the program
+        :param previous_1: encoded instruction at num - 1, None if out of the program
+        :param current: encoded instruction at num
+        :return: (rule_1, rule_2, (stalls without forwarding, stalls with forwarding)) or None
+        """
+        triple = (previous_2, previous_1, current)
+        entry = self.exact.get(triple)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        key = shape_key(previous_2, previous_1, current)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.remember(triple, entry)
+        return entry
+
+    def put(self, previous_2: tuple, previous_1: tuple, current: tuple, entry: tuple):
+        """
+        Hold the entry of three consecutive encoded instructions, evicting the least recently used shapes
+        beyond maxsize
+        :param previous_2: encoded instruction at num - 2, None if out of the program
+        :param previous_1: encoded instruction at num - 1, None if out of the program
+        :param current: encoded instruction at num
+        :param entry: (rule_1, rule_2, (stalls without forwarding, stalls with forwarding))
+        :return:
+        """
+        self.entries[shape_key(previous_2, previous_1, current)] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.remember((previous_2, previous_1, current), entry)
+
+    def remember(self, triple: tuple, entry: tuple):
+        if len(self.exact) >= self.maxsize:
+            self.exact.clear()
+        self.exact[triple] = entry
+
+    def stats(self) -> ShapeCacheStats:
+        """
+        Snapshot of the counters
+        :return: ShapeCacheStats
+        """
+        return ShapeCacheStats(size=len(self.entries), maxsize=self.maxsize, hits=self.hits, misses=self.misses,
+                               evictions=self.evictions)
+
+    def clear(self):
+        self.entries.clear()
+        self.exact.clear()
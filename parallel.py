@@ -0,0 +1,249 @@
+import os
+import sys
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List
+from build import TimingEmitter
+from build import emit_detection
+from build import parse_mips_line
+from build import read_mips_lines
+from build import read_mips_source
+from engine import HazardEngine
+from helpers import first_derived_opcode
+from helpers import opcode_names
+from helpers import terminal_width
+from timing import TimingSummary
+from timing import column_width
+from timing import render_summary
+from timing import stages
+
+# Opcodes whose stalls reach past the two instructions handed over between chunks
+derived_names = set(opcode_names[first_derived_opcode:])
+
+
+# Define a data class around a chunk of a trace handed to a worker
+@dataclass
+class ChunkTask:
+    # trace path
+    path: str
+    # byte range of the chunk - both aligned to the start of a line
+    start: int
+    end: int
+    # position of the first instruction of the chunk in the whole trace
+    num: int = 0
+    # line number of the first line of the chunk - for parse errors
+    line: int = 1
+    # raw commands of the (up to) two instructions just before the chunk
+    overlap: tuple = ()
+    # desired operation - 'detect', 'timing' or 'both'
+    operation: str = "both"
+    # forwarding unit 'on' or 'off'
+    fwd_option: str = "off"
+    # directory the chunk output is written to
+    out_dir: str = None
+    # screen width of the timing diagram - resolved once by the parent process
+    width: int = None
+
+
+# Define a data class around the outcome of a chunk
+@dataclass
+class ChunkOutput:
+    # number of instructions / lines of the chunk
+    instructions: int = 0
+    lines: int = 0
+    # stall cycles of the chunk
+    stalls: int = 0
+    # raw commands of the last two instructions of the chunk
+    tail: tuple = ()
+    # files holding the hazard messages and timing diagram rows of the chunk
+    detection: str = None
+    timing: str = None
+    # whether the chunk holds opcodes timed through pipeline stages - see HazardEngine.staged_stalls
+    derived: bool = False
+
+
+def split_chunks(path: str, chunks: int) -> List[tuple]:
+    """
+    Split a file into byte ranges of roughly equal size, aligned to the start of a line
+    :param path: trace path
+    :param chunks: number of chunks wanted
+    :return: list of (start, end)
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as trace:
+        for chunk in range(1, chunks):
+            trace.seek(max(size * chunk // chunks - 1, 0))
+            # finish the line the cut falls into
+            trace.readline()
+            bound = trace.tell()
+            if bounds[-1] < bound < size:
+                bounds.append(bound)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_range(path: str, start: int, end: int) -> Iterator[str]:
+    """
+    Lines of a byte range of a file
+    :param path: trace path
+    :param start: start of the range, at the start of a line
+    :param end: end of the range, at the start of a line
+    :return: generator of lines
+    """
+    with open(path, 'rb') as trace:
+        trace.seek(start)
+        position = start
+        while position < end:
+            line = trace.readline()
+            if line == b'':
+                return
+            position += len(line)
+            yield line.decode()
+
+
+def scan_chunk(task: ChunkTask) -> ChunkOutput:
+    """
+    First pass over a chunk - number of instructions and the last two of them, nothing is parsed but opcodes
+    :param task: ChunkTask
+    :return: ChunkOutput
+    """
+    output = ChunkOutput()
+    tail = []
+
+    def counted():
+        for line in read_range(task.path, task.start, task.end):
+            output.lines += 1
+            yield line
+
+    for item in read_mips_source(counted()):
+        output.instructions += 1
+        output.derived = output.derived or item.split(None, 1)[0].upper() in derived_names
+        tail = [tail[-1], item] if tail else [item]
+    output.tail = tuple(tail)
+    return output
+
+
+def analyse_chunk(task: ChunkTask) -> ChunkOutput:
+    """
+    Second pass over a chunk - hazards and timing rows written to files in task.out_dir. Instruction numbers
+    are those of the whole trace; timing rows are placed as if no instruction before the chunk had stalled.
+    :param task: ChunkTask
+    :return: ChunkOutput
+    """
+    output = ChunkOutput()
+    engine = HazardEngine(fwd_option=task.fwd_option)
+    engine.resume(num=task.num, previous=[parse_mips_line(item) for item in task.overlap])
+    prefix = os.path.join(task.out_dir, "{:012d}".format(task.start))
+    detection = None
+    emit_timing = None
+    if task.operation in ["detect", "both"]:
+        output.detection = prefix + ".detect"
+        detection = open(output.detection, 'w')
+    if task.operation in ["timing", "both"]:
+        output.timing = prefix + ".timing"
+        emit_timing = TimingEmitter(out=open(output.timing, 'w'), width=task.width)
+        emit_timing.model.next_issue = task.num + 1
+    tail = []
+    for number, column, item in read_mips_lines(read_range(task.path, task.start, task.end)):
+        result = engine.step(parse_mips_line(item, line=task.line + number - 1, column=column))
+        if detection is not None:
+            emit_detection(result, out=detection)
+        if emit_timing is not None:
+            emit_timing(result)
+        output.instructions += 1
+        output.stalls += result.stalls
+        tail = [tail[-1], item] if tail else [item]
+    output.tail = tuple(tail)
+    if detection is not None:
+        detection.close()
+    if emit_timing is not None:
+        emit_timing.flush()
+        emit_timing.out.close()
+    return output
+
+
+def copy_shifted(path: str, shift: int, out):
+    """
+    Copy timing diagram rows pushing them back by the stall cycles of the chunks before
+    :param path: chunk timing file
+    :param shift: stall cycles before the chunk
+    :param out: writable text file
+    :return:
+    """
+    with open(path) as rows:
+        if shift == 0:
+            shutil.copyfileobj(rows, out)
+            return
+        padding = ' ' * shift * column_width
+        for row in rows:
+            head, separator, steps = row.partition(' ---> ')
+            out.write(head + separator + padding + steps)
+
+
+def analyse_parallel(path: str, operation: str, fwd_option: str, jobs: int = None, out=None):
+    """
+    Analyse a single trace file over a process pool - the output is identical to the sequential run.
+    Hazards only look back two instructions, so the trace is cut into chunks and each chunk is given the
+    two instructions before it. A first pass counts the instructions of every chunk so the second pass
+    can number them as in the whole trace. Traces using the extended instruction set are left to the
+    sequential run - a multiply or divide result can stall instructions further down than that.
+    :param path: trace path
+    :param operation: 'detect', 'timing' or 'both'
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :param jobs: number of worker processes
+    :param out: writable text file, stdout by default
+    :return: False if nothing was written as the trace must be analysed sequentially, True otherwise
+    """
+    out = out or sys.stdout
+    jobs = jobs or os.cpu_count() or 1
+    width = terminal_width()
+    with tempfile.TemporaryDirectory() as out_dir, ProcessPoolExecutor(max_workers=jobs) as pool:
+        tasks = [ChunkTask(path=path, start=start, end=end, operation=operation, fwd_option=fwd_option,
+                           out_dir=out_dir, width=width)
+                 for start, end in split_chunks(path, jobs * 4)]
+        scans = list(pool.map(scan_chunk, tasks))
+        if any(scanned.derived for scanned in scans):
+            return False
+        num = 0
+        line = 1
+        overlap = ()
+        for task, scanned in zip(tasks, scans):
+            task.num = num
+            task.line = line
+            task.overlap = overlap
+            num += scanned.instructions
+            line += scanned.lines
+            overlap = (overlap + scanned.tail)[-2:]
+        outputs = list(pool.map(analyse_chunk, tasks))
+        if operation in ["detect", "both"]:
+            print("-" * 236, file=out)
+            print("- Detecting data hazards: -", file=out)
+            print("-" * 236, file=out)
+            out.flush()
+            for output in outputs:
+                with open(output.detection) as detection:
+                    shutil.copyfileobj(detection, out)
+            print("-" * 236, file=out)
+        if operation == "both":
+            print("*" * 236, file=out)
+            print("-" * 236, file=out)
+        if operation in ["timing", "both"]:
+            if operation == "timing":
+                print("-" * 236, file=out)
+            print("- Generating Timing Diagram with forwarding unit {}: -".format(fwd_option.upper()), file=out)
+            print("-" * 236, file=out)
+            shift = 0
+            for output in outputs:
+                copy_shifted(output.timing, shift=shift, out=out)
+                shift += output.stalls
+            summary = TimingSummary(instructions=num, stalls=shift)
+            if num > 0:
+                # the last instruction is fetched after every earlier one and every stall
+                summary.cycles = num + shift + len(stages) - 1
+            print("-" * 236, file=out)
+            print(render_summary(summary=summary), file=out)
+            print("-" * 236, file=out)
+    return True
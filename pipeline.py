@@ -0,0 +1,221 @@
+import os
+import json
+from dataclasses import dataclass
+from helpers import RAW, WAR, WAW
+from helpers import first_derived_opcode
+from helpers import opcode_names
+from helpers import operand_roles
+from helpers import role_fields
+
+
+class PipelineError(ValueError):
+    """
+    Raised when a pipeline description is not valid
+    """
+
+
+# Define a data class around a pipeline description compiled into lookup tables
+@dataclass
+class Pipeline:
+    # name of the pipeline
+    name: str
+    # stage names in order - the first one is Fetch, stalls are inserted right after it
+    stages: tuple
+    # stage name of every cycle after Fetch per opcode e.g. ('D', 'X', 'X', 'M', 'W') - a stage run by a
+    # multi-cycle functional unit shows once per cycle
+    steps: list
+    # cycle each stage completes per opcode - relative to the fetch cycle for Fetch and to the fetch cycle
+    # plus stalls for the other stages
+    offsets: list
+    # reach[fwd][(kind, prev_op, prev_role, cur_op, cur_role)] -> cycles after the previous instruction leaves
+    # Fetch before the current one may leave Fetch. An instruction fetched `gap` cycles after the previous one
+    # left Fetch stalls reach - gap cycles. Only register dependencies that can cost a stall are listed.
+    reach: tuple
+    # structural[prev_op][cur_op] -> reach of an instruction right behind another, whatever the registers
+    structural: list
+    # furthest distance (in instructions) a dependency can still cost a stall at
+    depth: int
+    # cycles the instruction after a branch waits for it to resolve - a trace does not tell taken branches
+    # apart, so every one of them is charged
+    branch_penalty: int = 0
+
+
+def stage_index(stages: tuple, name: str, where: str) -> int:
+    """
+    Position of a stage
+    :param stages: stage names
+    :param name: stage name
+    :param where: part of the description naming the stage, used for error reporting
+    :return: int
+    """
+    if name not in stages:
+        raise PipelineError("{}: unknown stage {!r} - stages are {}".format(where, name, ', '.join(stages)))
+    return stages.index(name)
+
+
+# Names of the JSON types a description field can take, used for error reporting
+type_names = {str: "a string", int: "an integer", bool: "true or false", list: "a list", dict: "an object"}
+
+
+def checked(value, kind, where: str):
+    """
+    A description field, checked against the JSON type it must have
+    :param value: field value
+    :param kind: expected type or tuple of types - true and false are not integers
+    :param where: key of the field, used for error reporting
+    :return: value
+    """
+    kinds = kind if isinstance(kind, tuple) else (kind,)
+    if not isinstance(value, kinds) or (isinstance(value, bool) and bool not in kinds):
+        raise PipelineError("{}: expected {}, got {!r}".format(where, " or ".join(type_names[k] for k in kinds), value))
+    return value
+
+
+def compile_pipeline(config: dict) -> Pipeline:
+    """
+    Compile a pipeline description into lookup tables - the reach of every (previous opcode, current opcode,
+    register dependency) is worked out once here, nothing is interpreted per instruction.
+    See pipelines/mips5.json for the description format.
+    :param config: pipeline description
+    :return: Pipeline
+    """
+    pipeline_name = checked(config.get("name", "pipeline"), str, "name")
+    stages = tuple(checked(config.get("stages", []), list, "stages"))
+    if len(stages) < 2:
+        raise PipelineError("stages: at least two stages are needed, got {}".format(list(stages)))
+    for stage, stage_name in enumerate(stages):
+        checked(stage_name, str, "stages[{}]".format(stage))
+    if len(set(stages)) != len(stages) or any(len(name) != 1 for name in stages):
+        raise PipelineError("stages: stage names must be single distinct characters, got {}".format(list(stages)))
+    register_read = stage_index(stages, config.get("register_read", stages[1]), "register_read")
+    register_write = stage_index(stages, config.get("register_write", stages[-1]), "register_write")
+    # the register file is written in the first half of a cycle and read in the second half
+    split_cycle = checked(config.get("split_cycle", True), bool, "split_cycle")
+    paths = []
+    for number, path in enumerate(checked(config.get("forwarding", []), list, "forwarding")):
+        where = "forwarding[{}]".format(number)
+        if len(checked(path, list, where)) != 2:
+            raise PipelineError("{}: expected a [from, to] pair of stages, got {!r}".format(where, path))
+        paths.append((stage_index(stages, path[0], where), stage_index(stages, path[1], where)))
+    units = checked(config.get("units", {}), dict, "units")
+    for unit, description in units.items():
+        checked(description, dict, "units." + unit)
+        checked(description.get("latency", 1), int, "units.{}.latency".format(unit))
+    opcodes = dict(checked(config.get("opcodes", {}), dict, "opcodes"))
+    for opcode, description in opcodes.items():
+        checked(description, dict, "opcodes." + opcode)
+        checked(description.get("unit", ""), str, "opcodes.{}.unit".format(opcode))
+        reads = checked(description.get("reads", ""), (str, dict), "opcodes.{}.reads".format(opcode))
+        if isinstance(reads, dict):
+            for role, stage in reads.items():
+                checked(stage, str, "opcodes.{}.reads.{}".format(opcode, role))
+        checked(description.get("writes", ""), str, "opcodes.{}.writes".format(opcode))
+    missing = [name for name in opcode_names[:first_derived_opcode] if name not in opcodes]
+    if missing:
+        raise PipelineError("opcodes: no description for {}".format(', '.join(missing)))
+    # opcodes added to the instruction set later run like ADD unless described
+    for name in opcode_names[first_derived_opcode:]:
+        opcodes.setdefault(name, opcodes["ADD"])
+    branch_penalty = checked(config.get("branch_penalty", 0), int, "branch_penalty")
+    if branch_penalty < 0:
+        raise PipelineError("branch_penalty must be at least 0, got {}".format(branch_penalty))
+    # per opcode - cycles spent in each stage, first / last cycle of each stage, stage operands are needed in
+    # per role and stage the result is produced in
+    lengths = []
+    for name in opcode_names:
+        length = [1] * len(stages)
+        unit = opcodes[name].get("unit")
+        if unit is not None:
+            if unit not in units:
+                raise PipelineError("opcodes.{}: unknown unit {!r}".format(name, unit))
+            stage = stage_index(stages, units[unit].get("stage", stages[2 % len(stages)]), "units." + unit)
+            if stage == 0:
+                raise PipelineError("units.{}: Fetch cannot take more than a cycle".format(unit))
+            length[stage] = units[unit].get("latency", 1)
+            if length[stage] < 1:
+                raise PipelineError("units.{}: latency must be at least 1".format(unit))
+        lengths.append(length)
+    ends = []
+    for length in lengths:
+        end = [0]
+        for cycles in length[1:]:
+            end.append(end[-1] + cycles)
+        ends.append(end)
+    starts = [[end[stage] - length[stage] + 1 for stage in range(len(stages))] for end, length in zip(ends, lengths)]
+    reads = []
+    produces = []
+    for op, name in enumerate(opcode_names):
+        description = opcodes[name]
+        where = "opcodes.{}".format(name)
+        needed = description.get("reads", stages[register_read])
+        if isinstance(needed, str):
+            needed = {role_fields[role]: needed for role in operand_roles[op][1]}
+        reads.append({role: stage_index(stages, needed.get(role_fields[role], stages[register_read]), where)
+                      for role in operand_roles[op][1]})
+        produces.append(stage_index(stages, description.get("writes", stages[register_write]), where))
+
+    def raw_reach(prev_op: int, cur_op: int, cur_role: int, fwd: int) -> int:
+        # through the register file - read once written (same cycle with split_cycle)
+        best = starts[prev_op][register_write] + (0 if split_cycle else 1) - starts[cur_op][register_read]
+        if fwd:
+            # through a forwarding path - from the end of a stage holding the result to the start of a stage
+            # no later than the one the operand is needed in
+            for source, target in paths:
+                if source >= produces[prev_op] and target <= reads[cur_op][cur_role]:
+                    best = min(best, ends[prev_op][source] + 1 - starts[cur_op][target])
+        return best
+
+    def order_reach(kind: int, prev_op: int, cur_op: int) -> int:
+        # the current instruction must write the register file after the previous one read (WAR) or wrote (WAW) it
+        previous = starts[prev_op][register_read] if kind == WAR else starts[prev_op][register_write]
+        return previous + 1 - starts[cur_op][register_write]
+
+    reach = []
+    for fwd in (0, 1):
+        table = {}
+        for prev_op in range(len(opcode_names)):
+            prev_written, prev_read = operand_roles[prev_op]
+            for cur_op in range(len(opcode_names)):
+                cur_written, cur_read = operand_roles[cur_op]
+                for cur_role in cur_read:
+                    for prev_role in prev_written:
+                        table[(RAW, prev_op, prev_role, cur_op, cur_role)] = raw_reach(prev_op, cur_op, cur_role, fwd)
+                for cur_role in cur_written:
+                    for prev_role in prev_read:
+                        table[(WAR, prev_op, prev_role, cur_op, cur_role)] = order_reach(WAR, prev_op, cur_op)
+                    for prev_role in prev_written:
+                        table[(WAW, prev_op, prev_role, cur_op, cur_role)] = order_reach(WAW, prev_op, cur_op)
+        # the next instruction is fetched at least a cycle later - a reach of 1 or less never stalls
+        reach.append({key: cycles for key, cycles in table.items() if cycles > 1})
+    # an instruction right behind another may only enter a stage once the other has left it
+    structural = [[max([ends[prev_op][stage] + 1 - starts[cur_op][stage] for stage in range(1, len(stages))])
+                   for cur_op in range(len(opcode_names))] for prev_op in range(len(opcode_names))]
+    depth = max([cycles - 1 for table in reach for cycles in table.values()] + [1])
+    steps = [tuple(stages[stage] for stage in range(1, len(stages)) for _ in range(length[stage]))
+             for length in lengths]
+    return Pipeline(name=pipeline_name, stages=stages, steps=steps,
+                    offsets=[tuple(end) for end in ends], reach=tuple(reach), structural=structural, depth=depth,
+                    branch_penalty=branch_penalty)
+
+
+def load_pipeline(path: str) -> Pipeline:
+    """
+    Load a pipeline description (JSON) and compile it
+    :param path: description path
+    :return: Pipeline
+    """
+    try:
+        with open(path) as description:
+            config = json.load(description)
+    except json.JSONDecodeError as error:
+        raise PipelineError("{} is not valid JSON - {}".format(path, error))
+    except OSError as error:
+        raise PipelineError("{} cannot be read - {}".format(path, error.strerror))
+    if not isinstance(config, dict):
+        raise PipelineError("{} must hold a JSON object".format(path))
+    return compile_pipeline(config)
+
+
+# Classic 5-stage pipeline, described in pipelines/mips5.json. Without --pipeline, the stalls of opcodes outside
+# the hand-written hazard table are derived from it.
+classic = load_pipeline(os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipelines", "mips5.json"))
@@ -0,0 +1,275 @@
+import sys
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+from engine import InstructionResult
+from helpers import hazard_names
+from helpers import opcode_names
+
+# Phases of a run, in pipeline order - time spent outside all of them is booked to 'other'
+phases = ["parse", "schedule", "detect", "stalls", "render"]
+# Most trace events kept for --profile chrome - phases switch several times per instruction
+max_events = 200000
+
+
+# Define a data class around the counters of a single phase
+@dataclass
+class PhaseStats:
+    # wall time spent in the phase, excluding the phases it called into
+    seconds: float = 0.0
+    # instructions (or calls) that went through the phase
+    items: int = 0
+    # memory blocks allocated minus freed while in the phase
+    allocated_blocks: int = 0
+
+
+def stall_cause(result: InstructionResult, origin: str = "pipeline stages") -> str:
+    """
+    Key of stall cycles timed from a pipeline description or the stages of the classic pipeline - see
+    HazardEngine.pipeline_stalls and HazardEngine.staged_stalls
+    :param result: InstructionResult with a cause
+    :param origin: where the stall cycles come from, 'pipeline stages' or 'pipeline description'
+    :return: str e.g. 'branch penalty after BEQ' or 'RAW MUL -> ADD at distance 3 (pipeline stages)'
+    """
+    source, prev_op, distance = result.cause
+    if source == "branch":
+        return "branch penalty after {}".format(opcode_names[prev_op])
+    if source == "structural":
+        return "structural ({} unit busy) -> {}".format(opcode_names[prev_op], opcode_names[result.opcode])
+    return "{} {} -> {} at distance {} ({})".format(
+        hazard_names[source], opcode_names[prev_op], opcode_names[result.opcode], distance, origin)
+
+
+class Profiler:
+    """
+    Per-phase wall time, instruction and allocation counts, hazard counts by kind and stall cycles per hazard
+    rule. Nothing is measured unless a profiler is attached - the hooks below wrap the functions and iterators
+    of a run, so a run without --profile executes the exact same code as before.
+    Time is exclusive: a phase pulling items from another one (detection reading the parser) is only booked
+    for its own share.
+    """
+
+    def __init__(self, trace: bool = False):
+        """
+        :param trace: whether to keep the span of every phase switch, for Chrome trace events
+        """
+        self.stats = {name: PhaseStats() for name in phases + ["other"]}
+        self.hazards = {name: 0 for name in hazard_names.values()}
+        # stall cycles and instructions per rule e.g. 'RAW LW -> ADD at distance 1 (stall_helper_no_fwd)'
+        self.stall_rules = {}
+        self.instructions = 0
+        self.listeners = []
+        # ShapeCache of the engine, its hit rate is reported when set
+        self.cache = None
+        self.trace = trace
+        self.events = []
+        self.current = "other"
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.blocks = sys.getallocatedblocks()
+
+    def switch(self, name: str) -> str:
+        """
+        Book the time and allocations since the last switch to the current phase, then enter another
+        :param name: phase entered
+        :return: phase left
+        """
+        now = time.perf_counter()
+        blocks = sys.getallocatedblocks()
+        stats = self.stats[self.current]
+        stats.seconds += now - self.last
+        stats.allocated_blocks += blocks - self.blocks
+        if self.trace and len(self.events) < max_events and name != self.current:
+            self.events.append((self.current, self.last, now))
+        previous = self.current
+        self.current = name
+        self.last = now
+        self.blocks = blocks
+        return previous
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Book a block of code to a phase
+        :param name: phase
+        :return:
+        """
+        previous = self.switch(name)
+        try:
+            yield
+        finally:
+            self.stats[name].items += 1
+            self.switch(previous)
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """
+        Book every call of a function to a phase
+        :param name: phase
+        :param func: function
+        :return: timed function
+        """
+        def timed(*args, **kwargs):
+            previous = self.switch(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.stats[name].items += 1
+                self.switch(previous)
+        return timed
+
+    def instrument(self, owner, attribute: str, name: str):
+        """
+        Book every call of a method of an object to a phase - only that object is changed
+        :param owner: object
+        :param attribute: method name
+        :param name: phase
+        :return:
+        """
+        setattr(owner, attribute, self.wrap(name, getattr(owner, attribute)))
+
+    def timed(self, name: str, iterable: Iterable, after: str = None) -> Iterator:
+        """
+        Book the production of every item of an iterable to a phase
+        :param name: phase
+        :param iterable: e.g. a parser or an engine run
+        :param after: phase the consumer of the items is booked to, the phase it was in if not given
+        :return: generator of the same items
+        """
+        iterator = iter(iterable)
+        stats = self.stats[name]
+        while True:
+            previous = self.switch(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.switch(previous)
+                return
+            self.switch(after or previous)
+            stats.items += 1
+            yield item
+
+    def listen(self, callback: Callable):
+        """
+        Call a function with every InstructionResult observed
+        :param callback: function taking an InstructionResult
+        :return:
+        """
+        self.listeners.append(callback)
+
+    def observe(self, results: Iterable[InstructionResult], fwd_option: str = "off",
+                pipeline: bool = False) -> Iterator[InstructionResult]:
+        """
+        Count the hazards and the stall cycles per rule of engine results as they go by - booked to the
+        current phase
+        :param results: InstructionResult per instruction
+        :param fwd_option: forwarding unit 'on' or 'off' - picks the stall helper the rules belong to
+        :param pipeline: whether stalls come from a pipeline description instead of the hazard table
+        :return: generator of the same results
+        """
+        helper = "stall_helper_fwd" if fwd_option == "on" else "stall_helper_no_fwd"
+        for result in results:
+            self.instructions += 1
+            for rule in (result.rule_1, result.rule_2):
+                if rule is not None:
+                    self.hazards[hazard_names[rule.kind]] += 1
+            if result.stalls:
+                if result.cause is not None:
+                    key = stall_cause(result, origin="pipeline description" if pipeline else "pipeline stages")
+                else:
+                    # the hazard against num - 2 takes precedence unless derived - see rule_stalls
+                    distance = 2 if result.rule_2 is not None and not result.rule_2.derived else 1
+                    rule = result.rule_2 if distance == 2 else result.rule_1
+                    key = "{} {} -> {} at distance {} ({})".format(
+                        hazard_names[rule.kind], result.instruction(distance).opcode, result.instruction().opcode,
+                        distance, helper)
+                stalls, count = self.stall_rules.get(key, (0, 0))
+                self.stall_rules[key] = (stalls + result.stalls, count + 1)
+            for callback in self.listeners:
+                callback(result)
+            yield result
+
+    def close(self) -> float:
+        """
+        Book the time up to now - call before reporting
+        :return: total wall time in seconds
+        """
+        self.switch(self.current)
+        return self.last - self.start
+
+    def to_dict(self) -> dict:
+        """
+        JSON friendly view of the counters
+        :return: dict
+        """
+        total = self.close()
+        report = {
+            "total_seconds": total,
+            "instructions": self.instructions,
+            "phases": {name: {"seconds": stats.seconds, "items": stats.items,
+                              "allocated_blocks": stats.allocated_blocks} for name, stats in self.stats.items()},
+            "hazards": dict(self.hazards),
+            "stalls_per_rule": {key: {"stalls": stalls, "instructions": count}
+                                for key, (stalls, count) in sorted(self.stall_rules.items())},
+        }
+        if self.cache is not None:
+            stats = self.cache.stats()
+            report["shape_cache"] = dict(asdict(stats), hit_rate=stats.hit_rate)
+        return report
+
+    def table(self) -> str:
+        """
+        Summary table of the counters
+        :return: str
+        """
+        report = self.to_dict()
+        total = report["total_seconds"] or 1.0
+        lines = ["{:<10} {:>12} {:>8} {:>12} {:>18}".format("phase", "seconds", "share", "items", "allocated blocks")]
+        for name, stats in report["phases"].items():
+            lines.append("{:<10} {:>12.4f} {:>7.1f}% {:>12} {:>18}".format(
+                name, stats["seconds"], stats["seconds"] / total * 100, stats["items"], stats["allocated_blocks"]))
+        lines.append("{:<10} {:>12.4f}".format("total", report["total_seconds"]))
+        hazards = ', '.join("{} {}".format(kind, count) for kind, count in report["hazards"].items())
+        lines.append("instructions: {} - hazards: {}".format(report["instructions"], hazards))
+        for key, counts in report["stalls_per_rule"].items():
+            lines.append("stalls {:>8} over {:>8} instructions - {}".format(
+                counts["stalls"], counts["instructions"], key))
+        if "shape_cache" in report:
+            cache = report["shape_cache"]
+            lines.append("shape cache: {} hits, {} misses ({:.1f}% hit rate), {} evictions, {}/{} shapes held".format(
+                cache["hits"], cache["misses"], cache["hit_rate"] * 100, cache["evictions"], cache["size"],
+                cache["maxsize"]))
+        return '\n'.join(lines)
+
+    def chrome_trace(self) -> dict:
+        """
+        Chrome trace events (chrome://tracing, Perfetto) - one complete event per phase span, and the counters
+        as metadata
+        :return: dict
+        """
+        report = self.to_dict()
+        events = [{"name": name, "cat": "phase", "ph": "X", "pid": 1, "tid": 1,
+                   "ts": (start - self.start) * 1e6, "dur": (end - start) * 1e6}
+                  for name, start, end in self.events if end > start]
+        events.append({"name": "hazards", "ph": "C", "pid": 1, "tid": 1, "ts": report["total_seconds"] * 1e6,
+                       "args": report["hazards"]})
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": report}
+
+    def write(self, output_format: str = "table", out=None):
+        """
+        Write the report
+        :param output_format: 'table', 'json' or 'chrome'
+        :param out: writable text file, stderr by default
+        :return:
+        """
+        out = out or sys.stderr
+        if output_format == "table":
+            out.write(self.table() + '\n')
+        elif output_format == "json":
+            json.dump(self.to_dict(), out, indent=2)
+            out.write('\n')
+        else:
+            json.dump(self.chrome_trace(), out)
+            out.write('\n')
@@ -0,0 +1,237 @@
+import csv
+import sys
+import json
+from dataclasses import dataclass
+from typing import Iterable, List
+from engine import InstructionResult
+from helpers import hazard_names
+from helpers import role_fields
+from pipeline import Pipeline
+from timing import InstructionTiming
+from timing import TimingModel
+from timing import TimingSummary
+from timing import stages
+
+
+# Define a data class around a hazard of an instruction
+@dataclass
+class HazardRecord:
+    # 1 or 2 - how far back the instruction the hazard is against is
+    distance: int
+    # position of the instruction the hazard is against
+    previous: int
+    # RAW/WAR/WAW
+    kind: str
+    # detection message e.g. '[RAW HAZARD] Instruction [...] ...'
+    message: str
+
+
+# Define a data class around a producer-consumer dependency of an instruction
+@dataclass
+class DependencyRecord:
+    # RAW/WAR/WAW
+    kind: str
+    # how far back the instruction depended on is
+    distance: int
+    # position of the instruction depended on
+    previous: int
+    # register carrying the dependency
+    register: str
+
+
+# Define a data class around everything known about a single analysed instruction
+@dataclass
+class AnalysisRecord:
+    # position of the instruction in the program
+    num: int
+    # raw command
+    command: str
+    # stall cycles between Fetch and Decode
+    stalls: int
+    # hazards against the instructions at num - 1 and num - 2 - None when hazards were not asked for
+    hazards: List[HazardRecord] = None
+    # fetch cycle and cycle each stage completes - None when timing was not asked for
+    issue: int = None
+    stage_cycles: tuple = None
+    # names of the stages of stage_cycles
+    stage_names: tuple = stages
+    # dependencies on the instructions of the engine window - None unless the engine tracked them
+    dependencies: List[DependencyRecord] = None
+
+    def to_dict(self) -> dict:
+        """
+        JSON friendly view of the record - fields not asked for are left out
+        :return: dict
+        """
+        record = {"num": self.num, "command": self.command, "stalls": self.stalls}
+        if self.hazards is not None:
+            record["hazards"] = [{"distance": hazard.distance, "previous": hazard.previous, "kind": hazard.kind,
+                                  "message": hazard.message} for hazard in self.hazards]
+        if self.dependencies is not None:
+            record["dependencies"] = [{"kind": dependency.kind, "distance": dependency.distance,
+                                       "previous": dependency.previous, "register": dependency.register}
+                                      for dependency in self.dependencies]
+        if self.stage_cycles is not None:
+            record["issue"] = self.issue
+            record["stages"] = dict(zip(self.stage_names, self.stage_cycles))
+        return record
+
+
+def analysis_record(result: InstructionResult, timing: InstructionTiming = None, detect: bool = True,
+                    stage_names: tuple = stages) -> AnalysisRecord:
+    """
+    Result object of a single instruction - from the engine result and its timing
+    :param result: InstructionResult
+    :param timing: InstructionTiming, None to leave timing out
+    :param detect: whether to include the hazards
+    :param stage_names: names of the pipeline stages
+    :return: AnalysisRecord
+    """
+    record = AnalysisRecord(num=result.num, command=result.instruction().raw, stalls=result.stalls)
+    if detect:
+        record.hazards = []
+        if result.rule_1 is not None:
+            record.hazards.append(HazardRecord(distance=1, previous=result.num - 1,
+                                               kind=hazard_names[result.rule_1.kind], message=result.hazard_1))
+        if result.rule_2 is not None:
+            record.hazards.append(HazardRecord(distance=2, previous=result.num - 2,
+                                               kind=hazard_names[result.rule_2.kind], message=result.hazard_2))
+        if result.dependencies is not None:
+            item = result.instruction()
+            record.dependencies = [DependencyRecord(kind=hazard_names[kind], distance=distance,
+                                                    previous=result.num - distance,
+                                                    register=getattr(item, role_fields[cur_role]))
+                                   for kind, distance, cur_role, _ in result.dependencies]
+    if timing is not None:
+        record.issue = timing.issue
+        record.stage_cycles = timing.stage_cycles
+        record.stage_names = stage_names
+    return record
+
+
+def summary_dict(summary: TimingSummary) -> dict:
+    """
+    JSON friendly view of a timing summary
+    :param summary: TimingSummary
+    :return: dict
+    """
+    return {"instructions": summary.instructions, "cycles": summary.cycles, "stalls": summary.stalls,
+            "cpi": summary.cpi}
+
+
+class RecordEmitter:
+    """
+    Writes analysis records one at a time as they come - nothing is held back
+    """
+
+    def __init__(self, out=None, operation: str = "both", fwd_option: str = "off", stage_names: tuple = stages):
+        """
+        :param out: writable text file, stdout by default
+        :param operation: 'detect', 'timing' or 'both' - which fields the records carry
+        :param fwd_option: forwarding unit 'on' or 'off'
+        :param stage_names: names of the pipeline stages
+        """
+        self.out = out or sys.stdout
+        self.operation = operation
+        self.fwd_option = fwd_option
+        self.stage_names = stage_names
+
+    def __call__(self, record: AnalysisRecord):
+        raise NotImplementedError
+
+    def close(self, summary: TimingSummary):
+        pass
+
+
+class NdjsonEmitter(RecordEmitter):
+    """
+    One JSON object per line - instruction records, then a summary record
+    """
+
+    def __call__(self, record: AnalysisRecord):
+        self.out.write(json.dumps(dict(type="instruction", **record.to_dict())) + '\n')
+
+    def close(self, summary: TimingSummary):
+        summary = dict(type="summary", forwarding_unit=self.fwd_option, **summary_dict(summary))
+        self.out.write(json.dumps(summary) + '\n')
+
+
+class JsonEmitter(RecordEmitter):
+    """
+    A single JSON document {"forwarding_unit": ..., "instructions": [...], "summary": {...}} written as
+    records come - the instructions list is never built in memory
+    """
+
+    def __init__(self, out=None, operation: str = "both", fwd_option: str = "off", stage_names: tuple = stages):
+        super().__init__(out=out, operation=operation, fwd_option=fwd_option, stage_names=stage_names)
+        self.count = 0
+
+    def __call__(self, record: AnalysisRecord):
+        if self.count == 0:
+            self.out.write('{{"forwarding_unit": {}, "instructions": [\n'.format(json.dumps(self.fwd_option)))
+        else:
+            self.out.write(',\n')
+        self.out.write(json.dumps(record.to_dict()))
+        self.count += 1
+
+    def close(self, summary: TimingSummary):
+        if self.count == 0:
+            self.out.write('{{"forwarding_unit": {}, "instructions": [\n'.format(json.dumps(self.fwd_option)))
+        self.out.write('\n], "summary": {}}}\n'.format(json.dumps(summary_dict(summary))))
+
+
+class CsvEmitter(RecordEmitter):
+    """
+    One row per instruction with a header row - hazards at distance 1 and 2 and stage cycles as columns
+    """
+
+    def __init__(self, out=None, operation: str = "both", fwd_option: str = "off", stage_names: tuple = stages):
+        super().__init__(out=out, operation=operation, fwd_option=fwd_option, stage_names=stage_names)
+        self.writer = csv.writer(self.out, lineterminator='\n')
+        header = ["num", "command", "stalls"]
+        if operation in ["detect", "both"]:
+            header += ["hazard_1_kind", "hazard_1_previous", "hazard_1_message",
+                       "hazard_2_kind", "hazard_2_previous", "hazard_2_message"]
+        if operation in ["timing", "both"]:
+            header += ["issue"] + list(stage_names)
+        self.writer.writerow(header)
+
+    def __call__(self, record: AnalysisRecord):
+        row = [record.num, record.command, record.stalls]
+        if record.hazards is not None:
+            by_distance = {hazard.distance: hazard for hazard in record.hazards}
+            for distance in (1, 2):
+                hazard = by_distance.get(distance)
+                row += ['', '', ''] if hazard is None else [hazard.kind, hazard.previous, hazard.message]
+        if record.stage_cycles is not None:
+            row += [record.issue] + list(record.stage_cycles)
+        self.writer.writerow(row)
+
+
+# --format choices other than 'text'
+emitters = {"json": JsonEmitter, "ndjson": NdjsonEmitter, "csv": CsvEmitter}
+
+
+def emit_records(results: Iterable[InstructionResult], output_format: str, operation: str, fwd_option: str,
+                 out=None, pipeline: Pipeline = None, model: TimingModel = None) -> TimingSummary:
+    """
+    Stream engine results out in a structured format, record by record
+    :param results: InstructionResult per instruction, in program order
+    :param output_format: 'json', 'ndjson' or 'csv'
+    :param operation: 'detect', 'timing' or 'both'
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :param out: writable text file, stdout by default
+    :param pipeline: compiled pipeline description, the 5-stage pipeline if not given
+    :param model: TimingModel the cycles are stepped in, a new one if not given
+    :return: TimingSummary
+    """
+    stage_names = stages if pipeline is None else pipeline.stages
+    emitter = emitters[output_format](out=out, operation=operation, fwd_option=fwd_option, stage_names=stage_names)
+    model = model or TimingModel(pipeline=pipeline)
+    detect = operation in ["detect", "both"]
+    timed = operation in ["timing", "both"]
+    for result in results:
+        timing = model.step(stalls=result.stalls, opcode=result.opcode)
+        emitter(analysis_record(result, timing=timing if timed else None, detect=detect, stage_names=stage_names))
+    emitter.close(model.summary)
+    return model.summary
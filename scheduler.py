@@ -0,0 +1,206 @@
+import heapq
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List
+from engine import HazardEngine
+from engine import InstructionResult
+from helpers import Instruction
+from helpers import OP_LW, OP_SW
+from helpers import branch_opcodes
+from helpers import encode_instruction
+from helpers import opcode_ids
+from helpers import operand_roles
+from pipeline import Pipeline
+from timing import TimingModel
+from timing import TimingSummary
+
+# Pseudo register standing for data memory - loads read it, stores write it, so memory accesses keep their order
+# whenever one of them is a store
+memory = -2
+memory_reads = {OP_LW}
+memory_writes = {OP_SW}
+# Ready instructions looked at per slot, best priority first - the first one without stalls is taken
+lookahead = 32
+
+
+# Define a data class around the outcome of scheduling a program
+@dataclass
+class ScheduleOutcome:
+    # instructions in their new order
+    instructions: List[Instruction]
+    # timing of the program as written / as rescheduled
+    before: TimingSummary
+    after: TimingSummary
+    # number of basic blocks scheduled
+    blocks: int = 0
+    # number of blocks kept in program order - rescheduling them would not have saved a cycle
+    kept: int = 0
+
+
+def dependency_graph(encoded: List[tuple]) -> tuple:
+    """
+    Dependency DAG of a basic block - RAW on the last writer of each register read, WAW on the last writer
+    and WAR on the readers since then of each register written. Earlier dependencies are implied by these,
+    so the graph has a bounded number of edges per instruction.
+    :param encoded: encoded instructions of the block, in program order
+    :return: (successors per instruction, number of predecessors per instruction)
+    """
+    successors = [[] for _ in encoded]
+    predecessors = [0] * len(encoded)
+    writer = {}
+    readers = {}
+    for num, instruction in enumerate(encoded):
+        written, read = operand_roles[instruction[0]]
+        written = [instruction[role] for role in written]
+        read = [instruction[role] for role in read]
+        if instruction[0] in memory_writes:
+            written.append(memory)
+        if instruction[0] in memory_reads:
+            read.append(memory)
+        before = set()
+        for reg in read:
+            if reg in writer:
+                before.add(writer[reg])
+        for reg in written:
+            if reg in writer:
+                before.add(writer[reg])
+            before.update(readers.get(reg, ()))
+        if instruction[0] in branch_opcodes:
+            # a branch ends its block - everything before it stays before it
+            before.update(range(num))
+        before.discard(num)
+        for previous in before:
+            successors[previous].append(num)
+        predecessors[num] = len(before)
+        for reg in read:
+            readers.setdefault(reg, []).append(num)
+        for reg in written:
+            writer[reg] = num
+            readers[reg] = []
+    return successors, predecessors
+
+
+def path_heights(successors: List[list]) -> List[int]:
+    """
+    Length of the longest dependency chain starting at each instruction - instructions heading long chains
+    are scheduled first
+    :param successors: successors per instruction - edges always point forward
+    :return: list of int
+    """
+    heights = [1] * len(successors)
+    for num in range(len(successors) - 1, -1, -1):
+        for successor in successors[num]:
+            heights[num] = max(heights[num], heights[successor] + 1)
+    return heights
+
+
+def schedule_block(block: List[Instruction], engine: HazardEngine) -> List[InstructionResult]:
+    """
+    List scheduling of a basic block - each slot goes to the ready instruction with the fewest stall cycles
+    after what was issued so far, ties going to the longest dependency chain and then to program order.
+    The engine is fed the instructions as they are placed.
+    :param block: instructions of the block, in program order
+    :param engine: HazardEngine holding the instructions issued before the block
+    :return: InstructionResult per instruction, in the new order
+    """
+    encoded = [encode_instruction(item) for item in block]
+    successors, predecessors = dependency_graph(encoded)
+    heights = path_heights(successors)
+    ready = [(-heights[num], num) for num in range(len(block)) if predecessors[num] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        looked = []
+        best = None
+        while ready and len(looked) < lookahead:
+            candidate = heapq.heappop(ready)
+            looked.append(candidate)
+            stalls = engine.stall_cycles(encoded[candidate[1]])
+            if best is None or stalls < best[0]:
+                best = (stalls, candidate)
+            if stalls == 0:
+                break
+        for candidate in looked:
+            if candidate is not best[1]:
+                heapq.heappush(ready, candidate)
+        num = best[1][1]
+        order.append(engine.analyse(encoded=encoded[num], item=block[num]))
+        for successor in successors[num]:
+            predecessors[successor] -= 1
+            if predecessors[successor] == 0:
+                heapq.heappush(ready, (-heights[successor], successor))
+    return order
+
+
+def block_completion(model: TimingModel, results: List[InstructionResult]) -> tuple:
+    """
+    Time a block - a multi-cycle unit (MUL/DIV) can finish after the instructions behind it are fetched, so the
+    stall cycles alone do not tell when the block is done
+    :param model: TimingModel holding the instructions timed before the block - stepped through the block
+    :param results: InstructionResult per instruction of the block, in its order
+    :return: (cycle the last instruction of the block completes, fetch cycle of the instruction after it)
+    """
+    complete = 0
+    for result in results:
+        complete = max(complete, model.step(stalls=result.stalls, opcode=result.opcode).complete)
+    return complete, model.next_issue
+
+
+def split_at_branches(blocks: Iterable[List[Instruction]]) -> Iterator[List[Instruction]]:
+    """
+    Split blocks after every branch - instructions cannot move across one, whoever built the blocks
+    :param blocks: instructions of each block, in program order
+    :return: generator of basic blocks, a branch only ever last
+    """
+    for block in blocks:
+        start = 0
+        for num, item in enumerate(block):
+            if opcode_ids[item.opcode] in branch_opcodes:
+                yield block[start:num + 1]
+                start = num + 1
+        if start < len(block):
+            yield block[start:]
+
+
+def schedule_program(blocks: Iterable[List[Instruction]], fwd_option: str = "off",
+                     pipeline: Pipeline = None, branch_penalty: int = None) -> ScheduleOutcome:
+    """
+    Reorder the instructions of each basic block to cut stall cycles - dependencies are kept, and a block
+    whose new order would not complete earlier is left as written
+    :param blocks: instructions of each basic block, in program order - split again after every branch
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :param pipeline: compiled pipeline description stalls are derived from, the 5-stage table if not given
+    :param branch_penalty: cycles the instruction after a branch waits, see HazardEngine
+    :return: ScheduleOutcome
+    """
+    engine = HazardEngine(fwd_option=fwd_option, pipeline=pipeline, branch_penalty=branch_penalty)
+    # the whole program as written, for the cycles before
+    original = HazardEngine(fwd_option=fwd_option, pipeline=pipeline, branch_penalty=branch_penalty)
+    before = TimingModel(pipeline=pipeline)
+    after = TimingModel(pipeline=pipeline)
+    outcome = ScheduleOutcome(instructions=[], before=before.summary, after=after.summary)
+    for block in split_at_branches(blocks):
+        # the block as written and rescheduled, both from the state left by the blocks before
+        written_engine = engine.fork()
+        written = [written_engine.step(item) for item in block]
+        scheduled_engine = engine.fork()
+        results = schedule_block(block, scheduled_engine)
+        for result in original.run(block):
+            before.step(stalls=result.stalls, opcode=result.opcode)
+        # completion cycles rather than stall counts - a reorder can stall less and still finish later
+        written_model = after.fork()
+        scheduled_model = after.fork()
+        if block_completion(scheduled_model, results) < block_completion(written_model, written):
+            engine = scheduled_engine
+            after = scheduled_model
+        else:
+            # no cycle saved - the block is kept as written
+            results = written
+            engine = written_engine
+            after = written_model
+            outcome.kept += 1
+        for result in results:
+            outcome.instructions.append(result.item)
+        outcome.blocks += 1
+    outcome.before = before.summary
+    outcome.after = after.summary
+    return outcome
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from build import ParseError
+from build import parse_mips_line
+from engine import HazardEngine
+from helpers import Instruction
+from records import analysis_record
+from records import summary_dict
+from timing import TimingModel
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(
+        description="MIPS Pipeline Hazard Detection - long-running JSON server with a result cache")
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address to listen on, 127.0.0.1 by default"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="TCP port to listen on, 8080 by default"
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Path of a Unix socket to listen on instead of a TCP port"
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=1024,
+        help="Number of analysed programs kept in memory, 1024 by default - 0 turns the cache off"
+    )
+    args = parser.parse_args(argv)
+    if args.cache_size < 0:
+        parser.error("--cache_size must be at least 0, got {}".format(args.cache_size))
+    return args
+
+
+# Define a data class around the hit/miss counters of the cache
+@dataclass
+class CacheStats:
+    # programs held / most programs held
+    size: int = 0
+    maxsize: int = 0
+    # lookups answered from memory / analysed
+    hits: int = 0
+    misses: int = 0
+    # programs dropped to make room
+    evictions: int = 0
+
+
+class AnalysisCache:
+    """
+    Least recently used cache of analysis results, keyed by the normalized program and forwarding mode.
+    Safe to share between the threads of the server.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = CacheStats(maxsize=maxsize)
+
+    def get(self, key: tuple):
+        """
+        Cached result of a key, None if not held - a hit makes the key the most recently used
+        :param key: (normalized commands, forwarding unit)
+        :return: result or None
+        """
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.counters.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters.hits += 1
+            return result
+
+    def put(self, key: tuple, result):
+        """
+        Hold a result, evicting the least recently used ones beyond maxsize
+        :param key: (normalized commands, forwarding unit)
+        :param result: analysis result
+        :return:
+        """
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters.evictions += 1
+
+    def stats(self) -> CacheStats:
+        """
+        Snapshot of the counters
+        :return: CacheStats
+        """
+        with self.lock:
+            return CacheStats(size=len(self.entries), maxsize=self.maxsize, hits=self.counters.hits,
+                              misses=self.counters.misses, evictions=self.counters.evictions)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def normalize_command(item: Instruction) -> str:
+    """
+    Canonical text of a parsed command - upper case, single spaces, comma separated operands
+    :param item: Instruction
+    :return: str e.g. 'LW R3, 8(R1)'
+    """
+    if item.opcode == "LW":
+        return "LW {}, {}({})".format(item.rt, item.offset, item.rs)
+    if item.opcode == "SW":
+        return "SW {}, {}({})".format(item.rs, item.offset, item.rt)
+    if item.opcode == "ADDI":
+        return "ADDI {}, {}, {}".format(item.rd, item.rs, item.offset)
+    if item.opcode in ["BEQ", "BNE"]:
+        return "{} {}, {}, {}".format(item.opcode, item.rs, item.rt, item.address)
+    return "{} {}, {}, {}".format(item.opcode, item.rd, item.rs, item.rt)
+
+
+def normalize_program(commands) -> tuple:
+    """
+    Parse and normalize the commands of a submission - two submissions differing only in case or
+    spacing share a cache entry
+    :param commands: pipe separated commands or list of commands
+    :return: tuple of canonical commands
+    """
+    if isinstance(commands, str):
+        commands = commands.split('|')
+    return tuple(normalize_command(parse_mips_line(item, line=num + 1)) for num, item in enumerate(commands))
+
+
+def analyse_program(program: tuple, fwd_option: str) -> dict:
+    """
+    Hazards and timing of a normalized program as structured data
+    :param program: tuple of canonical commands
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :return: dict
+    """
+    engine = HazardEngine(fwd_option=fwd_option)
+    timing_model = TimingModel()
+    instructions = []
+    for result in engine.run(parse_mips_line(item) for item in program):
+        timing = timing_model.step(stalls=result.stalls, opcode=result.opcode)
+        instructions.append(analysis_record(result, timing=timing).to_dict())
+    return {
+        "forwarding_unit": fwd_option,
+        "instructions": instructions,
+        "summary": summary_dict(timing_model.summary),
+    }
+
+
+class AnalysisService:
+    """
+    Answers analysis requests - from memory when the same program was analysed before
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache = AnalysisCache(maxsize=cache_size)
+
+    def analyse(self, request: dict) -> dict:
+        """
+        Analyse a submission
+        :param request: {"commands": "ADD R0, R1, R2|..." or [...], "forwarding_unit": "off" or "on"}
+        :return: dict with the hazards, timing and whether the result came from the cache
+        """
+        commands = request.get("commands")
+        if isinstance(commands, list) and not all(isinstance(item, str) for item in commands):
+            raise ValueError("'commands' must be a list of strings")
+        if not isinstance(commands, (str, list)) or len(commands) == 0:
+            raise ValueError("'commands' must be a non-empty string or list of commands")
+        fwd_option = request.get("forwarding_unit", "off")
+        if fwd_option not in ["on", "off"]:
+            raise ValueError("'forwarding_unit' must be 'on' or 'off', got {!r}".format(fwd_option))
+        key = (normalize_program(commands), fwd_option)
+        result = self.cache.get(key)
+        cached = result is not None
+        if not cached:
+            result = analyse_program(program=key[0], fwd_option=fwd_option)
+            self.cache.put(key, result)
+        return dict(result, cached=cached)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /analyse with a JSON body, GET /stats for the cache counters, POST /clear to empty the cache
+    """
+
+    # the AnalysisService shared by every request - set by serve()
+    service: AnalysisService = None
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.reply(200, asdict(self.service.cache.stats()))
+        else:
+            self.reply(404, {"error": "Unknown path {}".format(self.path)})
+
+    def do_POST(self):
+        if self.path == "/clear":
+            self.service.cache.clear()
+            self.reply(200, asdict(self.service.cache.stats()))
+            return
+        if self.path != "/analyse":
+            self.reply(404, {"error": "Unknown path {}".format(self.path)})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(request, dict):
+                raise ValueError("request body must be a JSON object")
+            self.reply(200, self.service.analyse(request))
+        except ParseError as error:
+            self.reply(400, {"error": error.message, "line": error.line, "column": error.column})
+        except ValueError as error:
+            self.reply(400, {"error": str(error)})
+
+    def reply(self, status: int, body: dict):
+        """
+        Send a JSON response
+        :param status: HTTP status
+        :param body: JSON serializable body
+        :return:
+        """
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        sys.stderr.write("{} - {}\n".format(self.address_string(), format % args))
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP over a Unix socket - one thread per connection
+    """
+    daemon_threads = True
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, socket_path: str = None, cache_size: int = 1024):
+    """
+    Serve analysis requests until interrupted
+    :param host: address to listen on
+    :param port: TCP port to listen on
+    :param socket_path: Unix socket to listen on instead, if given
+    :param cache_size: number of analysed programs kept in memory
+    :return:
+    """
+    handler = type("Handler", (RequestHandler,), {"service": AnalysisService(cache_size=cache_size)})
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, handler)
+        print("Serving on unix socket {}".format(socket_path))
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print("Serving on http://{}:{}".format(host, port))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    serve(host=args.host, port=args.port, socket_path=args.socket, cache_size=args.cache_size)
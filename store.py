@@ -0,0 +1,128 @@
+from array import array
+from helpers import Instruction
+from helpers import encode_instruction
+from helpers import opcode_names
+from helpers import register_name
+
+
+def offset_value(offset: str) -> int:
+    """
+    Numeric value of a LW/SW offset or ADDI immediate e.g. '8', '-4' or '0x10'
+    :param offset:
+    :return: int
+    """
+    if offset is None or offset == '':
+        return 0
+    try:
+        return int(offset)
+    except ValueError:
+        pass
+    try:
+        return int(offset, 0)
+    except ValueError:
+        raise ValueError("Offset {} is not a number!".format(offset))
+
+
+class InstructionStore:
+    """
+    Columnar instruction store - opcode, rd, rs, rt and offset are kept in integer arrays and the raw text as
+    (start, end) positions into the original buffer. Instruction objects are only built on demand.
+    """
+
+    def __init__(self, buffer=''):
+        """
+        :param buffer: original text (str or bytes) the raw commands are sliced from
+        """
+        self.buffer = buffer
+        # encoded opcode - see helpers.opcode_ids
+        self.opcode = array('b')
+        # interned registers - see helpers.register_id - NO_REG when missing
+        self.rd = array('h')
+        self.rs = array('h')
+        self.rt = array('h')
+        # LW/SW offset - ADDI immediate
+        self.offset = array('q')
+        # position of the raw command within buffer
+        self.start = array('q')
+        self.end = array('q')
+
+    @classmethod
+    def from_columns(cls, buffer, opcode, rd, rs, rt, offset, start, end):
+        """
+        Build a store over existing columns - e.g. memoryviews of a memory-mapped trace, no copy is made
+        :param buffer: original text (str or bytes-like) the raw commands are sliced from
+        :param opcode: opcode column
+        :param rd: rd column
+        :param rs: rs column
+        :param rt: rt column
+        :param offset: offset column
+        :param start: raw command start column
+        :param end: raw command end column
+        :return: InstructionStore
+        """
+        store = cls(buffer=buffer)
+        store.opcode, store.rd, store.rs, store.rt = opcode, rd, rs, rt
+        store.offset, store.start, store.end = offset, start, end
+        return store
+
+    def append(self, item: Instruction, start: int, end: int):
+        """
+        Add a parsed instruction
+        :param item: Instruction
+        :param start: start of item.raw within buffer
+        :param end: end of item.raw within buffer
+        :return:
+        """
+        opcode, rd, rs, rt = encode_instruction(item)
+        self.opcode.append(opcode)
+        self.rd.append(rd)
+        self.rs.append(rs)
+        self.rt.append(rt)
+        self.offset.append(offset_value(item.offset))
+        self.start.append(start)
+        self.end.append(end)
+
+    def __len__(self) -> int:
+        return len(self.opcode)
+
+    def encoded(self, num: int) -> tuple:
+        """
+        Encoded instruction - (opcode, rd, rs, rt)
+        :param num: position of the instruction
+        :return: tuple
+        """
+        return self.opcode[num], self.rd[num], self.rs[num], self.rt[num]
+
+    def raw(self, num: int) -> str:
+        """
+        Raw command as found in the original buffer
+        :param num: position of the instruction
+        :return: str
+        """
+        raw = self.buffer[self.start[num]:self.end[num]]
+        if isinstance(raw, str):
+            return raw
+        return bytes(raw).decode()
+
+    def __getitem__(self, num: int) -> Instruction:
+        """
+        Build the Instruction at a position
+        :param num: position of the instruction
+        :return: Instruction
+        """
+        if num < 0:
+            num += len(self)
+        opcode = opcode_names[self.opcode[num]]
+        offset = None
+        address = None
+        if opcode in ["LW", "SW", "ADDI"]:
+            offset = str(self.offset[num])
+        elif opcode in ["BEQ", "BNE"]:
+            # branch targets are only kept in the raw command
+            address = self.raw(num).upper().replace(',', ' ').split()[-1]
+        return Instruction(opcode=opcode, rd=register_name(self.rd[num]), rs=register_name(self.rs[num]),
+                           rt=register_name(self.rt[num]), offset=offset, address=address, raw=self.raw(num))
+
+    def __iter__(self):
+        for num in range(len(self)):
+            yield self[num]
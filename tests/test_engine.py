@@ -0,0 +1,116 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build import parse_mips_commands  # noqa: E402
+from build import parse_mips_store  # noqa: E402
+from engine import HazardEngine  # noqa: E402
+from helpers import RAW  # noqa: E402
+from helpers import count_stalls  # noqa: E402
+from helpers import detect_hazards_no_fwd  # noqa: E402
+
+
+def table_program(size: int, registers: int, seed: int) -> str:
+    """
+    Random program of the opcodes of the hand-written hazard table - ADD, SUB, LW and SW
+    :param size: number of instructions
+    :param registers: number of distinct registers used - fewer means more hazards
+    :param seed: random seed
+    :return: pipe separated commands
+    """
+    rand = random.Random(seed)
+    commands = []
+    for _ in range(size):
+        opcode = rand.choice(["ADD", "SUB", "LW", "SW"])
+        reg = ["R{}".format(rand.randrange(registers)) for _ in range(3)]
+        if opcode in ["LW", "SW"]:
+            commands.append("{} {}, {}({})".format(opcode, reg[0], 4 * rand.randrange(16), reg[1]))
+        else:
+            commands.append("{} {}, {}, {}".format(opcode, *reg))
+    return '|'.join(commands)
+
+
+def legacy_results(instructions: list, fwd_option: str) -> list:
+    """
+    Hazard messages and stall counts of the legacy per-pair helpers
+    :param instructions: parsed commands
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :return: list of (hazard against num - 1, hazard against num - 2, stalls)
+    """
+    results = []
+    for num, item in enumerate(instructions):
+        previous_1 = instructions[num - 1] if num >= 1 else None
+        previous_2 = instructions[num - 2] if num >= 2 else None
+        hazard_1 = detect_hazards_no_fwd(current=item, previous=previous_1, prev_no=num - 1) if previous_1 else ''
+        hazard_2 = detect_hazards_no_fwd(current=item, previous=previous_2, prev_no=num - 2) if previous_2 else ''
+        stalls = count_stalls(fwd_option=fwd_option, current=item, previous_1=previous_1, hazard_1=hazard_1,
+                              hazard_2=hazard_2, previous_2=previous_2)
+        results.append((hazard_1, hazard_2, stalls))
+    return results
+
+
+class LegacyParityTest(unittest.TestCase):
+    """
+    The single pass engine finds the hazards and stalls of the legacy helpers, whatever the input path
+    """
+
+    def test_instructions(self):
+        for seed in range(20):
+            instructions = parse_mips_commands(table_program(size=200, registers=4, seed=seed))
+            for fwd_option in ["off", "on"]:
+                results = [(result.hazard_1, result.hazard_2, result.stalls)
+                           for result in HazardEngine(fwd_option=fwd_option).run(instructions)]
+                self.assertEqual(results, legacy_results(instructions, fwd_option), (seed, fwd_option))
+
+    def test_columnar_store(self):
+        raw_commands = table_program(size=500, registers=3, seed=7)
+        for fwd_option in ["off", "on"]:
+            streamed = [(result.hazard_1, result.hazard_2, result.stalls)
+                        for result in HazardEngine(fwd_option=fwd_option).run(parse_mips_commands(raw_commands))]
+            stored = [(result.hazard_1, result.hazard_2, result.stalls)
+                      for result in HazardEngine(fwd_option=fwd_option).run_store(parse_mips_store(raw_commands))]
+            self.assertEqual(stored, streamed, fwd_option)
+
+    def test_shape_cache(self):
+        from memo import ShapeCache
+        raw_commands = table_program(size=500, registers=3, seed=11)
+        for fwd_option in ["off", "on"]:
+            plain = [(result.hazard_1, result.hazard_2, result.stalls)
+                     for result in HazardEngine(fwd_option=fwd_option).run(parse_mips_commands(raw_commands))]
+            cached = [(result.hazard_1, result.hazard_2, result.stalls)
+                      for result in HazardEngine(fwd_option=fwd_option, cache=ShapeCache(maxsize=8)).run(
+                          parse_mips_commands(raw_commands))]
+            self.assertEqual(cached, plain, fwd_option)
+
+
+class EngineStateTest(unittest.TestCase):
+    """
+    Window and state handling of the engine
+    """
+
+    def test_dependencies_beyond_two(self):
+        program = "ADD R1, R2, R3|SUB R4, R5, R6|SUB R7, R5, R6|ADD R8, R1, R9"
+        result = list(HazardEngine(fwd_option="off", window=4).run(parse_mips_commands(program)))[-1]
+        # RAW on R1 three instructions back, listed but not stalled on
+        self.assertIn((RAW, 3), [(kind, distance) for kind, distance, _, _ in result.dependencies])
+        self.assertEqual(result.stalls, 0)
+
+    def test_fork(self):
+        load, add, sub = parse_mips_commands("LW R1, 0(R2)|ADD R3, R4, R5|SUB R6, R1, R1")
+        engine = HazardEngine(fwd_option="on")
+        engine.step(load)
+        fork = engine.fork()
+        # the copy and the original go their own ways - each as if run on its own program
+        forked = [fork.step(sub).stalls]
+        original = [engine.step(add).stalls, engine.step(sub).stalls]
+        self.assertEqual(forked, [result.stalls for result in HazardEngine(fwd_option="on").run([load, sub])][1:])
+        self.assertEqual(original,
+                         [result.stalls for result in HazardEngine(fwd_option="on").run([load, add, sub])][1:])
+        self.assertNotEqual(forked[0], original[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
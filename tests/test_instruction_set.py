@@ -0,0 +1,165 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build import parse_mips_commands  # noqa: E402
+from engine import HazardEngine  # noqa: E402
+from helpers import first_derived_opcode  # noqa: E402
+from helpers import opcode_ids  # noqa: E402
+from helpers import operand_roles  # noqa: E402
+from helpers import encode_instruction  # noqa: E402
+from profiling import Profiler  # noqa: E402
+from scheduler import schedule_program  # noqa: E402
+from timing import TimingModel  # noqa: E402
+
+
+def stalls(raw_commands: str, fwd_option: str, branch_penalty: int = None) -> list:
+    """
+    Stall cycles per instruction of a program
+    :param raw_commands: pipe separated commands
+    :param fwd_option: forwarding unit 'on' or 'off'
+    :param branch_penalty: see HazardEngine
+    :return: list of int
+    """
+    engine = HazardEngine(fwd_option=fwd_option, branch_penalty=branch_penalty)
+    return [result.stalls for result in engine.run(parse_mips_commands(raw_commands))]
+
+
+def mixed_program(size: int, registers: int, seed: int) -> str:
+    """
+    Random program over the whole instruction set, branches left out
+    :param size: number of instructions
+    :param registers: number of distinct registers used
+    :param seed: random seed
+    :return: pipe separated commands
+    """
+    rand = random.Random(seed)
+    commands = []
+    for _ in range(size):
+        opcode = rand.choice(["ADD", "SUB", "AND", "OR", "SLT", "MUL", "DIV", "ADDI", "LW", "SW"])
+        reg = ["R{}".format(rand.randrange(registers)) for _ in range(3)]
+        if opcode in ["LW", "SW"]:
+            commands.append("{} {}, 0({})".format(opcode, reg[0], reg[1]))
+        elif opcode == "ADDI":
+            commands.append("ADDI {}, {}, 4".format(reg[0], reg[1]))
+        else:
+            commands.append("{} {}, {}, {}".format(opcode, *reg))
+    return '|'.join(commands)
+
+
+class DerivedStallsTest(unittest.TestCase):
+    """
+    Stalls of the opcodes timed from the stages of the classic pipeline - MUL runs 4 cycles in Execute, DIV 10
+    """
+
+    def test_multiply_result(self):
+        # without forwarding the result is read in Decode once written back, with it at the end of Execute
+        self.assertEqual(stalls("MUL R1, R2, R3|ADD R4, R1, R5", "off"), [0, 5])
+        self.assertEqual(stalls("MUL R1, R2, R3|ADD R4, R1, R5", "on"), [0, 3])
+        # an instruction in between takes its share of the wait
+        self.assertEqual(stalls("MUL R1, R2, R3|ADD R7, R8, R9|ADD R4, R1, R5", "off"), [0, 3, 1])
+
+    def test_divide(self):
+        self.assertEqual(stalls("DIV R1, R2, R3|ADD R4, R1, R5", "off"), [0, 11])
+        self.assertEqual(stalls("DIV R1, R2, R3|ADD R4, R1, R5", "on"), [0, 9])
+
+    def test_busy_unit(self):
+        # no shared register - the instruction right behind waits for Execute to be free
+        for fwd_option in ["off", "on"]:
+            self.assertEqual(stalls("MUL R1, R2, R3|ADD R4, R6, R5", fwd_option), [0, 3])
+            self.assertEqual(stalls("DIV R1, R2, R3|ADD R4, R6, R5", fwd_option), [0, 9])
+
+    def test_immediate_and_load(self):
+        self.assertEqual(stalls("ADDI R1, R2, 4|ADD R4, R1, R5", "off"), [0, 2])
+        self.assertEqual(stalls("ADDI R1, R2, 4|ADD R4, R1, R5", "on"), [0, 0])
+        self.assertEqual(stalls("LW R1, 0(R2)|MUL R4, R1, R5", "off"), [0, 2])
+        self.assertEqual(stalls("LW R1, 0(R2)|MUL R4, R1, R5", "on"), [0, 1])
+
+    def test_branch_penalty(self):
+        self.assertEqual(stalls("BEQ R1, R2, LOOP|ADD R4, R6, R5", "on"), [0, 2])
+        self.assertEqual(stalls("BNE R1, R2, LOOP|ADD R4, R6, R5", "on", branch_penalty=0), [0, 0])
+        self.assertEqual(stalls("BNE R1, R2, LOOP|ADD R4, R6, R5", "off", branch_penalty=5), [0, 5])
+
+    def test_registers_written_back_before_read(self):
+        # without forwarding, an operand is read in Decode no earlier than the cycle it is written back in - for
+        # pairs of hand-written table opcodes, the table and its precedence of num - 2 over num - 1 are kept as is
+        for seed in range(10):
+            instructions = parse_mips_commands(mixed_program(size=150, registers=4, seed=seed))
+            model = TimingModel()
+            timings = [model.step(stalls=result.stalls, opcode=result.opcode)
+                       for result in HazardEngine(fwd_option="off").run(instructions)]
+            written = {}
+            for num, item in enumerate(instructions):
+                encoded = encode_instruction(item)
+                writes, reads = operand_roles[encoded[0]]
+                for role in reads:
+                    producer = written.get(encoded[role])
+                    if producer is not None and (encoded[0] >= first_derived_opcode or
+                                                 opcode_ids[instructions[producer].opcode] >= first_derived_opcode):
+                        self.assertGreaterEqual(timings[num].stage_cycles[1], timings[producer].stage_cycles[-1],
+                                                (seed, num, producer))
+                for role in writes:
+                    written[encoded[role]] = num
+
+
+class ExtendedProfileTest(unittest.TestCase):
+    """
+    --profile books every stall of the extended instruction set under what it waits on
+    """
+
+    def rules(self, raw_commands: str) -> dict:
+        profiler = Profiler()
+        list(profiler.observe(HazardEngine(fwd_option="off").run(parse_mips_commands(raw_commands))))
+        return {key: stall_cycles for key, (stall_cycles, _) in profiler.stall_rules.items()}
+
+    def test_stall_causes(self):
+        self.assertEqual(self.rules("MUL R1, R2, R3|ADD R4, R1, R5"),
+                         {"RAW MUL -> ADD at distance 1 (pipeline stages)": 5})
+        self.assertEqual(self.rules("DIV R1, R2, R3|ADD R4, R6, R5"), {"structural (DIV unit busy) -> ADD": 9})
+        self.assertEqual(self.rules("BEQ R1, R2, LOOP|ADD R4, R6, R5"), {"branch penalty after BEQ": 2})
+
+
+class BranchSchedulingTest(unittest.TestCase):
+    """
+    --schedule never moves an instruction across a branch, whoever split the program into blocks
+    """
+
+    def test_blocks_split_at_branches(self):
+        instructions = parse_mips_commands("LW R1, 0(R2)|ADD R3, R1, R4|BEQ R5, R6, LOOP|"
+                                           "LW R7, 0(R2)|ADD R8, R7, R4|SUB R9, R10, R11")
+        for fwd_option in ["off", "on"]:
+            outcome = schedule_program([instructions], fwd_option=fwd_option)
+            self.assertEqual(outcome.blocks, 2)
+            order = [item.raw for item in outcome.instructions]
+            self.assertEqual(order[2], "BEQ R5, R6, LOOP")
+            self.assertEqual(sorted(order[:2]), sorted(item.raw for item in instructions[:2]))
+            self.assertLessEqual(outcome.after.cycles, outcome.before.cycles)
+
+    def test_dependencies_kept(self):
+        for seed in range(5):
+            instructions = parse_mips_commands(mixed_program(size=40, registers=5, seed=seed))
+            outcome = schedule_program([instructions], fwd_option="off")
+            self.assertEqual(sorted(item.raw for item in outcome.instructions),
+                             sorted(item.raw for item in instructions))
+            self.assertLessEqual(outcome.after.cycles, outcome.before.cycles)
+            # every register read still sees the same writer
+            self.assertEqual(self.writers(outcome.instructions), self.writers(instructions))
+
+    @staticmethod
+    def writers(instructions: list) -> list:
+        last = {}
+        seen = []
+        for item in instructions:
+            encoded = encode_instruction(item)
+            writes, reads = operand_roles[encoded[0]]
+            seen.extend((item.raw, encoded[role], last.get(encoded[role])) for role in reads)
+            for role in writes:
+                last[encoded[role]] = item.raw
+        return sorted(seen, key=repr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import sys
+import pickle
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from build import ParseError  # noqa: E402
+from build import parse_mips_commands  # noqa: E402
+from build import parse_mips_line  # noqa: E402
+from build import parse_mips_store  # noqa: E402
+from build import stream_mips_commands  # noqa: E402
+from helpers import Instruction  # noqa: E402
+from helpers import opcode_ids  # noqa: E402
+from helpers import register_ids  # noqa: E402
+
+
+class ParseLineTest(unittest.TestCase):
+    """
+    Fields of every operand form - registers, memory locations, immediates and branch targets
+    """
+
+    def test_register_operands(self):
+        self.assertEqual(parse_mips_line("add r1, R2,$t0"),
+                         Instruction(opcode="ADD", rd="R1", rs="R2", rt="$T0", raw="add r1, R2,$t0"))
+
+    def test_separators(self):
+        # commas and whitespace in any mix, as with the previous tokenizer
+        for raw in ["SUB R1 R2 R3", "SUB,R1,R2,R3", " SUB R1 ,R2,, R3 ,", "SUB\tR1,\tR2,\tR3"]:
+            item = parse_mips_line(raw)
+            self.assertEqual((item.opcode, item.rd, item.rs, item.rt), ("SUB", "R1", "R2", "R3"), raw)
+
+    def test_memory_operands(self):
+        load = parse_mips_line("LW R4, 8(R3)")
+        self.assertEqual((load.rs, load.rt, load.offset), ("R3", "R4", "8"))
+        store = parse_mips_line("sw r4, -0x10(r3)")
+        self.assertEqual((store.rs, store.rt, store.offset), ("R4", "R3", "-0X10"))
+        # the offset is optional
+        self.assertEqual(parse_mips_line("LW R4, (R3)").offset, "")
+
+    def test_immediate_and_branch(self):
+        item = parse_mips_line("ADDI R1, R2, 0x1F")
+        self.assertEqual((item.rd, item.rs, item.rt, item.offset), ("R1", "R2", None, "0X1F"))
+        item = parse_mips_line("BNE R1, R2, loop")
+        self.assertEqual((item.rd, item.rs, item.rt, item.address), (None, "R1", "R2", "LOOP"))
+
+    def test_register_names(self):
+        for name in ["R0", "R31", "$0", "$31", "$ZERO", "$SP", "$T9", "$S7", "$K1"]:
+            self.assertEqual(parse_mips_line("ADD {0}, {0}, {0}".format(name)).rd, name)
+        for name in ["R32", "R01", "$32", "$T10", "$S8", "X1"]:
+            with self.assertRaises(ParseError, msg=name):
+                parse_mips_line("ADD R1, {}, R2".format(name))
+
+
+class ParseErrorTest(unittest.TestCase):
+    """
+    Message, line and column of every way a command can be malformed
+    """
+
+    def error(self, raw: str, line: int = 3, column: int = 5) -> ParseError:
+        with self.assertRaises(ParseError) as context:
+            parse_mips_line(raw, line=line, column=column)
+        return context.exception
+
+    def test_empty_command(self):
+        error = self.error("  ")
+        self.assertEqual((error.message, error.line, error.column), ("Empty command", 3, 5))
+
+    def test_unknown_opcode(self):
+        error = self.error("MOV R1, R2")
+        self.assertEqual(error.message, "Opcode MOV not supported! Please resubmit")
+        self.assertEqual(error.column, 5)
+        self.assertEqual(str(error), "line 3, column 5: Opcode MOV not supported! Please resubmit")
+
+    def test_invalid_register(self):
+        error = self.error("ADD R1, R2, R40")
+        self.assertEqual(error.message, "Register R40 not valid - registers are R0 to R31 or $0 to $31")
+        self.assertEqual(error.column, 5 + len("ADD R1, R2, "))
+        # the base register of a memory location
+        error = self.error("LW R1, 8(R99)")
+        self.assertEqual(error.message, "Register R99 not valid - registers are R0 to R31 or $0 to $31")
+        self.assertEqual(error.column, 5 + len("LW R1, 8("))
+
+    def test_offset_not_a_number(self):
+        error = self.error("LW R1, zz(R2)")
+        self.assertEqual(error.message, "Offset zz is not a number - offsets are decimal or hexadecimal")
+        self.assertEqual(error.column, 5 + len("LW R1, "))
+
+    def test_immediate_not_a_number(self):
+        error = self.error("ADDI R1, R2, four")
+        self.assertEqual(error.message, "Immediate four is not a number - immediates are decimal or hexadecimal")
+        self.assertEqual(error.column, 5 + len("ADDI R1, R2, "))
+
+    def test_wrong_operands(self):
+        expected = {
+            "ADD R1, R2": "ADD expects three registers 'rd, rs, rt', got 'R1, R2'",
+            "ADDI R1, R2": "ADDI expects two registers and an immediate 'rd, rs, imm', got 'R1, R2'",
+            "BEQ R1": "BEQ expects two registers and a branch target 'rs, rt, label', got 'R1'",
+            "SW R1, R2": "SW expects a register and a memory location 'rt, offset(rs)', got 'R1, R2'",
+        }
+        for raw, message in expected.items():
+            error = self.error(raw)
+            self.assertEqual(error.message, message)
+            self.assertEqual(error.column, 5 + raw.index(' ') + 1)
+
+    def test_survives_pickling(self):
+        # raised in --jobs worker processes and rebuilt in the parent
+        error = pickle.loads(pickle.dumps(self.error("MOV R1, R2")))
+        self.assertEqual((error.message, error.line, error.column),
+                         ("Opcode MOV not supported! Please resubmit", 3, 5))
+
+
+class InputPathTest(unittest.TestCase):
+    """
+    --commands (list and columnar store) and --input (streamed lines) parse and reject commands the same way
+    """
+
+    program = "LW R1, 8(R2)|add r3, r1, r4|ADDI R5, R3, -2|BEQ R5, R0, done|SW R5, 0x4(R2)"
+
+    def test_same_instructions(self):
+        instructions = parse_mips_commands(self.program)
+        self.assertEqual(instructions, list(stream_mips_commands(self.program.split('|'))))
+        store = parse_mips_store(self.program)
+        self.assertEqual(len(store), len(instructions))
+        for num, item in enumerate(instructions):
+            self.assertEqual(store.opcode[num], opcode_ids[item.opcode])
+            self.assertEqual(store.rs[num], register_ids[item.rs])
+        self.assertEqual(list(store.offset), [8, 0, -2, 0, 4])
+
+    def test_same_errors(self):
+        raw_commands = "ADD R1, R2, R3|LW R1, zz(R2)"
+        errors = []
+        for parse in [parse_mips_commands, parse_mips_store,
+                      lambda commands: list(stream_mips_commands(commands.split('|')))]:
+            with self.assertRaises(ParseError) as context:
+                parse(raw_commands)
+            errors.append((context.exception.message, context.exception.line, context.exception.column))
+        self.assertEqual(errors, [("Offset zz is not a number - offsets are decimal or hexadecimal", 2, 8)] * 3)
+
+    def test_source_lines(self):
+        # comments, labels, directives and blank lines are dropped - errors keep their line and column
+        lines = [".text", "", "loop:  ADD R1, R2, R3  # sum", "    ; nothing", "  SUB R4, R1, R9x"]
+        with self.assertRaises(ParseError) as context:
+            list(stream_mips_commands(lines))
+        self.assertEqual((context.exception.line, context.exception.column), (5, 3 + len("SUB R4, R1, ")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from build import parse_args  # noqa: E402
+from build import parse_mips_commands  # noqa: E402
+from engine import HazardEngine  # noqa: E402
+from pipeline import PipelineError  # noqa: E402
+from pipeline import classic  # noqa: E402
+from pipeline import compile_pipeline  # noqa: E402
+from pipeline import load_pipeline  # noqa: E402
+
+# Example descriptions shipped with the repository
+mips5_path = os.path.join(root, "pipelines", "mips5.json")
+slow_memory_path = os.path.join(root, "pipelines", "slow_memory.json")
+
+
+def description() -> dict:
+    """
+    Fresh copy of the classic 5-stage description, to be broken by a test
+    :return: dict
+    """
+    with open(mips5_path) as mips5:
+        return json.load(mips5)
+
+
+class CompilePipelineTest(unittest.TestCase):
+    """
+    Every malformed field is reported as a PipelineError naming its key
+    """
+
+    def error(self, config: dict) -> str:
+        with self.assertRaises(PipelineError) as context:
+            compile_pipeline(config)
+        return str(context.exception)
+
+    def test_valid_descriptions(self):
+        self.assertEqual(compile_pipeline(description()).name, "Classic 5-stage MIPS pipeline")
+        self.assertEqual(load_pipeline(slow_memory_path).name, "5-stage MIPS pipeline with a 3-cycle data memory")
+
+    def test_field_types(self):
+        broken = {
+            "opcodes.ADD: expected an object, got 'alu'": ("opcodes", "ADD", "alu"),
+            "units.multiply.latency: expected an integer, got '4'": ("units", "multiply", {"latency": "4"}),
+            "units.alu: expected an object, got 1": ("units", "alu", 1),
+            "opcodes.SW.reads.rs: expected a string, got 3": ("opcodes", "SW", {"reads": {"rs": 3}}),
+            "opcodes.LW.writes: expected a string, got ['M']": ("opcodes", "LW", {"writes": ["M"]}),
+        }
+        for message, (section, key, value) in broken.items():
+            config = description()
+            if isinstance(value, dict) and isinstance(config[section][key], dict):
+                config[section][key].update(value)
+            else:
+                config[section][key] = value
+            self.assertEqual(self.error(config), message)
+
+    def test_top_level_types(self):
+        broken = {
+            "stages: expected a list, got 'FDXMW'": ("stages", "FDXMW"),
+            "stages[0]: expected a string, got 1": ("stages", [1, 2, 3]),
+            "split_cycle: expected true or false, got 1": ("split_cycle", 1),
+            "branch_penalty: expected an integer, got '2'": ("branch_penalty", "2"),
+            "branch_penalty: expected an integer, got True": ("branch_penalty", True),
+            "forwarding: expected a list, got 'XX'": ("forwarding", "XX"),
+            "forwarding[0]: expected a [from, to] pair of stages, got ['X']": ("forwarding", [["X"]]),
+            "units: expected an object, got []": ("units", []),
+            "opcodes: expected an object, got []": ("opcodes", []),
+            "name: expected a string, got 5": ("name", 5),
+        }
+        for message, (key, value) in broken.items():
+            config = description()
+            config[key] = value
+            self.assertEqual(self.error(config), message)
+
+    def test_values(self):
+        config = description()
+        config["units"]["divide"]["latency"] = 0
+        self.assertEqual(self.error(config), "units.divide: latency must be at least 1")
+        config = description()
+        config["opcodes"]["MUL"]["unit"] = "vector"
+        self.assertEqual(self.error(config), "opcodes.MUL: unknown unit 'vector'")
+        config = description()
+        del config["opcodes"]["SW"]
+        self.assertEqual(self.error(config), "opcodes: no description for SW")
+        config = description()
+        config["register_read"] = "Q"
+        self.assertEqual(self.error(config), "register_read: unknown stage 'Q' - stages are F, D, X, M, W")
+
+    def test_unreadable_files(self):
+        with self.assertRaises(PipelineError):
+            load_pipeline(os.path.join(root, "pipelines", "missing.json"))
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as broken:
+            broken.write("{\"stages\": [")
+        try:
+            with self.assertRaises(PipelineError):
+                load_pipeline(broken.name)
+        finally:
+            os.remove(broken.name)
+
+    def test_command_line(self):
+        # a missing --pipeline is an argument error, like a missing --input
+        with redirect_stderr(StringIO()) as stderr, self.assertRaises(SystemExit):
+            parse_args(["--commands", "ADD R1, R2, R3", "--operation", "detect", "--forwarding_unit", "off",
+                        "--pipeline", os.path.join(root, "pipelines", "missing.json")])
+        self.assertIn("--pipeline", stderr.getvalue())
+        self.assertIn("cannot be read", stderr.getvalue())
+
+
+class PipelineStallsTest(unittest.TestCase):
+    """
+    Stalls derived from a pipeline description
+    """
+
+    def stalls(self, raw_commands: str, path: str, fwd_option: str) -> list:
+        engine = HazardEngine(fwd_option=fwd_option, pipeline=load_pipeline(path))
+        return [result.stalls for result in engine.run(parse_mips_commands(raw_commands))]
+
+    def test_classic_is_mips5(self):
+        # the built-in pipeline is the shipped description, not a copy of it
+        loaded = load_pipeline(mips5_path)
+        self.assertEqual((classic.offsets, classic.reach, classic.structural, classic.branch_penalty),
+                         (loaded.offsets, loaded.reach, loaded.structural, loaded.branch_penalty))
+
+    def test_mips5_matches_hazard_table(self):
+        # the classic description gives the stalls of the hand-written table
+        program = "LW R1, 0(R2)|ADD R3, R1, R4|SUB R5, R3, R1|SW R5, 4(R2)|ADD R6, R7, R8|ADD R9, R6, R6"
+        for fwd_option in ["off", "on"]:
+            table = [result.stalls for result in HazardEngine(fwd_option=fwd_option).run(
+                parse_mips_commands(program))]
+            self.assertEqual(self.stalls(program, mips5_path, fwd_option), table, fwd_option)
+
+    def test_slow_memory(self):
+        # a load result is only ready after three cycles of data memory
+        self.assertEqual(self.stalls("LW R1, 0(R2)|ADD R3, R1, R4", mips5_path, "on"), [0, 1])
+        self.assertEqual(self.stalls("LW R1, 0(R2)|ADD R3, R1, R4", slow_memory_path, "on"), [0, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,394 @@
+import sys
+from dataclasses import dataclass
+from dataclasses import replace
+from typing import Iterable, Iterator
+from helpers import first_derived_opcode
+from helpers import section_length
+from helpers import stall_stage
+from helpers import timing_step
+from pipeline import classic
+
+# Pipeline stages in order - stalls are inserted right after Fetch
+stages = ("F", "D", "X", "M", "W")
+# width of a cycle column in the timing diagram - '---F---|'
+column_width = 8
+
+
+# Define a data class around the timing of a single instruction
+@dataclass
+class InstructionTiming:
+    # position of the instruction in the program
+    num: int
+    # cycle the instruction is fetched (cycles start at 1)
+    issue: int
+    # stall cycles between Fetch and Decode
+    stalls: int
+    # cycle each stage completes - F, D, X, M, W
+    stage_cycles: tuple
+    # stage of every cycle after Fetch - one per stage unless a stage takes more than a cycle
+    steps: tuple = stages[1:]
+
+    @property
+    def complete(self) -> int:
+        """
+        Cycle the instruction leaves the pipeline (Write Back)
+        :return: int
+        """
+        return self.stage_cycles[-1]
+
+
+# Define a data class around the timing of a whole program
+@dataclass
+class TimingSummary:
+    # number of instructions
+    instructions: int = 0
+    # cycle the last instruction completes
+    cycles: int = 0
+    # stall cycles over all instructions
+    stalls: int = 0
+
+    @property
+    def cpi(self) -> float:
+        """
+        Cycles per instruction
+        :return: float
+        """
+        if self.instructions == 0:
+            return 0.0
+        return self.cycles / self.instructions
+
+
+def instruction_timing(num: int, issue: int, stalls: int, offsets: tuple = None,
+                       steps: tuple = None) -> InstructionTiming:
+    """
+    Stage completion cycles of an instruction fetched at `issue` and stalled `stalls` cycles after Fetch
+    :param num: position of the instruction
+    :param issue: fetch cycle
+    :param stalls: stall cycles
+    :param offsets: cycle each stage completes after the fetch cycle (plus stalls) - one cycle per stage if not given
+    :param steps: stage of every cycle after Fetch - see Pipeline.steps
+    :return: InstructionTiming
+    """
+    if offsets is None:
+        stage_cycles = (issue,) + tuple(issue + stalls + step for step in range(1, len(stages)))
+        return InstructionTiming(num=num, issue=issue, stalls=stalls, stage_cycles=stage_cycles)
+    stage_cycles = (issue + offsets[0],) + tuple(issue + stalls + offset for offset in offsets[1:])
+    return InstructionTiming(num=num, issue=issue, stalls=stalls, stage_cycles=stage_cycles, steps=steps)
+
+
+class TimingModel:
+    """
+    In-order pipeline timing - an instruction is fetched in the cycle the previous one is decoded,
+    so stalls push back every later instruction. Only integers are kept per instruction.
+    """
+
+    def __init__(self, pipeline=None):
+        """
+        :param pipeline: compiled pipeline description giving the stages of each opcode - the 5-stage pipeline
+        if not given
+        """
+        # fetch cycle of the next instruction
+        self.next_issue = 1
+        self.summary = TimingSummary()
+        self.pipeline = pipeline
+
+    def step(self, stalls: int, opcode: int = None) -> InstructionTiming:
+        """
+        Time the next instruction of the program
+        :param stalls: stall cycles of the instruction
+        :param opcode: encoded opcode - only needed with a pipeline description or for derived opcodes, which
+        can take more than a cycle per stage
+        :return: InstructionTiming
+        """
+        pipeline = self.pipeline
+        if pipeline is None and opcode is not None and opcode >= first_derived_opcode:
+            pipeline = classic
+        if pipeline is None:
+            timing = instruction_timing(num=self.summary.instructions, issue=self.next_issue, stalls=stalls)
+        else:
+            timing = instruction_timing(num=self.summary.instructions, issue=self.next_issue, stalls=stalls,
+                                        offsets=pipeline.offsets[opcode], steps=pipeline.steps[opcode])
+        # the next instruction is fetched while this one is decoded
+        self.next_issue = timing.issue + stalls + 1
+        self.summary.instructions += 1
+        self.summary.stalls += stalls
+        self.summary.cycles = timing.complete
+        return timing
+
+    def fork(self) -> 'TimingModel':
+        """
+        Copy of the model - the copy and the original can then time different instructions
+        :return: TimingModel
+        """
+        other = TimingModel(pipeline=self.pipeline)
+        other.next_issue = self.next_issue
+        other.summary = replace(self.summary)
+        return other
+
+    def advance(self, instructions: int, stalls: int):
+        """
+        Time instructions without stepping through them - e.g. iterations of a loop in steady state, which
+        repeat the timing of the iteration before shifted by its cycles
+        :param instructions: number of instructions
+        :param stalls: stall cycles over all of them
+        :return:
+        """
+        self.next_issue += instructions + stalls
+        self.summary.instructions += instructions
+        self.summary.stalls += stalls
+        self.summary.cycles += instructions + stalls
+
+    def run(self, stalls: Iterable[int]) -> Iterator[InstructionTiming]:
+        """
+        Time a stream of instructions
+        :param stalls: stall cycles per instruction
+        :return: generator of InstructionTiming
+        """
+        for count in stalls:
+            yield self.step(count)
+
+
+def render_steps(stalls: int, dash_length: int = None, steps: tuple = stages[1:], fetch: str = stages[0]) -> str:
+    """
+    Pipeline steps of a timing diagram row e.g. '|---F---|---S---|---D---|...'
+    :param stalls: stall cycles
+    :param dash_length: length of each pipeline section, from the terminal width if not given
+    :param steps: stage of every cycle after Fetch
+    :param fetch: name of the Fetch stage
+    :return: str
+    """
+    if dash_length is None:
+        dash_length = section_length()
+    row = [timing_step(stage=fetch, dash_length=dash_length)]
+    row = row + [timing_step(stage=stall_stage["short"], dash_length=dash_length)] * stalls
+    row = row + [timing_step(stage=stage, dash_length=dash_length) for stage in steps]
+    return '|' + '|'.join(row) + '|'
+
+
+def render_timing_row(raw: str, timing: InstructionTiming, dash_length: int = None,
+                      fetch: str = stages[0]) -> str:
+    """
+    Timing diagram row of an instruction - indented to its fetch cycle
+    :param raw: raw command
+    :param timing: InstructionTiming
+    :param dash_length: length of each pipeline section, from the terminal width if not given
+    :param fetch: name of the Fetch stage
+    :return: str
+    """
+    return raw.ljust(15) + ' ---> ' + ' ' * (timing.issue - 1) * column_width + render_steps(
+        stalls=timing.stalls, dash_length=dash_length, steps=timing.steps, fetch=fetch)
+
+
+def render_summary(summary: TimingSummary) -> str:
+    """
+    Summary line of a timing diagram
+    :param summary: TimingSummary
+    :return: str
+    """
+    return "- Total cycles: {} - Stall cycles: {} - Instructions: {} - CPI: {:.2f} -".format(
+        summary.cycles, summary.stalls, summary.instructions, summary.cpi)
+
+
+def render_speedup(summary_off: TimingSummary, summary_on: TimingSummary) -> str:
+    """
+    Summary line of a forwarding comparison - what the forwarding unit saves
+    :param summary_off: TimingSummary with the forwarding unit off
+    :param summary_on: TimingSummary with the forwarding unit on
+    :return: str
+    """
+    speedup = summary_off.cycles / summary_on.cycles if summary_on.cycles else 1.0
+    return "- Speedup from forwarding: {:.2f}x - Cycles saved: {} - Stall cycles saved: {} - CPI: {:.2f} -> {:.2f} -"\
+        .format(speedup, summary_off.cycles - summary_on.cycles, summary_off.stalls - summary_on.stalls,
+                summary_off.cpi, summary_on.cpi)
+
+
+def stage_cells(timing: InstructionTiming, fetch: str = stages[0]) -> list:
+    """
+    Stage an instruction is in for every cycle from its fetch cycle on - stalls show as 'S'
+    :param timing: InstructionTiming
+    :param fetch: name of the Fetch stage
+    :return: list of stage names
+    """
+    return [fetch] + [stall_stage["short"]] * timing.stalls + list(timing.steps)
+
+
+class RowWriter:
+    """
+    Text written through a buffer - one write call per `size` characters instead of one print per row
+    """
+
+    def __init__(self, out=None, size: int = 1 << 16):
+        """
+        :param out: writable text file, stdout by default
+        :param size: characters held before they are written
+        """
+        self.out = out
+        self.size = size
+        self.buffer = []
+        self.pending = 0
+
+    def write(self, line: str):
+        """
+        Write a line
+        :param line: text without its line break
+        :return:
+        """
+        self.buffer.append(line)
+        self.buffer.append('\n')
+        self.pending += len(line) + 1
+        if self.pending >= self.size:
+            self.flush()
+
+    def flush(self):
+        (self.out or sys.stdout).write(''.join(self.buffer))
+        self.buffer = []
+        self.pending = 0
+
+
+class DiagramWindow:
+    """
+    Timing diagram of a range of cycles, optionally split into pages of `page_cycles` cycles. Rows are indented
+    from the first cycle of the page rather than from cycle 1, so the output grows linearly with the program
+    instead of quadratically. Rows come in fetch order, so a page is complete as soon as a row is fetched after
+    it - only the rows overlapping the page being built are held.
+    """
+
+    def __init__(self, writer: RowWriter, style: str = "full", page_cycles: int = None, first: int = 1,
+                 last: int = None, dash_length: int = None):
+        """
+        :param writer: RowWriter the diagram is written to
+        :param style: 'full' for '|---F---|' sections, 'compact' for one character per cycle
+        :param page_cycles: cycles per page, a single page if not given
+        :param first: first cycle shown
+        :param last: last cycle shown, up to the end of the program if not given
+        :param dash_length: length of each pipeline section of the 'full' style, from the terminal width if not
+        given
+        """
+        self.writer = writer
+        self.style = style
+        self.page_cycles = page_cycles
+        self.first = first
+        self.last = last
+        self.dash_length = dash_length
+        self.width = None
+        # first cycle of the page being built
+        self.page_start = first
+        # (raw, fetch cycle, stage per cycle) of the rows overlapping the page being built
+        self.rows = []
+        # whether the header of a single page was written
+        self.started = False
+
+    def cell(self, stage: str) -> str:
+        if self.style == "compact":
+            return stage
+        return '|' + timing_step(stage=stage, dash_length=self.dash_length)
+
+    def page_end(self) -> int:
+        """
+        Cycle after the last one of the page being built
+        :return: int
+        """
+        end = self.page_start + self.page_cycles if self.page_cycles is not None else None
+        if self.last is not None:
+            end = self.last + 1 if end is None else min(end, self.last + 1)
+        return end
+
+    def render_row(self, raw: str, issue: int, cells: list, start: int, end: int) -> str:
+        """
+        Row of an instruction clipped to cycles [start, end)
+        :param raw: raw command
+        :param issue: fetch cycle
+        :param cells: stage per cycle from the fetch cycle on
+        :param start: first cycle of the page
+        :param end: cycle after the last one of the page, None for no end
+        :return: str, None if the instruction is not in the pipeline in those cycles
+        """
+        shown = cells[max(start - issue, 0):len(cells) if end is None else max(end - issue, 0)]
+        if not shown:
+            return None
+        indent = max(issue - start, 0)
+        if self.style == "compact":
+            return raw.ljust(15) + ' | ' + ' ' * indent + ''.join(shown)
+        if self.width is None:
+            self.width = len(self.cell(stage=stages[0]))
+        return raw.ljust(15) + ' ---> ' + ' ' * indent * self.width + ''.join(
+            self.cell(stage=stage) for stage in shown) + '|'
+
+    def header(self, start: int, end: int):
+        """
+        Cycle numbers of a page
+        :param start: first cycle of the page
+        :param end: cycle after the last one of the page
+        :return:
+        """
+        self.writer.write("- Cycles {} to {} -".format(start, end - 1))
+        if self.style == "compact":
+            self.writer.write(' ' * 18 + ''.join(str(cycle % 10) for cycle in range(start, end)))
+        else:
+            if self.width is None:
+                self.width = len(self.cell(stage=stages[0]))
+            self.writer.write(' ' * 21 + ''.join(
+                '|' + str(cycle).center(self.width - 1) for cycle in range(start, end)) + '|')
+
+    def flush_page(self, end: int):
+        """
+        Write the page being built and start the next one
+        :param end: cycle after the last one of the page
+        :return:
+        """
+        self.header(self.page_start, end)
+        kept = []
+        for raw, issue, cells in self.rows:
+            row = self.render_row(raw, issue, cells, self.page_start, end)
+            if row is not None:
+                self.writer.write(row)
+            if issue + len(cells) > end:
+                kept.append((raw, issue, cells))
+        self.rows = kept
+        self.page_start = end
+
+    def add(self, raw: str, timing: InstructionTiming, fetch: str = stages[0]):
+        """
+        Place the row of the next instruction
+        :param raw: raw command
+        :param timing: InstructionTiming
+        :param fetch: name of the Fetch stage
+        :return:
+        """
+        cells = stage_cells(timing, fetch=fetch)
+        issue = timing.issue
+        if issue + len(cells) <= self.first or (self.last is not None and self.page_start > self.last):
+            return
+        if self.page_cycles is None:
+            # a single page - rows are written as they come
+            if not self.started:
+                self.started = True
+                if self.last is not None:
+                    self.header(self.first, self.last + 1)
+                else:
+                    self.writer.write("- Cycles from {} -".format(self.first))
+            row = self.render_row(raw, issue, cells, self.first, self.page_end())
+            if row is not None:
+                self.writer.write(row)
+            return
+        while issue >= self.page_end():
+            if not self.rows:
+                # nothing in the pipeline - skip to the page this row starts in
+                self.page_start += (issue - self.page_start) // self.page_cycles * self.page_cycles
+                if issue < self.page_end():
+                    break
+            self.flush_page(self.page_end())
+            if self.last is not None and self.page_start > self.last:
+                self.rows = []
+                return
+        self.rows.append((raw, issue, cells))
+
+    def close(self):
+        """
+        Write the pages still being built
+        :return:
+        """
+        if self.page_cycles is None:
+            return
+        while self.rows and (self.last is None or self.page_start <= self.last):
+            self.flush_page(self.page_end())
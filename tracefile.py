@@ -0,0 +1,167 @@
+import os
+import sys
+import mmap
+import shutil
+import struct
+import argparse
+import tempfile
+from array import array
+from typing import Iterable
+from build import parse_mips_line
+from build import ParseError
+from build import read_mips_lines
+from helpers import register_id
+from helpers import register_names
+from store import InstructionStore
+
+# File signature - the last byte is the format version
+magic = b"MIPSTRC\x01"
+# magic, byte order (1 little endian), instruction count, then (offset, length) of the register names,
+# the raw text and every column
+header_format = "<8sQQ" + "QQ" * 9
+header_size = struct.calcsize(header_format)
+# columns of InstructionStore and their array typecodes - fixed width per instruction
+columns = [("opcode", 'b'), ("rd", 'h'), ("rs", 'h'), ("rt", 'h'), ("offset", 'q'), ("start", 'q'), ("end", 'q')]
+
+
+def parse_args(argv=None):
+    """
+    This function is used to parse runtime arguments
+    :param argv:
+    :return: argparse object
+    """
+    parser = argparse.ArgumentParser(description="Convert a MIPS source (.s) or trace file to the binary trace format")
+    parser.add_argument(
+        "--input",
+        required=True,
+        help="Path to a MIPS source (.s) or trace file with one instruction per line; '-' reads from stdin"
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="Path of the binary trace written"
+    )
+    return parser.parse_args(argv)
+
+
+def align(position: int) -> int:
+    """
+    Next multiple of 8 - columns start aligned so they can be cast in place
+    :param position:
+    :return: int
+    """
+    return (position + 7) & ~7
+
+
+def is_trace_file(path: str) -> bool:
+    """
+    Whether a file is a binary trace
+    :param path:
+    :return: bool
+    """
+    with open(path, 'rb') as trace:
+        return trace.read(len(magic)) == magic
+
+
+def convert_trace(lines: Iterable[str], path: str, batch: int = 1 << 20) -> int:
+    """
+    Convert MIPS commands to a binary trace. Commands are parsed `batch` at a time and every column is
+    spilled to its own temporary file, so memory stays bounded whatever the length of the trace.
+    :param lines: iterable of raw lines e.g. an open file
+    :param path: path of the binary trace written
+    :param batch: number of instructions held in memory at a time
+    :return: number of instructions written
+    """
+    with tempfile.TemporaryDirectory() as spill:
+        parts = {name: open(os.path.join(spill, name), 'wb') for name, _ in columns}
+        text = open(os.path.join(spill, "text"), 'wb')
+        position = 0
+        count = 0
+        store = InstructionStore()
+        for number, column, item in read_mips_lines(lines):
+            raw = item.encode()
+            store.append(parse_mips_line(item, line=number, column=column), start=position, end=position + len(raw))
+            text.write(raw + b'\n')
+            position += len(raw) + 1
+            if len(store) >= batch:
+                count += spill_columns(store, parts)
+                store = InstructionStore()
+        count += spill_columns(store, parts)
+        for part in parts.values():
+            part.close()
+        text.close()
+        # lay the sections out one after the other, each aligned
+        names = '\n'.join(register_names).encode()
+        sections = [names, os.path.join(spill, "text")] + [os.path.join(spill, name) for name, _ in columns]
+        layout = []
+        offset = align(header_size)
+        for section in sections:
+            length = len(section) if isinstance(section, bytes) else os.path.getsize(section)
+            layout.append((offset, length))
+            offset = align(offset + length)
+        with open(path, 'wb') as trace:
+            fields = [field for section in layout for field in section]
+            trace.write(struct.pack(header_format, magic, int(sys.byteorder == "little"), count, *fields))
+            for section, (offset, length) in zip(sections, layout):
+                trace.write(b'\0' * (offset - trace.tell()))
+                if isinstance(section, bytes):
+                    trace.write(section)
+                else:
+                    with open(section, 'rb') as part:
+                        shutil.copyfileobj(part, trace)
+    return count
+
+
+def spill_columns(store: InstructionStore, parts: dict) -> int:
+    """
+    Append the columns of a store to their temporary files
+    :param store: InstructionStore
+    :param parts: column name -> open binary file
+    :return: number of instructions spilled
+    """
+    for name, _ in columns:
+        getattr(store, name).tofile(parts[name])
+    return len(store)
+
+
+def load_trace(path: str) -> InstructionStore:
+    """
+    Memory-map a binary trace - the columns of the returned store are views over the file, nothing is read
+    up front. Register ids are only remapped (copied) if this process interned registers in another order.
+    :param path: binary trace path
+    :return: InstructionStore
+    """
+    with open(path, 'rb') as trace:
+        mapped = mmap.mmap(trace.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    header = struct.unpack(header_format, view[:header_size])
+    signature, little, count = header[:3]
+    if signature != magic:
+        raise ValueError("{} is not a binary trace!".format(path))
+    if little != int(sys.byteorder == "little"):
+        raise ValueError("{} was written on a machine with another byte order!".format(path))
+    layout = list(zip(header[3::2], header[4::2]))
+    (names_offset, names_length), (text_offset, text_length) = layout[:2]
+    data = {}
+    for (name, typecode), (offset, length) in zip(columns, layout[2:]):
+        data[name] = view[offset:offset + length].cast(typecode)
+    names = bytes(view[names_offset:names_offset + names_length]).decode()
+    ids = [register_id(name) for name in names.split('\n')] if names else []
+    if ids != list(range(len(ids))):
+        # registers of the file are numbered differently in this process
+        for name in ["rd", "rs", "rt"]:
+            data[name] = array('h', (ids[reg] if reg >= 0 else reg for reg in data[name]))
+    return InstructionStore.from_columns(buffer=view[text_offset:text_offset + text_length], **data)
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    try:
+        if args.input == '-':
+            total = convert_trace(sys.stdin, args.output)
+        else:
+            with open(args.input) as source:
+                total = convert_trace(source, args.output)
+    except ParseError as error:
+        sys.exit("Parse error - {}".format(error))
+    print("Wrote {} instructions to {}".format(total, args.output))
@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+from helpers import hazard_table
+from helpers import opcode_ids
+from helpers import RAW, WAR, WAW
+from store import InstructionStore
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Every HazardRule of the table, numbered - rule ids index into this list
+all_rules = []
+for _prev_rules in hazard_table:
+    for _rules in _prev_rules:
+        for _rule in _rules:
+            if _rule not in all_rules:
+                all_rules.append(_rule)
+
+
+# Define a data class around the hazards of a whole trace
+@dataclass
+class TraceHazards:
+    # rule id (index into all_rules) against the instruction at num - 1 / num - 2, -1 if none
+    rule_1: "np.ndarray"
+    rule_2: "np.ndarray"
+    # stall stages per instruction without / with forwarding unit
+    stalls_off: "np.ndarray"
+    stalls_on: "np.ndarray"
+
+    def kinds(self, distance: int) -> "np.ndarray":
+        """
+        Hazard kind (RAW/WAR/WAW, 0 if none) per instruction against the instruction at num - distance
+        :param distance: 1 or 2
+        :return: np.ndarray
+        """
+        rule = self.rule_1 if distance == 1 else self.rule_2
+        rule_kinds = np.array([0] + [item.kind for item in all_rules], dtype=np.int8)
+        return rule_kinds[rule + 1]
+
+    def counts(self) -> dict:
+        """
+        Number of hazards per kind over both distances
+        :return: dict e.g. {"RAW": 3, "WAR": 0, "WAW": 1}
+        """
+        kinds = np.concatenate([self.kinds(1), self.kinds(2)])
+        return {"RAW": int(np.count_nonzero(kinds == RAW)),
+                "WAR": int(np.count_nonzero(kinds == WAR)),
+                "WAW": int(np.count_nonzero(kinds == WAW))}
+
+
+def rule_arrays() -> tuple:
+    """
+    hazard_table flattened into arrays indexed by (previous opcode * number of opcodes + current opcode, position)
+    :return: (valid, current role, previous role, rule id) arrays
+    """
+    pairs = len(opcode_ids) * len(opcode_ids)
+    depth = max(len(rules) for prev_rules in hazard_table for rules in prev_rules)
+    valid = np.zeros((pairs, depth), dtype=bool)
+    cur_role = np.zeros((pairs, depth), dtype=np.intp)
+    prev_role = np.zeros((pairs, depth), dtype=np.intp)
+    rule_id = np.full((pairs, depth), -1, dtype=np.int8)
+    for prev_op, prev_rules in enumerate(hazard_table):
+        for cur_op, rules in enumerate(prev_rules):
+            pair = prev_op * len(opcode_ids) + cur_op
+            for position, rule in enumerate(rules):
+                valid[pair, position] = True
+                cur_role[pair, position] = rule.cur_role
+                prev_role[pair, position] = rule.prev_role
+                rule_id[pair, position] = all_rules.index(rule)
+    return valid, cur_role, prev_role, rule_id
+
+
+def detect_distance(columns: "np.ndarray", distance: int, tables: tuple) -> "np.ndarray":
+    """
+    Classify every instruction against the instruction `distance` positions before it
+    :param columns: (n, 4) array of encoded instructions - (opcode, rd, rs, rt)
+    :param distance: 1 or 2
+    :param tables: rule_arrays()
+    :return: rule id per instruction, -1 if none
+    """
+    valid, cur_role, prev_role, rule_id = tables
+    n = len(columns)
+    found = np.full(n, -1, dtype=np.int8)
+    if n <= distance:
+        return found
+    current = columns[distance:]
+    previous = columns[:-distance]
+    rows = np.arange(n - distance)
+    pair = previous[:, 0].astype(np.intp) * len(opcode_ids) + current[:, 0]
+    pending = np.ones(n - distance, dtype=bool)
+    tail = found[distance:]
+    # first match wins - walk the rule positions in order, only filling instructions not matched yet
+    for position in range(valid.shape[1]):
+        match = (pending & valid[pair, position] &
+                 (current[rows, cur_role[pair, position]] == previous[rows, prev_role[pair, position]]))
+        tail[match] = rule_id[pair, position][match]
+        pending &= ~match
+    return found
+
+
+def detect_all(trace: InstructionStore) -> TraceHazards:
+    """
+    Find the RAW/WAR/WAW hazards at distance 1 and 2 of a whole trace with vectorized array comparisons -
+    same classification as detect_hazards_no_fwd and same stall counts as pipeline_modifier. Stalls of the
+    extended instruction set come from pipeline stages (HazardEngine.staged_stalls) and are not counted here.
+    :param trace: InstructionStore
+    :return: TraceHazards
+    """
+    if np is None:
+        raise ImportError("detect_all requires numpy - pip install numpy")
+    columns = np.empty((len(trace), 4), dtype=np.int16)
+    columns[:, 0] = np.frombuffer(trace.opcode, dtype=np.int8)
+    columns[:, 1] = np.frombuffer(trace.rd, dtype=np.int16)
+    columns[:, 2] = np.frombuffer(trace.rs, dtype=np.int16)
+    columns[:, 3] = np.frombuffer(trace.rt, dtype=np.int16)
+    tables = rule_arrays()
+    rule_1 = detect_distance(columns=columns, distance=1, tables=tables)
+    rule_2 = detect_distance(columns=columns, distance=2, tables=tables)
+    stalls = []
+    derived = np.array([False] + [item.derived for item in all_rules], dtype=bool)
+    for fwd in (0, 1):
+        stall_1 = np.array([0] + [item.stalls[fwd][0] for item in all_rules], dtype=np.int8)
+        stall_2 = np.array([0] + [item.stalls[fwd][1] for item in all_rules], dtype=np.int8)
+        # the hazard against num - 2 takes precedence - see pipeline_modifier - unless derived, see rule_stalls
+        stalls.append(np.where((rule_2 >= 0) & ~derived[rule_2 + 1], stall_2[rule_2 + 1], stall_1[rule_1 + 1]))
+    return TraceHazards(rule_1=rule_1, rule_2=rule_2, stalls_off=stalls[0], stalls_on=stalls[1])